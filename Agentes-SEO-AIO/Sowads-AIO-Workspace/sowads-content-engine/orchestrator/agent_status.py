@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
 import json
+import os
 import subprocess
-from collections import Counter
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from log_store import get_store
 
 
 PHASE_TO_AGENT = {
@@ -22,6 +26,11 @@ PHASE_TO_AGENT = {
 
 AGENT_ORDER = ["orchestrator", "agent01", "agent02", "agent03", "agent04", "agent05", "agent06"]
 
+SNAPSHOT_NAME = "agent_status_snapshot.json"
+SNAPSHOT_VERSION = 1
+# Bytes right before the saved offset; if they changed, the log was rewritten in place.
+FINGERPRINT_BYTES = 4096
+
 
 @dataclass
 class AgentView:
@@ -35,27 +44,7 @@ class AgentView:
     last_id: str
 
 
-def _safe_json_lines(path: Path) -> List[dict]:
-    if not path.exists():
-        return []
-    rows = []
-    for line in path.read_text(encoding="utf-8").splitlines():
-        try:
-            rows.append(json.loads(line))
-        except Exception:
-            continue
-    return rows
-
-
-def _latest_batch_id(log_rows: List[dict]) -> str:
-    latest = None
-    for r in log_rows:
-        if r.get("phase") == "pipeline" and r.get("status") == "start":
-            latest = r
-    return (latest or {}).get("batch_id", "")
-
-
-def _running_pipeline_processes() -> List[dict]:
+def running_pipeline_processes() -> List[dict]:
     cmd = ["ps", "-eo", "pid,etimes,args"]
     proc = subprocess.run(cmd, capture_output=True, text=True)
     if proc.returncode != 0:
@@ -85,61 +74,246 @@ def _to_iso_now() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
-def build_status(base: Path, batch_id: str = "") -> dict:
-    logs_file = base / "data/logs/logs.jsonl"
-    logs = _safe_json_lines(logs_file)
-    if not batch_id:
-        batch_id = _latest_batch_id(logs)
-
-    scoped = [r for r in logs if r.get("batch_id") == batch_id] if batch_id else []
-    by_agent: Dict[str, List[dict]] = {a: [] for a in AGENT_ORDER}
-    for row in scoped:
-        ph = row.get("phase", "")
-        agent = PHASE_TO_AGENT.get(ph)
+def _empty_agent() -> dict:
+    return {
+        "phases": [],
+        "event_count": 0,
+        "status_counter": {},
+        "last_timestamp": "",
+        "last_phase": "",
+        "last_status": "",
+        "last_id": "",
+    }
+
+
+def _segment_key(seg: dict) -> str:
+    # A segment keeps its name when compressed; only `.gz` is added.
+    name = str(seg.get("file", ""))
+    return name[:-3] if name.endswith(".gz") else name
+
+
+class LogAggregator:
+    """Per-batch/per-agent counters over logs.jsonl, updated by tailing only the new bytes.
+
+    Remembers the file offset and inode. When the log store rotates the active file, the
+    rest of the old file is read from its segment; a truncated or rewritten log is
+    re-read from the start (segments first). The counters are saved to a small snapshot
+    next to the log so a fresh process picks up where the last one stopped instead of
+    re-parsing everything.
+    """
+
+    def __init__(self, logs_file: Path, snapshot_file: Optional[Path] = None):
+        self.logs_file = logs_file
+        self.snapshot_file = snapshot_file if snapshot_file is not None else logs_file.parent / SNAPSHOT_NAME
+        self.store = get_store(logs_file)
+        self._lock = threading.Lock()
+        self._reset(None)
+        # False until every closed segment has been read (by a rebuild or through the snapshot).
+        self.synced = False
+        self._load_snapshot()
+
+    def _reset(self, inode: Optional[int]) -> None:
+        self.inode = inode
+        self.offset = 0
+        self.mtime_ns = 0
+        self.fingerprint = ""
+        self.last_segment = ""
+        self.latest_batch_id = ""
+        self.batches: Dict[str, dict] = {}
+
+    def _start(self, inode: Optional[int]) -> None:
+        self.inode, self.offset, self.fingerprint, self.mtime_ns = inode, 0, "", 0
+
+    def _fingerprint(self, f, offset: int) -> str:
+        start = max(0, offset - FINGERPRINT_BYTES)
+        f.seek(start)
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+    def _load_snapshot(self) -> None:
+        try:
+            snap = json.loads(self.snapshot_file.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if snap.get("version") != SNAPSHOT_VERSION:
+            return
+        inode = snap.get("inode")
+        offset = int(snap.get("offset", 0))
+        try:
+            st = self.logs_file.stat()
+        except FileNotFoundError:
+            st = None
+        if st is not None and inode == st.st_ino:
+            if offset > st.st_size:
+                return
+            with self.logs_file.open("rb") as f:
+                if self._fingerprint(f, offset) != snap.get("fingerprint"):
+                    return
+        elif inode is not None and self.store.find_segment(inode) is None:
+            # Rotated since the snapshot, but the segment is gone: rebuild.
+            return
+        self.inode = inode
+        self.offset = offset
+        self.fingerprint = str(snap.get("fingerprint", ""))
+        self.last_segment = str(snap.get("last_segment", ""))
+        self.latest_batch_id = str(snap.get("latest_batch_id", ""))
+        self.batches = snap.get("batches", {})
+        self.synced = True
+
+    def _save_snapshot(self) -> None:
+        snap = {
+            "version": SNAPSHOT_VERSION,
+            "inode": self.inode,
+            "offset": self.offset,
+            "fingerprint": self.fingerprint,
+            "last_segment": self.last_segment,
+            "latest_batch_id": self.latest_batch_id,
+            "batches": self.batches,
+        }
+        tmp = self.snapshot_file.with_name(self.snapshot_file.name + f".{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(snap, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.snapshot_file)
+        except OSError:
+            # Read-only base: keep working from memory.
+            tmp.unlink(missing_ok=True)
+
+    def _apply(self, row: dict) -> None:
+        batch_id = row.get("batch_id")
+        phase = str(row.get("phase", ""))
+        if phase == "pipeline" and row.get("status") == "start":
+            self.latest_batch_id = str(batch_id or "")
+        if not batch_id:
+            return
+        batch = self.batches.setdefault(str(batch_id), {"phase_counts": {}, "total_events": 0, "agents": {}})
+        batch["total_events"] += 1
+        batch["phase_counts"][phase] = batch["phase_counts"].get(phase, 0) + 1
+        agent = PHASE_TO_AGENT.get(phase)
         if not agent:
-            continue
-        by_agent[agent].append(row)
-
-    agent_views: List[AgentView] = []
-    for agent in AGENT_ORDER:
-        rows = by_agent.get(agent, [])
-        if rows:
-            phase_set = sorted({str(r.get("phase", "")) for r in rows if r.get("phase")})
-            status_counter = Counter(str(r.get("status", "")) for r in rows)
-            last = rows[-1]
-            agent_views.append(
-                AgentView(
-                    agent=agent,
-                    phases=phase_set,
-                    event_count=len(rows),
-                    status_counter=dict(status_counter),
-                    last_timestamp=str(last.get("timestamp", "")),
-                    last_phase=str(last.get("phase", "")),
-                    last_status=str(last.get("status", "")),
-                    last_id=str(last.get("id", "")),
-                )
-            )
-        else:
-            agent_views.append(
-                AgentView(
-                    agent=agent,
-                    phases=[],
-                    event_count=0,
-                    status_counter={},
-                    last_timestamp="",
-                    last_phase="",
-                    last_status="",
-                    last_id="",
-                )
-            )
-
-    summary_counter = Counter(str(r.get("phase", "")) for r in scoped)
+            return
+        view = batch["agents"].setdefault(agent, _empty_agent())
+        if phase and phase not in view["phases"]:
+            view["phases"] = sorted(view["phases"] + [phase])
+        status = str(row.get("status", ""))
+        view["event_count"] += 1
+        view["status_counter"][status] = view["status_counter"].get(status, 0) + 1
+        view["last_timestamp"] = str(row.get("timestamp", ""))
+        view["last_phase"] = phase
+        view["last_status"] = status
+        view["last_id"] = str(row.get("id", ""))
+
+    def _apply_chunk(self, chunk: bytes) -> None:
+        for line in chunk.decode("utf-8", errors="replace").splitlines():
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(row, dict):
+                self._apply(row)
+
+    def _replay(self, segments: List[dict]) -> None:
+        for seg in segments:
+            for chunk in self.store.segment_chunks(seg):
+                self._apply_chunk(chunk)
+            self.last_segment = _segment_key(seg)
+
+    def _rebuild(self) -> None:
+        self._reset(None)
+        self._replay(self.store.segments())
+        self.synced = True
+
+    def _catch_up(self) -> bool:
+        """Read what we had not seen of closed segments: the rest of the tailed file, then newer ones."""
+        segments = self.store.segments()
+        if self.inode is None:
+            self._replay([seg for seg in segments if _segment_key(seg) > self.last_segment])
+            return True
+        pos = None
+        for i, seg in enumerate(segments):
+            if seg.get("source_inode") == self.inode:
+                pos = i
+        if pos is None:
+            return False
+        start = max(0, self.offset - FINGERPRINT_BYTES)
+        data = b"".join(self.store.segment_chunks(segments[pos], start=start))
+        head = self.offset - start
+        if hashlib.sha1(data[:head]).hexdigest() != self.fingerprint:
+            return False
+        self._apply_chunk(data[head:])
+        self.last_segment = _segment_key(segments[pos])
+        self._replay(segments[pos + 1 :])
+        return True
+
+    def _follow(self, inode: Optional[int]) -> None:
+        """The active file changed: account for everything before it, then tail it from zero."""
+        if not self.synced or not self._catch_up():
+            self._rebuild()
+        self._start(inode)
+
+    def refresh(self) -> None:
+        with self._lock:
+            try:
+                st = self.logs_file.stat()
+            except FileNotFoundError:
+                st = None
+            if st is None:
+                if self.inode is not None or not self.synced:
+                    self._follow(None)
+                    self._save_snapshot()
+                return
+            if st.st_ino != self.inode:
+                self._follow(st.st_ino)
+            elif st.st_size < self.offset:
+                self._rebuild()
+                self._start(st.st_ino)
+            if st.st_size == self.offset and st.st_mtime_ns == self.mtime_ns:
+                return
+            self.mtime_ns = st.st_mtime_ns
+            with self.logs_file.open("rb") as f:
+                if self.offset and self._fingerprint(f, self.offset) != self.fingerprint:
+                    self._rebuild()
+                    self._start(st.st_ino)
+                    self.mtime_ns = st.st_mtime_ns
+                f.seek(self.offset)
+                chunk = f.read(st.st_size - self.offset)
+                # Only whole lines; a line still being written is picked up next time.
+                end = chunk.rfind(b"\n") + 1
+                if end:
+                    self._apply_chunk(chunk[:end])
+                    self.offset += end
+                    self.fingerprint = self._fingerprint(f, self.offset)
+            self._save_snapshot()
+
+    def batch_view(self, batch_id: str = "") -> Tuple[str, dict]:
+        self.refresh()
+        with self._lock:
+            batch_id = batch_id or self.latest_batch_id
+            batch = self.batches.get(batch_id) if batch_id else None
+            return batch_id, json.loads(json.dumps(batch)) if batch else {}
+
+
+_AGGREGATORS: Dict[Path, LogAggregator] = {}
+_AGGREGATORS_LOCK = threading.Lock()
+
+
+def get_aggregator(base: Path) -> LogAggregator:
+    logs_file = base / "data/logs/logs.jsonl"
+    with _AGGREGATORS_LOCK:
+        if logs_file not in _AGGREGATORS:
+            _AGGREGATORS[logs_file] = LogAggregator(logs_file)
+        return _AGGREGATORS[logs_file]
+
+
+def build_status(base: Path, batch_id: str = "", running_processes: Optional[List[dict]] = None) -> dict:
+    batch_id, batch = get_aggregator(base).batch_view(batch_id)
+    agents = batch.get("agents", {})
+    agent_views = [AgentView(agent=agent, **agents.get(agent, _empty_agent())) for agent in AGENT_ORDER]
+
     result = {
         "generated_at": _to_iso_now(),
         "batch_id": batch_id,
-        "phase_counts": dict(summary_counter),
-        "total_events": len(scoped),
-        "running_processes": _running_pipeline_processes(),
+        "phase_counts": batch.get("phase_counts", {}),
+        "total_events": batch.get("total_events", 0),
+        "running_processes": running_pipeline_processes() if running_processes is None else running_processes,
         "agents": [a.__dict__ for a in agent_views],
     }
     return result
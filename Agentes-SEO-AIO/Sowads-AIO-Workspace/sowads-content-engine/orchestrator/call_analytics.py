@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from log_store import get_store
+
+
+CALL_LOGS = ["gemini_calls", "replicate_calls"]
+GROUP_DIMENSIONS = ["phase", "agent", "model", "batch_id"]
+QUANTILES = (0.5, 0.9, 0.99)
+# Relative error of the quantile sketch (1%).
+SKETCH_ACCURACY = 0.01
+# Failed calls waiting for their retry; the oldest are dropped past this many.
+PENDING_FAILURES_MAX = 10000
+NOT_APPROVED_STATUSES = {"blocked", "failed", ""}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class QuantileSketch:
+    """Log-bucketed histogram: quantiles within SKETCH_ACCURACY relative error.
+
+    Memory depends on the value range, not on the number of samples (latencies from
+    1ms to 1h fit in ~800 buckets).
+    """
+
+    def __init__(self, accuracy: float = SKETCH_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = int(math.ceil(math.log(value) / self.log_gamma))
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma**key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.latency_ms_total = 0
+        self.latency = QuantileSketch()
+        self.tokens = QuantileSketch()
+
+    def add(self, latency_ms: int, prompt_tokens: int, output_tokens: int, cost: float, success: bool, retry: bool) -> None:
+        self.calls += 1
+        self.errors += 0 if success else 1
+        self.retries += 1 if retry else 0
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost
+        self.latency_ms_total += latency_ms
+        self.latency.add(latency_ms)
+        self.tokens.add(prompt_tokens + output_tokens)
+
+    def to_dict(self) -> dict:
+        out = {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "latency_s_total": round(self.latency_ms_total / 1000.0, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+        for q in QUANTILES:
+            lat = self.latency.quantile(q)
+            tok = self.tokens.quantile(q)
+            out[f"latency_ms_p{int(q * 100)}"] = int(round(lat)) if lat is not None else None
+            out[f"tokens_p{int(q * 100)}"] = int(round(tok)) if tok is not None else None
+        return out
+
+
+class HourStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.latency_ms_total = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "latency_s_total": round(self.latency_ms_total / 1000.0, 1),
+        }
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _tokens(row: dict) -> Tuple[int, int]:
+    usage = row.get("usage_metadata") or {}
+    cost = row.get("cost_estimate") or {}
+    prompt = usage.get("promptTokenCount", cost.get("prompt_tokens"))
+    output = usage.get("candidatesTokenCount", cost.get("output_tokens"))
+    return _int(prompt), _int(output)
+
+
+def _call_key(row: dict) -> tuple:
+    request = row.get("request") or {}
+    return (
+        row.get("provider", ""),
+        row.get("batch_id", ""),
+        row.get("id", ""),
+        row.get("phase", ""),
+        row.get("version", 0),
+        request.get("prompt_sha256", "") if isinstance(request, dict) else "",
+    )
+
+
+class CallAnalytics:
+    """Single pass over the call logs with bounded state.
+
+    A call counts as a retry when the previous call with the same batch/item/phase/version
+    and prompt failed.
+    """
+
+    def __init__(self):
+        self.total = CallStats()
+        self.groups: Dict[str, Dict[str, CallStats]] = {dim: {} for dim in GROUP_DIMENSIONS}
+        self.hours: Dict[str, HourStats] = {}
+        self.batch_cost: Dict[str, float] = {}
+        self.approved: Dict[str, set] = {}
+        self.first_timestamp = ""
+        self.last_timestamp = ""
+        self._pending_failures: "OrderedDict[tuple, None]" = OrderedDict()
+
+    def add_call(self, row: dict) -> None:
+        latency_ms = _int(row.get("latency_ms"))
+        prompt_tokens, output_tokens = _tokens(row)
+        try:
+            cost = float((row.get("cost_estimate") or {}).get("estimated_cost_usd", 0.0) or 0.0)
+        except (TypeError, ValueError):
+            cost = 0.0
+        success = bool(row.get("success", True))
+
+        key = _call_key(row)
+        retry = key in self._pending_failures
+        if retry:
+            del self._pending_failures[key]
+        if not success:
+            self._pending_failures[key] = None
+            if len(self._pending_failures) > PENDING_FAILURES_MAX:
+                self._pending_failures.popitem(last=False)
+
+        args = (latency_ms, prompt_tokens, output_tokens, cost, success, retry)
+        self.total.add(*args)
+        for dim in GROUP_DIMENSIONS:
+            value = str(row.get(dim, "") or "(vazio)")
+            stats = self.groups[dim].get(value)
+            if stats is None:
+                stats = self.groups[dim][value] = CallStats()
+            stats.add(*args)
+
+        batch_id = str(row.get("batch_id", "") or "")
+        if batch_id:
+            self.batch_cost[batch_id] = self.batch_cost.get(batch_id, 0.0) + cost
+
+        ts = str(row.get("timestamp", "") or "")
+        if ts:
+            self.first_timestamp = min(self.first_timestamp or ts, ts)
+            self.last_timestamp = max(self.last_timestamp, ts)
+            hour = self.hours.get(ts[:13])
+            if hour is None:
+                hour = self.hours[ts[:13]] = HourStats()
+            hour.calls += 1
+            hour.errors += 0 if success else 1
+            hour.tokens += prompt_tokens + output_tokens
+            hour.cost_usd += cost
+            hour.latency_ms_total += latency_ms
+
+    def add_publication(self, row: dict) -> None:
+        batch_id = str(row.get("batch_id", "") or "")
+        status = str(row.get("status", "") or "").strip().lower()
+        if batch_id and status not in NOT_APPROVED_STATUSES:
+            self.approved.setdefault(batch_id, set()).add(str(row.get("id", "")))
+
+    def report(self, top: int = 0) -> dict:
+        groups = {}
+        for dim, by_value in self.groups.items():
+            if dim == "batch_id":
+                rows = sorted(by_value.items(), reverse=True)
+            else:
+                rows = sorted(by_value.items(), key=lambda kv: (kv[1].cost_usd, kv[1].latency_ms_total), reverse=True)
+            if top > 0:
+                rows = rows[:top]
+            groups[dim] = {value: stats.to_dict() for value, stats in rows}
+
+        approved_total = 0
+        approved_cost = 0.0
+        per_batch = {}
+        for batch_id, cost in sorted(self.batch_cost.items(), reverse=True):
+            approved = len(self.approved.get(batch_id, ()))
+            per_batch[batch_id] = {
+                "cost_usd": round(cost, 6),
+                "approved_articles": approved,
+                "cost_per_approved_usd": round(cost / approved, 6) if approved else None,
+            }
+            if approved:
+                approved_total += approved
+                approved_cost += cost
+        if top > 0:
+            per_batch = dict(list(per_batch.items())[:top])
+
+        return {
+            "generated_at": now_iso(),
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "total": self.total.to_dict(),
+            "groups": groups,
+            "cost_per_approved": {
+                "approved_articles": approved_total,
+                "cost_usd": round(approved_cost, 6),
+                "cost_per_approved_usd": round(approved_cost / approved_total, 6) if approved_total else None,
+                "batches": per_batch,
+            },
+            "hourly": {hour: stats.to_dict() for hour, stats in sorted(self.hours.items())},
+        }
+
+
+def _records(base: Path, log: str, batch_id: str, since: str) -> Iterator[dict]:
+    store = get_store(base / "data/logs" / f"{log}.jsonl")
+    for row in store.iter_records(batch_id=batch_id or None):
+        if since and str(row.get("timestamp", "") or "") < since:
+            continue
+        yield row
+
+
+def build_report(base: Path, logs=None, batch_id: str = "", since: str = "", top: int = 0) -> dict:
+    analytics = CallAnalytics()
+    for log in logs or CALL_LOGS:
+        for row in _records(base, log, batch_id, since):
+            analytics.add_call(row)
+    for row in _records(base, "publication_log", batch_id, since):
+        analytics.add_publication(row)
+    return analytics.report(top=top)
+
+
+def _fmt(value, width: int) -> str:
+    return f"{'-' if value is None else value:>{width}}"
+
+
+def _print_table(report: dict) -> None:
+    print(f"Generated at: {report['generated_at']}")
+    print(f"Período: {report['first_timestamp'] or '-'} → {report['last_timestamp'] or '-'}")
+    header = (
+        f"{'':<40} {'CALLS':>6} {'ERR':>5} {'RETRY':>5} {'P50_MS':>8} {'P90_MS':>8} {'P99_MS':>8} "
+        f"{'TIME_S':>9} {'TOK_P50':>8} {'TOKENS':>11} {'COST_USD':>11}"
+    )
+
+    def line(name: str, s: dict) -> None:
+        print(
+            f"{name[:40]:<40} {s['calls']:>6} {s['errors']:>5} {s['retries']:>5} "
+            f"{_fmt(s['latency_ms_p50'], 8)} {_fmt(s['latency_ms_p90'], 8)} {_fmt(s['latency_ms_p99'], 8)} "
+            f"{s['latency_s_total']:>9} {_fmt(s['tokens_p50'], 8)} {s['prompt_tokens'] + s['output_tokens']:>11} "
+            f"{s['cost_usd']:>11.4f}"
+        )
+
+    for dim, rows in report["groups"].items():
+        print("")
+        print(f"[{dim}]")
+        print(header)
+        print("-" * len(header))
+        for name, stats in rows.items():
+            line(name, stats)
+    print("-" * len(header))
+    line("TOTAL", report["total"])
+
+    cpa = report["cost_per_approved"]
+    print("")
+    print(f"Custo por artigo aprovado: {cpa['cost_per_approved_usd']} USD ({cpa['approved_articles']} artigos, {cpa['cost_usd']} USD)")
+    for batch_id, b in cpa["batches"].items():
+        print(f"  {batch_id:<48} approved={b['approved_articles']:<4} cost={b['cost_usd']:.4f} per_article={b['cost_per_approved_usd']}")
+
+    print("")
+    hour_header = f"{'HOUR (UTC)':<14} {'CALLS':>6} {'ERR':>5} {'TIME_S':>9} {'TOKENS':>11} {'COST_USD':>11}"
+    print(hour_header)
+    print("-" * len(hour_header))
+    for hour, h in report["hourly"].items():
+        print(f"{hour:<14} {h['calls']:>6} {h['errors']:>5} {h['latency_s_total']:>9} {h['tokens']:>11} {h['cost_usd']:>11.4f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latência, tokens, retries e custo das chamadas Gemini/Replicate")
+    parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]))
+    parser.add_argument("--log", choices=CALL_LOGS + ["all"], default="all")
+    parser.add_argument("--batch-id", default="")
+    parser.add_argument("--since", default="", help="Só chamadas a partir deste timestamp ISO (ex: 2026-03-01T00)")
+    parser.add_argument("--top", type=int, default=20, help="Linhas por agrupamento (0 = todas)")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = build_report(
+        Path(args.base).resolve(),
+        logs=CALL_LOGS if args.log == "all" else [args.log],
+        batch_id=args.batch_id.strip(),
+        since=args.since.strip(),
+        top=max(0, args.top),
+    )
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import http.client
+import io
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Tuple
+
+from ssh_session import SshSession
+
+
+class _Response:
+    """Body already read, so the connection can go back to the pool before the caller parses it."""
+
+    def __init__(self, status: int, headers: http.client.HTTPMessage, body: bytes):
+        self.status = status
+        self.headers = headers
+        self._body = io.BytesIO(body)
+
+    def read(self, *args) -> bytes:
+        return self._body.read(*args)
+
+    def __enter__(self) -> "_Response":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._body.close()
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections per host and SSH sessions per target, shared by every job.
+
+    HTTP: an idle connection is checked out per request and handed back once the body is
+    read, so concurrent jobs never share a socket mid-request. SSH: one `SshSession`
+    (ControlMaster) per host/port/user, reopened when its master has gone away.
+    """
+
+    def __init__(self, max_idle_per_host: int = 8):
+        self.max_idle_per_host = max(1, int(max_idle_per_host))
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._ssh: Dict[Tuple[str, int, str], SshSession] = {}
+        self._lock = threading.Lock()
+        self._ssh_lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    # -- HTTP -------------------------------------------------------------------
+
+    def acquire(self, scheme: str, netloc: str, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """(connection, reused) for this host; give it back with `release`."""
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                conn = idle.pop()
+                self.reused += 1
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self.opened += 1
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection, reuse: bool = True) -> None:
+        if reuse:
+            with self._lock:
+                idle = self._idle.setdefault((scheme, netloc), [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def urlopen(self, req: urllib.request.Request, timeout: float = 60):
+        """`urllib.request.urlopen` over pooled connections: same HTTPError/URLError contract."""
+        parts = urllib.parse.urlsplit(req.full_url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = dict(req.header_items())
+        while True:
+            conn, reused = self.acquire(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request(req.get_method(), path, body=req.data, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # The server may have dropped an idle keep-alive socket: retry once on a fresh one.
+                if reused and isinstance(e, (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine)):
+                    continue
+                raise urllib.error.URLError(e)
+            self.release(parts.scheme, parts.netloc, conn, reuse=not resp.will_close)
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(req.full_url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+            return _Response(resp.status, resp.headers, body)
+
+    # -- SSH --------------------------------------------------------------------
+
+    def ssh(self, host: str, port: int, user: str, password: str) -> SshSession:
+        """Shared session for this target; callers must not close it (`close` does)."""
+        key = (host, int(port), user)
+        with self._ssh_lock:
+            session = self._ssh.get(key)
+            if session is not None and session.enabled and not session.alive():
+                # ControlPersist expired between jobs (or the master died): start a new one.
+                session.close()
+                session = None
+            if session is None:
+                session = SshSession(host, int(port), user, password).open()
+                self._ssh[key] = session
+            return session
+
+    # -- lifecycle --------------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = sum(len(v) for v in self._idle.values())
+            hosts = len(self._idle)
+        with self._ssh_lock:
+            ssh = sum(1 for s in self._ssh.values() if s.multiplexed)
+        return {"http_opened": self.opened, "http_reused": self.reused, "http_idle": idle, "http_hosts": hosts, "ssh_sessions": ssh}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+        with self._ssh_lock:
+            sessions, self._ssh = self._ssh, {}
+        for session in sessions.values():
+            session.close()
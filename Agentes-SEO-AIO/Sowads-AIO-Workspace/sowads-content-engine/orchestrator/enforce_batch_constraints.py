@@ -7,6 +7,7 @@ import re
 from pathlib import Path
 
 from content_sanitizer import build_content_package, sanitize_article_html, split_content_package
+from profiling import add_profile_args, run_main
 
 
 def normalize_text(text: str) -> str:
@@ -253,6 +254,7 @@ def main() -> int:
     parser.add_argument("--density-max", type=float, default=2.0)
     parser.add_argument("--target-low", type=float, default=1.7)
     parser.add_argument("--target-high", type=float, default=1.85)
+    add_profile_args(parser)
     args = parser.parse_args()
 
     in_path = Path(args.input_csv)
@@ -317,4 +319,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(run_main(main, "enforce_batch_constraints"))
@@ -8,6 +8,7 @@ from pathlib import Path
 from typing import Dict, List, Tuple
 
 from content_sanitizer import build_content_package, split_content_package
+from profiling import add_profile_args, run_main
 
 
 BLOCK_ID = "sowads-readability-pack"
@@ -238,6 +239,7 @@ def main() -> int:
         "--report-json",
         default="Agentes-SEO-AIO/Sowads-AIO-Workspace/sowads-content-engine/outputs/reports/readability_enrichment_report.json",
     )
+    add_profile_args(parser)
     args = parser.parse_args()
 
     report = process_csv(Path(args.input_csv), Path(args.output_csv), inject=bool(args.inject))
@@ -250,4 +252,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(run_main(main, "enrich_readability_blocks"))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import io
+import math
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageFilter
+except ImportError:  # Pillow is optional: without it only header-level checks run.
+    Image = None
+    ImageFilter = None
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "y"}
+
+
+def read_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    # Header-only parsing for the formats the renderers return (png/jpeg/webp).
+    if len(data) >= 24 and data[:8] == b"\x89PNG\r\n\x1a\n":
+        w, h = struct.unpack(">II", data[16:24])
+        return int(w), int(h)
+
+    if len(data) >= 30 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            w = 1 + int.from_bytes(data[24:27], "little")
+            h = 1 + int.from_bytes(data[27:30], "little")
+            return w, h
+        if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+            w, h = struct.unpack("<HH", data[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L" and data[20:21] == b"\x2f":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+
+    if len(data) >= 4 and data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            seg_len = struct.unpack(">H", data[i + 2 : i + 4])[0]
+            # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC) carry the frame size.
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">HH", data[i + 5 : i + 9])
+                return int(w), int(h)
+            i += 2 + seg_len
+    return None
+
+
+def _histogram_entropy(hist: List[int]) -> float:
+    total = float(sum(hist))
+    if total <= 0:
+        return 0.0
+    ent = 0.0
+    for c in hist:
+        if c:
+            p = c / total
+            ent -= p * math.log2(p)
+    return ent
+
+
+class ImagePrescreen:
+    """Local, network-free screening that runs before the paid Gemini vision call."""
+
+    def __init__(self):
+        self.enabled = _env_bool("IMAGE_PRESCREEN_ENABLED", "true")
+        self.min_width = int(os.getenv("IMAGE_PRESCREEN_MIN_WIDTH", "640"))
+        self.min_height = int(os.getenv("IMAGE_PRESCREEN_MIN_HEIGHT", "360"))
+        # Gemini returns square frames by default and Replicate 16:9, so only extreme strips are rejected.
+        self.min_aspect = float(os.getenv("IMAGE_PRESCREEN_MIN_ASPECT", "0.75"))
+        self.max_aspect = float(os.getenv("IMAGE_PRESCREEN_MAX_ASPECT", "2.4"))
+        self.min_entropy = float(os.getenv("IMAGE_PRESCREEN_MIN_ENTROPY", "3.0"))
+        self.min_stddev = float(os.getenv("IMAGE_PRESCREEN_MIN_STDDEV", "6.0"))
+        # Compressed bytes per pixel: a near-blank frame compresses to almost nothing.
+        self.min_bytes_per_pixel = float(os.getenv("IMAGE_PRESCREEN_MIN_BYTES_PER_PIXEL", "0.01"))
+        self.max_text_band_ratio = float(os.getenv("IMAGE_PRESCREEN_MAX_TEXT_BAND_RATIO", "0.18"))
+        self.analysis_side = int(os.getenv("IMAGE_PRESCREEN_ANALYSIS_SIDE", "256"))
+
+    def _pixel_checks(self, data: bytes) -> Tuple[Dict[str, float], List[str]]:
+        metrics: Dict[str, float] = {}
+        issues: List[str] = []
+        with Image.open(io.BytesIO(data)) as im:
+            gray = im.convert("L")
+            gray.thumbnail((self.analysis_side, self.analysis_side))
+        hist = gray.histogram()
+        n = float(gray.width * gray.height) or 1.0
+        mean = sum(i * c for i, c in enumerate(hist)) / n
+        var = sum(((i - mean) ** 2) * c for i, c in enumerate(hist)) / n
+        entropy = _histogram_entropy(hist)
+        metrics["entropy"] = round(entropy, 3)
+        metrics["stddev"] = round(math.sqrt(var), 3)
+        if entropy < self.min_entropy or math.sqrt(var) < self.min_stddev:
+            issues.append("prescreen_low_information_frame")
+            return metrics, issues
+
+        # Text heuristic: rendered glyphs produce horizontal bands with dense, short, high-contrast
+        # strokes. Count bands where the edge density and the stroke (transition) rate are both high.
+        edges = gray.filter(ImageFilter.FIND_EDGES)
+        w, h = edges.size
+        px = edges.load()
+        band_h = max(4, h // 24)
+        text_like = 0
+        bands = 0
+        edge_total = 0
+        sample_total = 0.0
+        for y0 in range(0, h - band_h + 1, band_h):
+            bands += 1
+            strong = 0
+            transitions = 0
+            for y in range(y0, y0 + band_h, 2):
+                prev = False
+                for x in range(w):
+                    on = px[x, y] > 96
+                    if on:
+                        strong += 1
+                    if on != prev:
+                        transitions += 1
+                    prev = on
+            samples = float(((band_h + 1) // 2) * w) or 1.0
+            edge_total += strong
+            sample_total += samples
+            density = strong / samples
+            stroke_rate = transitions / samples
+            if density > 0.12 and stroke_rate > 0.18:
+                text_like += 1
+        metrics["edge_density"] = round(edge_total / (sample_total or 1.0), 4)
+        metrics["text_band_ratio"] = round(text_like / float(max(1, bands)), 4)
+        if metrics["text_band_ratio"] > self.max_text_band_ratio:
+            issues.append("prescreen_text_like_regions")
+        return metrics, issues
+
+    def check(self, data: bytes) -> dict:
+        verdict = {
+            "pass": True,
+            "issues": [],
+            "metrics": {},
+            "correction_prompt": "",
+        }
+        if not self.enabled:
+            return verdict
+
+        issues: List[str] = []
+        metrics: Dict[str, float] = {"bytes": len(data)}
+        size = read_image_size(data)
+        if not size and Image is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as im:
+                    size = im.size
+            except Exception:
+                size = None
+        if not size:
+            issues.append("prescreen_unreadable_image")
+        else:
+            w, h = size
+            metrics["width"] = w
+            metrics["height"] = h
+            if w < self.min_width or h < self.min_height:
+                issues.append("prescreen_low_resolution")
+            aspect = w / float(h or 1)
+            metrics["aspect"] = round(aspect, 3)
+            if aspect < self.min_aspect or aspect > self.max_aspect:
+                issues.append("prescreen_bad_aspect")
+            bpp = len(data) / float(max(1, w * h))
+            metrics["bytes_per_pixel"] = round(bpp, 5)
+            if bpp < self.min_bytes_per_pixel:
+                issues.append("prescreen_near_blank")
+
+        if not issues and Image is not None:
+            try:
+                px_metrics, px_issues = self._pixel_checks(data)
+                metrics.update(px_metrics)
+                issues.extend(px_issues)
+            except Exception:
+                # Pixel analysis is best-effort; the remote validator stays authoritative.
+                pass
+
+        verdict["metrics"] = metrics
+        if issues:
+            verdict["pass"] = False
+            verdict["issues"] = issues
+            if "prescreen_text_like_regions" in issues:
+                verdict["correction_prompt"] = "Remove every text-like element: no signage, captions, UI labels or documents."
+            elif "prescreen_low_information_frame" in issues or "prescreen_near_blank" in issues:
+                verdict["correction_prompt"] = "Render a fully detailed photorealistic business scene, not an empty or flat frame."
+            else:
+                verdict["correction_prompt"] = "Render a wide 16:9 photorealistic business scene at full resolution."
+        return verdict
+
+
+def downscale_for_validation(data: bytes, mime_type: str, max_side: int) -> Tuple[bytes, str]:
+    # The vision validator only needs enough pixels to judge text/context; sending a
+    # smaller JPEG cuts upload bandwidth and input tokens. Original bytes are kept on disk.
+    if Image is None or max_side <= 0:
+        return data, mime_type
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            if max(im.size) <= max_side:
+                return data, mime_type
+            small = im.convert("RGB")
+            small.thumbnail((max_side, max_side))
+            buf = io.BytesIO()
+            small.save(buf, format="JPEG", quality=85)
+            out = buf.getvalue()
+    except Exception:
+        return data, mime_type
+    if len(out) >= len(data):
+        return data, mime_type
+    return out, "image/jpeg"
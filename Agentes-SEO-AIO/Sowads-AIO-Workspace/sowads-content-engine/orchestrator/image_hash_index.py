@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it the index stays disabled.
+    Image = None
+
+
+IMAGE_EXTENSIONS = ("png", "jpg", "webp")
+
+
+def dhash64(data: bytes) -> Optional[int]:
+    # Difference hash over a 9x8 grayscale thumbnail: robust to re-encoding and resizing.
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            small = im.convert("L").resize((9, 8), Image.LANCZOS)
+    except Exception:
+        return None
+    px = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = px[row * 9 + col]
+            right = px[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    def __init__(self):
+        self.root: Optional[list] = None
+
+    def add(self, value: int, key: str) -> None:
+        # node layout: [hash, [keys], {distance: child}]
+        if self.root is None:
+            self.root = [value, [key], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                if key not in node[1]:
+                    node[1].append(key)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [key], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        out: List[Tuple[int, str]] = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance:
+                out.extend((d, k) for k in node[1])
+            lo, hi = d - max_distance, d + max_distance
+            for dist, child in node[2].items():
+                if lo <= dist <= hi:
+                    stack.append(child)
+        out.sort()
+        return out
+
+
+class PerceptualHashIndex:
+    """dHash index over outputs/generated-images/* used to block lookalike featured images."""
+
+    def __init__(self, base: Path):
+        self.base = base
+        self.images_root = base / "outputs/generated-images"
+        self.index_file = base / "data/cache/image_phash_index.json"
+        self.enabled = (
+            os.getenv("IMAGE_DEDUP_ENABLED", "true").strip().lower() in {"1", "true", "yes", "y"}
+            and Image is not None
+        )
+        self.max_distance = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+        self.entries: Dict[str, dict] = {}
+        self.tree = BKTree()
+        self._dirty = False
+        if self.enabled:
+            self._load()
+            self._sync_with_disk()
+
+    def _load(self) -> None:
+        if not self.index_file.exists():
+            return
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        for rel, entry in (data.get("entries") or {}).items():
+            try:
+                entry["hash_int"] = int(str(entry.get("hash", "")), 16)
+            except ValueError:
+                continue
+            self.entries[rel] = entry
+
+    def _sync_with_disk(self) -> None:
+        # Incremental: only files that are new or changed since the last run get hashed.
+        seen = set()
+        for ext in IMAGE_EXTENSIONS:
+            for p in self.images_root.glob(f"*/*.{ext}"):
+                rel = str(p.relative_to(self.images_root))
+                seen.add(rel)
+                st = p.stat()
+                cur = self.entries.get(rel)
+                if cur and cur.get("size") == st.st_size and cur.get("mtime") == int(st.st_mtime):
+                    continue
+                h = dhash64(p.read_bytes())
+                if h is None:
+                    continue
+                self.entries[rel] = self._entry(p, h)
+                self._dirty = True
+        for rel in list(self.entries.keys()):
+            if rel not in seen:
+                del self.entries[rel]
+                self._dirty = True
+        for rel, entry in self.entries.items():
+            self.tree.add(entry["hash_int"], rel)
+        self.save()
+
+    def _entry(self, path: Path, h: int) -> dict:
+        st = path.stat()
+        return {
+            "item_id": path.name.rsplit("_", 1)[0],
+            "batch_id": path.parent.name,
+            "hash": f"{h:016x}",
+            "hash_int": h,
+            "size": st.st_size,
+            "mtime": int(st.st_mtime),
+        }
+
+    def find_duplicates(self, data: bytes, exclude_item_id: str = "") -> List[dict]:
+        if not self.enabled:
+            return []
+        h = dhash64(data)
+        if h is None:
+            return []
+        out = []
+        seen = set()
+        for dist, rel in self.tree.search(h, self.max_distance):
+            entry = self.entries.get(rel)
+            if rel in seen or not entry or entry.get("item_id") == exclude_item_id:
+                continue
+            seen.add(rel)
+            # Tree nodes are append-only; re-check against the current hash of overwritten files.
+            dist = hamming(h, entry["hash_int"])
+            if dist > self.max_distance:
+                continue
+            out.append({"path": rel, "item_id": entry.get("item_id", ""), "distance": dist})
+        return out
+
+    def add(self, path: Path) -> None:
+        if not self.enabled or not path.exists():
+            return
+        h = dhash64(path.read_bytes())
+        if h is None:
+            return
+        rel = str(path.relative_to(self.images_root))
+        self.entries[rel] = self._entry(path, h)
+        self.tree.add(h, rel)
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self.enabled or not self._dirty:
+            return
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": 1,
+            "algorithm": "dhash64",
+            "entries": {k: {ek: ev for ek, ev in v.items() if ek != "hash_int"} for k, v in self.entries.items()},
+        }
+        tmp = self.index_file.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.index_file)
+        self._dirty = False
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import json
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent runs are not merged.
+    fcntl = None
+
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".webp"}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+@contextmanager
+def _locked(lock_file: Path):
+    if fcntl is None:
+        yield
+        return
+    with lock_file.open("a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ImageManifestIndex:
+    """Persistent item id -> {batch -> files/hash/status} map over outputs/generated-images.
+
+    Each batch directory is re-listed only when its mtime changed since the last
+    run, so lookups stay O(1) no matter how many batches accumulate. `save` merges this
+    run's changes into the file under a lock, so concurrent renders do not drop each
+    other's entries.
+    """
+
+    def __init__(self, base: Path):
+        self.images_root = base / "outputs/generated-images"
+        self.index_file = base / "data/cache/image_manifest_index.json"
+        self.items: Dict[str, Dict[str, dict]] = {}
+        self.batch_mtimes: Dict[str, int] = {}
+        self._dirty = False
+        # What this instance changed since the last save: whole batches it re-listed or
+        # dropped, and the entries it recorded.
+        self._scanned: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._recorded: Dict[Tuple[str, str], dict] = {}
+        self._load()
+        self._refresh()
+
+    def _read(self) -> Tuple[Dict[str, Dict[str, dict]], Dict[str, int]]:
+        if not self.index_file.exists():
+            return {}, {}
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except Exception:
+            return {}, {}
+        return data.get("items") or {}, {k: int(v) for k, v in (data.get("batch_mtimes") or {}).items()}
+
+    def _load(self) -> None:
+        self.items, self.batch_mtimes = self._read()
+
+    def _refresh(self) -> None:
+        if not self.images_root.exists():
+            return
+        seen = set()
+        for d in self.images_root.iterdir():
+            if not d.is_dir():
+                continue
+            seen.add(d.name)
+            if self.batch_mtimes.get(d.name) != d.stat().st_mtime_ns:
+                self._scan_batch(d)
+        for batch_id in list(self.batch_mtimes.keys()):
+            if batch_id not in seen:
+                self._drop_batch(batch_id)
+                del self.batch_mtimes[batch_id]
+                self._removed.add(batch_id)
+        self.save()
+
+    def _drop_batch(self, batch_id: str) -> Dict[str, dict]:
+        dropped = {}
+        for item_id in list(self.items.keys()):
+            entry = self.items[item_id].pop(batch_id, None)
+            if entry is not None:
+                dropped[item_id] = entry
+            if not self.items[item_id]:
+                del self.items[item_id]
+        self._dirty = True
+        return dropped
+
+    def _scan_batch(self, batch_dir: Path) -> None:
+        previous = self._drop_batch(batch_dir.name)
+        grouped: Dict[str, List[str]] = {}
+        for p in batch_dir.iterdir():
+            if not p.is_file() or p.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            stem_parts = p.stem.rsplit("_", 1)
+            if len(stem_parts) != 2 or not stem_parts[1].isdigit():
+                continue
+            grouped.setdefault(stem_parts[0], []).append(p.name)
+        for item_id, files in grouped.items():
+            files = sorted(files)
+            prev = previous.get(item_id) or {}
+            same = prev.get("files") == files
+            self.items.setdefault(item_id, {})[batch_dir.name] = {
+                "files": files,
+                "sha256": prev.get("sha256", "") if same else "",
+                "status": prev.get("status", "on_disk") if same else "on_disk",
+                "updated_at": prev.get("updated_at", "") if same else now_iso(),
+            }
+        self.batch_mtimes[batch_dir.name] = batch_dir.stat().st_mtime_ns
+        self._scanned.add(batch_dir.name)
+
+    def files_for(self, batch_id: str, item_id: str) -> List[str]:
+        entry = self.items.get(item_id, {}).get(batch_id)
+        if not entry:
+            return []
+        files = list(entry.get("files") or [])
+        if files and not (self.images_root / batch_id / files[0]).exists():
+            return []
+        return files
+
+    def find_primary(self, batch_id: str, item_id: str) -> Optional[Path]:
+        by_batch = self.items.get(item_id) or {}
+        order = ([batch_id] if batch_id in by_batch else []) + sorted(
+            (b for b in by_batch if b != batch_id), reverse=True
+        )
+        for b in order:
+            primary = [f for f in by_batch[b].get("files", []) if f.rsplit(".", 1)[0] == f"{item_id}_01"]
+            if primary:
+                path = self.images_root / b / primary[0]
+                if path.exists():
+                    return path
+        return None
+
+    def record(self, batch_id: str, item_id: str, files: List[str], sha256: str, status: str) -> None:
+        # batch_mtimes is left alone: other files of the batch may have changed too, so the
+        # next run re-lists it (entries with the same files keep this hash/status).
+        entry = {
+            "files": sorted(files),
+            "sha256": sha256,
+            "status": status,
+            "updated_at": now_iso(),
+        }
+        self.items.setdefault(item_id, {})[batch_id] = entry
+        self._recorded[(item_id, batch_id)] = entry
+        self._dirty = True
+
+    def _merge(self, items: Dict[str, Dict[str, dict]], mtimes: Dict[str, int]) -> None:
+        """Apply this instance's changes on top of the index another run may have saved meanwhile."""
+        for batch_id in self._removed:
+            for by_batch in items.values():
+                by_batch.pop(batch_id, None)
+            mtimes.pop(batch_id, None)
+        for batch_id in self._scanned:
+            for item_id in set(items) | set(self.items):
+                theirs = items.get(item_id, {}).get(batch_id)
+                ours = self.items.get(item_id, {}).get(batch_id)
+                if ours is None:
+                    # Not in our listing: keep it only if the other run wrote it afterwards.
+                    files = (theirs or {}).get("files") or []
+                    if theirs is not None and not (files and (self.images_root / batch_id / files[0]).exists()):
+                        del items[item_id][batch_id]
+                elif theirs is None or theirs.get("files") != ours["files"] or str(theirs.get("updated_at", "")) <= ours["updated_at"]:
+                    items.setdefault(item_id, {})[batch_id] = ours
+            if batch_id in self.batch_mtimes:
+                mtimes[batch_id] = self.batch_mtimes[batch_id]
+        for (item_id, batch_id), entry in self._recorded.items():
+            items.setdefault(item_id, {})[batch_id] = entry
+        self.items = {k: v for k, v in items.items() if v}
+        self.batch_mtimes = mtimes
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        with _locked(self.index_file.with_suffix(".json.lock")):
+            self._merge(*self._read())
+            payload = {"version": 1, "updated_at": now_iso(), "batch_mtimes": self.batch_mtimes, "items": self.items}
+            tmp = self.index_file.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.index_file)
+        self._scanned.clear()
+        self._removed.clear()
+        self._recorded.clear()
+        self._dirty = False
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+import argparse
+import atexit
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is only coordinated inside one process.
+    fcntl = None
+
+
+SEGMENTS_DIR_NAME = "segments"
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+# Uncompressed size of one gzip member; a batch lookup never decompresses more than it needs.
+BLOCK_BYTES = 1 << 20
+
+
+@contextmanager
+def _flock(path: Path, exclusive: bool, blocking: bool = True):
+    if fcntl is None:
+        yield True
+        return
+    with path.open("a") as f:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _block_member(data: bytes) -> bytes:
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return comp.compress(data) + comp.flush()
+
+
+class LogStore:
+    """Append-only JSONL log split into compressed segments with a batch/phase index.
+
+    The active file stays at `path`, so `tail -f` and the dashboard keep working. Once it
+    passes LOG_SEGMENT_MAX_MB or LOG_SEGMENT_MAX_HOURS it is moved to
+    `segments/<name>/` and gzip-compressed in ~1MB blocks (one gzip member each).
+    `index.json` there lists, per segment and per block, the batch_ids and phases inside,
+    so reading one batch only decompresses the blocks that contain it.
+
+    Appends are buffered and written in one `write()` per flush: by the shared flusher
+    thread every LOG_FLUSH_INTERVAL_MS, as soon as LOG_FLUSH_MAX_KB is pending, and at
+    exit. LOG_FSYNC=flush adds an fsync to every flush.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.seg_dir = path.parent / SEGMENTS_DIR_NAME / path.stem
+        self.index_file = self.seg_dir / INDEX_NAME
+        self.lock_file = self.seg_dir / ".lock"
+        self.compact_lock_file = self.seg_dir / ".compact.lock"
+        self.max_bytes = int(float(os.getenv("LOG_SEGMENT_MAX_MB", "64")) * 1024 * 1024)
+        self.max_age = float(os.getenv("LOG_SEGMENT_MAX_HOURS", "24")) * 3600
+        self.flush_interval = float(os.getenv("LOG_FLUSH_INTERVAL_MS", "200")) / 1000.0
+        self.flush_bytes = int(float(os.getenv("LOG_FLUSH_MAX_KB", "256")) * 1024)
+        self.fsync = os.getenv("LOG_FSYNC", "none").strip().lower() == "flush"
+        self._lock = threading.Lock()
+        self._opened_at: Dict[int, float] = {}
+        self._buf: List[bytes] = []
+        self._buf_bytes = 0
+
+    # -- index ------------------------------------------------------------------
+
+    def load_index(self) -> dict:
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                return data
+        except Exception:
+            pass
+        return {"version": INDEX_VERSION, "active": {}, "segments": []}
+
+    def _save_index(self, index: dict) -> None:
+        tmp = self.index_file.with_name(self.index_file.name + f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.index_file)
+
+    # -- writing ----------------------------------------------------------------
+
+    def append(self, obj: dict) -> None:
+        line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._buf.append(line)
+            self._buf_bytes += len(line)
+            if self.flush_interval <= 0 or self._buf_bytes >= self.flush_bytes:
+                self._flush_locked()
+                return
+        _FLUSHER.watch(self)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        data = b"".join(self._buf)
+        self._buf, self._buf_bytes = [], 0
+        self.seg_dir.mkdir(parents=True, exist_ok=True)
+        # Exclusive across processes: whole lines from one writer at a time, and never into a file being rotated.
+        with _flock(self.lock_file, exclusive=True):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+                if self.fsync:
+                    os.fsync(fd)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+        if self._due(st):
+            self.rotate(background=True)
+
+    def _due(self, st: os.stat_result) -> bool:
+        if st.st_size == 0:
+            return False
+        if self.max_bytes > 0 and st.st_size >= self.max_bytes:
+            return True
+        if self.max_age <= 0:
+            return False
+        opened_at = self._opened_at.get(st.st_ino)
+        if opened_at is None:
+            with _flock(self.lock_file, exclusive=True):
+                index = self.load_index()
+                active = index.get("active") or {}
+                if active.get("inode") != st.st_ino:
+                    active = {"inode": st.st_ino, "opened_at": time.time()}
+                    index["active"] = active
+                    self._save_index(index)
+            opened_at = float(active["opened_at"])
+            self._opened_at = {st.st_ino: opened_at}
+        return time.time() - opened_at >= self.max_age
+
+    def rotate(self, force: bool = False, background: bool = False) -> Optional[Path]:
+        """Move the active file into the segments dir and compress it; returns the raw segment path."""
+        raw = None
+        self.seg_dir.mkdir(parents=True, exist_ok=True)
+        with _flock(self.lock_file, exclusive=True):
+            try:
+                st = self.path.stat()
+            except FileNotFoundError:
+                st = None
+            # Re-checked under the lock: another process may have rotated it already.
+            if st is not None and st.st_size > 0 and (force or self._due_locked(st)):
+                stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+                seq = 1
+                # Names sort in rotation order; inodes are reused, so they cannot make names unique.
+                while True:
+                    raw = self.seg_dir / f"{self.path.stem}-{stamp}-{seq:04d}.jsonl"
+                    if not raw.exists() and not raw.with_name(raw.name + ".gz").exists():
+                        break
+                    seq += 1
+                os.rename(self.path, raw)
+        if background:
+            # Writers do not wait for gzip; a segment left raw by an exit is compressed next time.
+            threading.Thread(target=self.compact, daemon=True).start()
+        else:
+            self.compact()
+        return raw
+
+    def _due_locked(self, st: os.stat_result) -> bool:
+        if self.max_bytes > 0 and st.st_size >= self.max_bytes:
+            return True
+        active = self.load_index().get("active") or {}
+        if self.max_age <= 0 or active.get("inode") != st.st_ino:
+            return False
+        return time.time() - float(active.get("opened_at", time.time())) >= self.max_age
+
+    def compact(self) -> None:
+        """Compress every raw segment left in the segments dir (also picks up ones a crash left behind)."""
+        with _flock(self.compact_lock_file, exclusive=True, blocking=False) as acquired:
+            if not acquired:
+                return
+            for raw in sorted(self.seg_dir.glob("*.jsonl")):
+                entry = self._compress(raw)
+                with _flock(self.lock_file, exclusive=True):
+                    index = self.load_index()
+                    index["segments"] = [s for s in index["segments"] if s["file"] != entry["file"]] + [entry]
+                    self._save_index(index)
+                raw.unlink()
+
+    def _compress(self, raw: Path) -> dict:
+        gz = raw.with_name(raw.name + ".gz")
+        tmp = gz.with_name(gz.name + ".tmp")
+        st = raw.stat()
+        entry = {
+            "file": gz.name,
+            "source_inode": st.st_ino,
+            "raw_bytes": st.st_size,
+            "bytes": 0,
+            "records": 0,
+            "first_timestamp": "",
+            "last_timestamp": "",
+            "batches": {},
+            "blocks": [],
+        }
+        buf: List[bytes] = []
+        buf_len = 0
+        raw_offset = 0
+        block_batches: set = set()
+        block_phases: set = set()
+
+        def flush(out) -> None:
+            nonlocal buf, buf_len, raw_offset, block_batches, block_phases
+            if not buf:
+                return
+            member = _block_member(b"".join(buf))
+            entry["blocks"].append(
+                {
+                    "offset": out.tell(),
+                    "length": len(member),
+                    "raw_offset": raw_offset,
+                    "raw_length": buf_len,
+                    "batches": sorted(block_batches),
+                    "phases": sorted(block_phases),
+                }
+            )
+            out.write(member)
+            raw_offset += buf_len
+            buf, buf_len, block_batches, block_phases = [], 0, set(), set()
+
+        with raw.open("rb") as src, tmp.open("wb") as out:
+            for line in src:
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+                try:
+                    row = json.loads(line)
+                except Exception:
+                    row = None
+                if isinstance(row, dict):
+                    batch_id = str(row.get("batch_id", "") or "")
+                    phase = str(row.get("phase", "") or "")
+                    ts = str(row.get("timestamp", "") or "")
+                    entry["records"] += 1
+                    entry["first_timestamp"] = entry["first_timestamp"] or ts
+                    entry["last_timestamp"] = ts or entry["last_timestamp"]
+                    phases = entry["batches"].setdefault(batch_id, {})
+                    phases[phase] = phases.get(phase, 0) + 1
+                    block_batches.add(batch_id)
+                    block_phases.add(phase)
+                buf.append(line)
+                buf_len += len(line)
+                if buf_len >= BLOCK_BYTES:
+                    flush(out)
+            flush(out)
+            entry["bytes"] = out.tell()
+        os.replace(tmp, gz)
+        return entry
+
+    # -- reading ----------------------------------------------------------------
+
+    def segments(self) -> List[dict]:
+        """Closed segments, oldest first: compressed ones from the index plus raw ones still pending."""
+        # Raw files are listed before the index is read: a segment compressed in between
+        # then shows up in the index, never in neither.
+        pending = sorted(self.seg_dir.glob("*.jsonl")) if self.seg_dir.exists() else []
+        index = self.load_index()
+        indexed = {s["file"] for s in index["segments"]}
+        out = list(index["segments"])
+        for raw in pending:
+            if raw.name + ".gz" in indexed:
+                continue
+            try:
+                st = raw.stat()
+            except FileNotFoundError:
+                continue
+            out.append({"file": raw.name, "pending": True, "source_inode": st.st_ino, "raw_bytes": st.st_size})
+        return sorted(out, key=lambda s: s["file"])
+
+    def find_segment(self, inode: int) -> Optional[dict]:
+        """Closed segment that was the active file with this inode (the newest one, inodes get reused)."""
+        found = None
+        for seg in self.segments():
+            if seg.get("source_inode") == inode:
+                found = seg
+        return found
+
+    def segment_chunks(
+        self,
+        seg: dict,
+        start: int = 0,
+        batch_id: Optional[str] = None,
+        phase: Optional[str] = None,
+    ) -> Iterator[bytes]:
+        """Whole-line chunks of a segment from uncompressed offset `start`, skipping blocks without the batch/phase."""
+        if seg.get("pending"):
+            try:
+                with (self.seg_dir / seg["file"]).open("rb") as f:
+                    f.seek(start)
+                    while True:
+                        chunk = f.read(BLOCK_BYTES)
+                        if not chunk:
+                            return
+                        if not chunk.endswith(b"\n"):
+                            chunk += f.readline()
+                        yield chunk
+            except FileNotFoundError:
+                # Compressed while we were looking: read it from the index instead.
+                done = {s["file"]: s for s in self.load_index()["segments"]}
+                seg = done.get(seg["file"] + ".gz")
+                if seg is None:
+                    return
+        with (self.seg_dir / seg["file"]).open("rb") as f:
+            for block in seg["blocks"]:
+                if block["raw_offset"] + block["raw_length"] <= start:
+                    continue
+                if batch_id is not None and batch_id not in block["batches"]:
+                    continue
+                if phase is not None and phase not in block["phases"]:
+                    continue
+                f.seek(block["offset"])
+                data = zlib.decompress(f.read(block["length"]), 31)
+                skip = start - block["raw_offset"]
+                yield data[skip:] if skip > 0 else data
+
+    def iter_records(self, batch_id: Optional[str] = None, phase: Optional[str] = None) -> Iterator[dict]:
+        """Every record in write order (closed segments, then the active file), optionally filtered."""
+        self.flush()
+        chunks: List[Iterator[bytes]] = []
+        for seg in self.segments():
+            if batch_id is not None and not seg.get("pending") and batch_id not in seg["batches"]:
+                continue
+            chunks.append(self.segment_chunks(seg, batch_id=batch_id, phase=phase))
+        for source in chunks:
+            for chunk in source:
+                yield from self._parse(chunk, batch_id, phase)
+        if self.path.exists():
+            with self.path.open("rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        yield from self._parse(line, batch_id, phase)
+
+    @staticmethod
+    def _parse(chunk: bytes, batch_id: Optional[str], phase: Optional[str]) -> Iterator[dict]:
+        for line in chunk.decode("utf-8", errors="replace").splitlines():
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            if not isinstance(row, dict):
+                continue
+            if batch_id is not None and str(row.get("batch_id", "") or "") != batch_id:
+                continue
+            if phase is not None and str(row.get("phase", "") or "") != phase:
+                continue
+            yield row
+
+
+class _Flusher:
+    """One background thread flushing every store that has buffered lines."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._dirty: set = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, store: LogStore) -> None:
+        with self._cond:
+            if store in self._dirty:
+                return
+            self._dirty.add(store)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-flusher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                interval = min(s.flush_interval for s in self._dirty)
+            time.sleep(interval)
+            with self._cond:
+                stores, self._dirty = self._dirty, set()
+            for store in stores:
+                try:
+                    store.flush()
+                except Exception:
+                    # A failed write (e.g. full disk) drops that flush; the flusher keeps running.
+                    pass
+
+
+_FLUSHER = _Flusher()
+_STORES: Dict[Path, LogStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def flush_all() -> None:
+    with _STORES_LOCK:
+        stores = list(_STORES.values())
+    for store in stores:
+        store.flush()
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    # No flushing here: the handler may interrupt a thread holding a store lock. Unwinding
+    # releases it, and the atexit hook flushes on the way out.
+    raise SystemExit(128 + signum)
+
+
+def exit_on_sigterm() -> None:
+    """CLI entry points: turn SIGTERM into a normal exit so buffered log lines are written."""
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+
+atexit.register(flush_all)
+
+
+def get_store(path: Path) -> LogStore:
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = LogStore(path)
+        return _STORES[path]
+
+
+def append_log(path: Path, obj: dict) -> None:
+    get_store(path).append(obj)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Consulta/rotação dos logs segmentados em data/logs")
+    parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]))
+    parser.add_argument("--log", default="logs", help="logs | gemini_calls | replicate_calls | publication_log")
+    parser.add_argument("--batch-id", default="")
+    parser.add_argument("--phase", default="")
+    parser.add_argument("--rotate", action="store_true", help="Fecha e comprime o arquivo ativo agora")
+    parser.add_argument("--segments", action="store_true", help="Lista os segmentos e o índice por batch")
+    args = parser.parse_args()
+
+    store = get_store(Path(args.base).resolve() / "data/logs" / f"{args.log}.jsonl")
+    if args.rotate:
+        store.flush()
+        raw = store.rotate(force=True)
+        print(json.dumps({"rotated": raw.name if raw else ""}, ensure_ascii=False))
+        return
+    if args.segments:
+        for seg in store.segments():
+            seg = {k: v for k, v in seg.items() if k != "blocks"}
+            print(json.dumps(seg, ensure_ascii=False))
+        return
+    for row in store.iter_records(batch_id=args.batch_id or None, phase=args.phase or None):
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
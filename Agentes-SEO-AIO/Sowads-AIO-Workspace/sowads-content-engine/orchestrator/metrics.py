@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+import math
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(k, "") or "") for k in self.labels)
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._label_str(k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out: List[str] = []
+        for key, row in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                out.append(f"{self.name}_bucket{self._label_str(key, le)} {_fmt(cumulative)}")
+            out.append(f"{self.name}_sum{self._label_str(key)} {_fmt(row[-2])}")
+            out.append(f"{self.name}_count{self._label_str(key)} {_fmt(row[-1])}")
+        return out
+
+
+REGISTRY: List[_Metric] = []
+
+MODEL_CALLS = Counter(
+    "sowads_model_calls_total",
+    "Gemini/Replicate calls by HTTP status code (0 = network error) and outcome.",
+    ["provider", "model", "phase", "code", "outcome"],
+)
+MODEL_CALL_SECONDS = Histogram(
+    "sowads_model_call_duration_seconds",
+    "Model call latency.",
+    ["provider", "phase"],
+    buckets=[0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300],
+)
+MODEL_TOKENS = Counter("sowads_model_tokens_total", "Tokens reported by the API.", ["provider", "model", "phase", "kind"])
+MODEL_CALL_TOKENS = Histogram(
+    "sowads_model_call_tokens",
+    "Prompt + output tokens per call.",
+    ["provider", "phase"],
+    buckets=[500, 1000, 2000, 4000, 8000, 16000, 32000, 64000],
+)
+MODEL_COST_USD = Counter("sowads_model_cost_usd_total", "Estimated cost of model calls.", ["provider", "model", "phase"])
+MODEL_RETRIES = Counter("sowads_model_retries_total", "Model calls retried, by cause.", ["provider", "phase", "reason"])
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "sowads_rate_limit_wait_seconds",
+    "Time spent waiting on the shared Gemini budget, 429 retry-after and retry backoff.",
+    ["source"],
+    buckets=[0.1, 0.5, 1, 2, 5, 10, 30, 60],
+)
+ARTICLES = Counter("sowads_articles_total", "Articles through each stage (generated, audit, similarity, gate) by outcome.", ["stage", "outcome"])
+IMAGES = Counter("sowads_images_total", "Rendered featured images by final status.", ["provider", "outcome"])
+IMAGE_REJECTS = Counter("sowads_image_rejects_total", "Generated images rejected before saving.", ["provider", "reason"])
+PUBLISH = Counter("sowads_publish_total", "Publish outcomes per item.", ["backend", "outcome"])
+
+
+def retry_reason(message: str) -> str:
+    msg = message.lower()
+    if "http 429" in msg:
+        return "http_429"
+    if "http 5" in msg:
+        return "http_5xx"
+    if "timed out" in msg or "timeout" in msg:
+        return "timeout"
+    if "network error" in msg:
+        return "network"
+    return "other"
+
+
+def observe_call(record: dict) -> None:
+    """Count one call from the same record that goes to gemini_calls/replicate_calls.jsonl."""
+    provider = str(record.get("provider", "") or "")
+    model = str(record.get("model", "") or "")
+    phase = str(record.get("phase", "") or "")
+    success = bool(record.get("success", False))
+    MODEL_CALLS.inc(
+        provider=provider,
+        model=model,
+        phase=phase,
+        code=str(int(record.get("http_status_code", 0) or 0)),
+        outcome="ok" if success else "error",
+    )
+    MODEL_CALL_SECONDS.observe(float(record.get("latency_ms", 0) or 0) / 1000.0, provider=provider, phase=phase)
+
+    usage = record.get("usage_metadata") or {}
+    cost = record.get("cost_estimate") or {}
+    prompt_tokens = usage.get("promptTokenCount")
+    output_tokens = usage.get("candidatesTokenCount")
+    if prompt_tokens is None and not cost.get("estimated_by_heuristic", True):
+        prompt_tokens, output_tokens = cost.get("prompt_tokens"), cost.get("output_tokens")
+    if prompt_tokens is not None or output_tokens is not None:
+        prompt_tokens, output_tokens = int(prompt_tokens or 0), int(output_tokens or 0)
+        MODEL_TOKENS.inc(prompt_tokens, provider=provider, model=model, phase=phase, kind="prompt")
+        MODEL_TOKENS.inc(output_tokens, provider=provider, model=model, phase=phase, kind="output")
+        MODEL_CALL_TOKENS.observe(prompt_tokens + output_tokens, provider=provider, phase=phase)
+    est = float(cost.get("estimated_cost_usd", 0.0) or 0.0)
+    if est:
+        MODEL_COST_USD.inc(est, provider=provider, model=model, phase=phase)
+
+
+def observe_publish(backend: str, results: List[dict]) -> None:
+    for r in results:
+        outcome = "failed" if r.get("error") else str(r.get("action", "") or "ok")
+        PUBLISH.inc(backend=backend, outcome=outcome)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        return
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+
+
+def serve_from_env() -> Optional[ThreadingHTTPServer]:
+    """Standalone runs: expose /metrics on METRICS_PORT (off when unset) for the life of the process."""
+    global _SERVER
+    port = os.getenv("METRICS_PORT", "").strip()
+    if not port or _SERVER is not None:
+        return _SERVER
+    host = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+    try:
+        _SERVER = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError as e:
+        # Usually another run already holds the port: the job matters more than its metrics.
+        sys.stderr.write(f"[metrics] /metrics desligado: {host}:{port} indisponível ({e})\n")
+        return None
+    _SERVER.daemon_threads = True
+    threading.Thread(target=_SERVER.serve_forever, name="metrics-http", daemon=True).start()
+    return _SERVER
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import metrics
+from conn_pool import ConnectionPool
+from log_store import exit_on_sigterm
+from run_pipeline import Pipeline, RateBudget, batch_id_now, load_config, load_env_file, now_iso, write_json
+
+
+AGENTS = {"all", "agent01", "agent02", "agent03", "agent04", "agent05", "agent06"}
+
+
+class WarmState:
+    """State kept across daemon jobs instead of being rebuilt by every cold `run_pipeline.py`."""
+
+    def __init__(self, base: Path, rate_budget: RateBudget):
+        self.base = base
+        self.rate_budget = rate_budget
+        # Keep-alive HTTP(S) per host (Gemini, WP REST) and SSH ControlMaster sessions (WP-CLI).
+        self.connections = ConnectionPool(max_idle_per_host=int(os.getenv("PIPELINE_DAEMON_IDLE_CONNECTIONS", "8")))
+        self.features_cache: Dict[str, tuple] = {}
+        self.history_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._prompts: Tuple[str, str] = ("", "")
+        self._prompts_key: Optional[tuple] = None
+        self._history: List[dict] = []
+        self._history_offset = 0
+        self._history_inode: Optional[int] = None
+
+    def prompts(self) -> Tuple[str, str]:
+        paths = (self.base / "system/system.md", self.base / "system/user.md")
+        key = tuple(p.stat().st_mtime_ns for p in paths)
+        with self._lock:
+            if key != self._prompts_key:
+                self._prompts = (paths[0].read_text(encoding="utf-8"), paths[1].read_text(encoding="utf-8"))
+                self._prompts_key = key
+            return self._prompts
+
+    def history(self) -> List[dict]:
+        path = self.base / "data/history/history.jsonl"
+        with self._lock:
+            if not path.exists():
+                self._history, self._history_offset, self._history_inode = [], 0, None
+                return []
+            st = path.stat()
+            if st.st_ino != self._history_inode or st.st_size < self._history_offset:
+                # Replaced or truncated: start over.
+                self._history, self._history_offset, self._history_inode = [], 0, st.st_ino
+            if st.st_size > self._history_offset:
+                with path.open("rb") as f:
+                    f.seek(self._history_offset)
+                    chunk = f.read()
+                # Only whole lines; a line still being written is picked up next time.
+                end = chunk.rfind(b"\n") + 1
+                for line in chunk[:end].decode("utf-8", errors="replace").splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        self._history.append(json.loads(line))
+                    except Exception:
+                        continue
+                self._history_offset += end
+            return list(self._history)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prompts_loaded": self._prompts_key is not None,
+                "history_entries": len(self._history),
+                "history_offset": self._history_offset,
+                "similarity_features_cached": len(self.features_cache),
+                "connections": self.connections.stats(),
+            }
+
+
+class JobRunner:
+    def __init__(self, base: Path, warm: WarmState, max_jobs: int):
+        self.base = base
+        self.warm = warm
+        self.jobs_dir = base / "data/daemon/jobs"
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_jobs))
+        self.jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._batch_ids = set()
+        self._seq = 0
+
+    def _build_cfg(self, spec: dict) -> dict:
+        if isinstance(spec.get("cfg"), dict):
+            cfg = dict(spec["cfg"])
+        elif spec.get("config"):
+            cfg_path = Path(str(spec["config"]))
+            if not cfg_path.is_absolute():
+                cfg_path = self.base / cfg_path
+            if not cfg_path.exists():
+                raise ValueError(f"config não encontrado: {cfg_path}")
+            cfg = load_config(cfg_path)
+        else:
+            raise ValueError("informe `config` (caminho) ou `cfg` (objeto)")
+        if spec.get("test_mode"):
+            cfg["test_mode"] = True
+        if spec.get("quantity") is not None:
+            cfg["quantidade_temas"] = int(spec["quantity"])
+        if spec.get("scheduler"):
+            cfg["scheduler"] = str(spec["scheduler"])
+        if spec.get("trace"):
+            cfg["trace"] = True
+        return cfg
+
+    def submit(self, spec: dict) -> dict:
+        agent = str(spec.get("agent") or "all")
+        if agent not in AGENTS:
+            raise ValueError(f"Agente inválido: {agent}")
+        cfg = self._build_cfg(spec)
+        needs_gemini = agent in {"all", "agent01", "agent02"}
+        if needs_gemini and not cfg.get("test_mode", False) and not os.getenv("GEMINI_API_KEY", ""):
+            raise ValueError("GEMINI_API_KEY not configured in environment/.env")
+
+        with self._lock:
+            self._seq += 1
+            job_id = "JOB-" + time.strftime("%Y%m%d-%H%M%S", time.gmtime()) + f"-{self._seq:04d}"
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "agent": agent,
+                "config": spec.get("config", ""),
+                "batch_id": cfg.get("batch_id", ""),
+                "submitted_at": now_iso(),
+                "started_at": "",
+                "finished_at": "",
+                "result": None,
+                "error": "",
+            }
+            self.jobs[job_id] = job
+        self.pool.submit(self._run, job, cfg, spec)
+        return dict(job)
+
+    def _reserve_batch_id(self, cfg: dict) -> str:
+        # Two jobs started in the same second would get the same time-based batch id.
+        with self._lock:
+            if cfg.get("batch_id"):
+                self._batch_ids.add(cfg["batch_id"])
+                return cfg["batch_id"]
+            topic = str(cfg.get("batch_topic", "") or "").strip()
+            while True:
+                batch_id = batch_id_now(topic)
+                if batch_id not in self._batch_ids and not (self.base / "data/batches" / batch_id).exists():
+                    self._batch_ids.add(batch_id)
+                    return batch_id
+                time.sleep(1.0)
+
+    def _run(self, job: dict, cfg: dict, spec: dict) -> None:
+        job["status"] = "running"
+        job["started_at"] = now_iso()
+        try:
+            cfg["batch_id"] = self._reserve_batch_id(cfg)
+            job["batch_id"] = cfg["batch_id"]
+            p = Pipeline(self.base, cfg, warm=self.warm)
+            if job["agent"] == "all":
+                result = p.run()
+            else:
+                result = p.run_single_agent(
+                    agent_name=job["agent"],
+                    themes_file=str(spec.get("themes_file", "")),
+                    articles_file=str(spec.get("articles_file", "")),
+                    audit_file=str(spec.get("audit_file", "")),
+                    similarity_file=str(spec.get("similarity_file", "")),
+                    async_output=bool(spec.get("async_output", False)),
+                    job_id=str(spec.get("job_id", "")),
+                )
+            job["result"] = result
+            job["status"] = "done"
+        except (Exception, SystemExit) as e:
+            job["status"] = "failed"
+            job["error"] = str(e) or e.__class__.__name__
+            job["traceback"] = traceback.format_exc()
+        job["finished_at"] = now_iso()
+        write_json(self.jobs_dir / f"{job['job_id']}.json", job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [
+                {k: v for k, v in job.items() if k not in {"result", "traceback"}}
+                for job in self.jobs.values()
+            ]
+
+
+def make_handler(runner: JobRunner, warm: WarmState):
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self) -> str:
+            # Unix sockets have no (host, port) client address.
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send_json(self, code: int, payload) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):  # noqa: N802
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/metrics":
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path == "/health":
+                self._send_json(200, {"ok": True, "warm": warm.stats(), "jobs": len(runner.list())})
+                return
+            if path == "/jobs":
+                self._send_json(200, {"jobs": runner.list()})
+                return
+            if path.startswith("/jobs/"):
+                job = runner.get(path.split("/", 2)[2])
+                if job is None:
+                    self._send_json(404, {"error": "job not found"})
+                else:
+                    self._send_json(200, job)
+                return
+            self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):  # noqa: N802
+            if urlparse(self.path).path.rstrip("/") != "/jobs":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", "0") or 0)
+                spec = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                if not isinstance(spec, dict):
+                    raise ValueError("body must be a JSON object")
+                job = runner.submit(spec)
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(202, job)
+
+    return Handler
+
+
+class UnixThreadingHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Long-running SOWADS pipeline service (jobs via local HTTP API)")
+    parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]), help="Project root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--socket", default="", help="Escutar em Unix socket (ex: /tmp/sowads-pipeline.sock) em vez de TCP")
+    parser.add_argument("--max-jobs", type=int, default=int(os.getenv("PIPELINE_DAEMON_JOBS", "2")), help="Jobs simultâneos")
+    parser.add_argument(
+        "--gemini-concurrency",
+        type=int,
+        default=int(os.getenv("PIPELINE_DAEMON_GEMINI_CONCURRENCY", "2")),
+        help="Chamadas Gemini simultâneas somando todos os jobs",
+    )
+    args = parser.parse_args()
+    exit_on_sigterm()
+
+    base = Path(args.base).resolve()
+    load_env_file(base / ".env")
+    load_env_file(base.parent / ".env")
+
+    budget = RateBudget(
+        min_interval=float(os.getenv("REQUEST_DELAY_SECONDS", "0.5")),
+        max_inflight=int(args.gemini_concurrency),
+    )
+    warm = WarmState(base, budget)
+    runner = JobRunner(base, warm, int(args.max_jobs))
+    handler = make_handler(runner, warm)
+
+    if args.socket:
+        sock_path = Path(args.socket)
+        if sock_path.exists():
+            sock_path.unlink()
+        server = UnixThreadingHTTPServer(str(sock_path), handler)
+        print(f"Pipeline daemon listening on unix:{sock_path}")
+    else:
+        server = ThreadingHTTPServer((args.host, int(args.port)), handler)
+        print(f"Pipeline daemon listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        runner.pool.shutdown(wait=True)
+        warm.connections.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ from pathlib import Path
 from typing import Dict, List, Tuple
 
 from content_sanitizer import build_content_package, sanitize_article_html, split_content_package
+from profiling import add_profile_args, run_main
 
 
 def now_iso() -> str:
@@ -236,6 +237,7 @@ def main() -> int:
     parser.add_argument("--input-csv", required=True)
     parser.add_argument("--output-csv", required=True)
     parser.add_argument("--report-json", required=True)
+    add_profile_args(parser)
     args = parser.parse_args()
 
     in_path = Path(args.input_csv)
@@ -262,4 +264,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(run_main(main, "postprocess_article_quality"))
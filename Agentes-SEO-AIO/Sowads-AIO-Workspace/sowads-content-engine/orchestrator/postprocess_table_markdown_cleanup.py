@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import List, Tuple
 
 from content_sanitizer import build_content_package, sanitize_meta_block, split_content_package
+from profiling import add_profile_args, run_main
 
 
 def now_iso() -> str:
@@ -176,6 +177,7 @@ def main() -> int:
     parser.add_argument("--th-max-words", type=int, default=7)
     parser.add_argument("--td-max-chars", type=int, default=88)
     parser.add_argument("--td-max-words", type=int, default=14)
+    add_profile_args(parser)
     args = parser.parse_args()
 
     process_csv(
@@ -191,4 +193,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(run_main(main, "postprocess_table_markdown_cleanup"))
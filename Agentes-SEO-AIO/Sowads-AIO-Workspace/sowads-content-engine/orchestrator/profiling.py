@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+import argparse
+import cProfile
+import io
+import json
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+PROFILERS = ["cprofile", "sample"]
+DEFAULT_TOP = 25
+DEFAULT_INTERVAL_MS = 5.0
+
+# Frames that mean "blocked on the network" (HTTP to Gemini/Replicate/WordPress, SSH to the WP host).
+NETWORK_FILES = {"socket.py", "ssl.py", "client.py", "request.py", "selectors.py", "subprocess.py", "ssh_session.py"}
+NETWORK_BUILTINS = re.compile(r"_socket\.socket|_ssl\._SSLSocket|select\.|_posixsubprocess|posix\.read|posix\.waitpid|getaddrinfo")
+WAIT_FILES = {"threading.py", "queue.py"}
+IDLE_BUILTINS = re.compile(r"time\.sleep|lock' objects|_thread\.lock|acquire")
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        default="",
+        choices=PROFILERS,
+        help="cprofile = deterministico (thread principal); sample = amostragem de todas as threads (separa CPU de espera)",
+    )
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP, help="Funções no resumo do profile")
+    parser.add_argument("--profile-interval-ms", type=float, default=DEFAULT_INTERVAL_MS, help="Intervalo do modo sample")
+    parser.add_argument("--profile-dir", default="", help="Onde gravar o profile (default: data/batches/{batch_id}/)")
+
+
+def _thread_cpu_clock(ident: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+class _Sampler:
+    """Samples every thread's stack; a sample counts as CPU when the thread's CPU clock moved."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.leaf: Counter = Counter()
+        self.states: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cpu: Dict[int, float] = {}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _state(self, ident: int, frames: List[str]) -> str:
+        running = None
+        clock = _thread_cpu_clock(ident)
+        if clock is not None:
+            try:
+                now = time.clock_gettime(clock)
+            except OSError:
+                now = None
+            prev = self._cpu.get(ident)
+            if now is not None:
+                self._cpu[ident] = now
+                if prev is not None:
+                    running = now - prev >= self.interval * 0.5
+        if running is None:
+            # No per-thread CPU clock (or first sample): guess from the innermost frame.
+            running = frames[-1].split(":", 1)[0] not in NETWORK_FILES | WAIT_FILES
+        if running:
+            return "cpu"
+        return "network" if any(f.split(":", 1)[0] in NETWORK_FILES for f in frames) else "idle"
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames: List[str] = []
+                f = frame
+                while f is not None:
+                    frames.append(f"{Path(f.f_code.co_filename).name}:{f.f_code.co_name}")
+                    f = f.f_back
+                frames.reverse()
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                state = self._state(ident, frames)
+                thread = names.get(ident, str(ident))
+                self.stacks[";".join([f"[{state}]", thread] + frames)] += 1
+                self.leaf[(frames[-1], state)] += 1
+                self.states[state] += 1
+                self.samples += 1
+
+
+class RunProfiler:
+    """Wraps one run in cProfile or the stack sampler and writes the result next to the batch.
+
+    Artifacts: `profile-<name>-<stamp>.pstats` (cprofile; snakeviz/pstats) or `.folded`
+    (sample; speedscope/flamegraph.pl), plus `.txt` (top-N) and `.json` (summary).
+    """
+
+    def __init__(self, mode: str = "", top: int = DEFAULT_TOP, interval_ms: float = DEFAULT_INTERVAL_MS):
+        self.mode = mode
+        self.top = max(1, int(top))
+        self.interval = max(0.001, float(interval_ms) / 1000.0)
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_Sampler] = None
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "RunProfiler":
+        return cls(args.profile, args.profile_top, args.profile_interval_ms)
+
+    def __enter__(self) -> "RunProfiler":
+        if not self.mode:
+            return self
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(self.interval)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.mode:
+            return
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.wall_s = time.perf_counter() - self._t0
+        self.cpu_s = time.process_time() - self._c0
+
+    # -- summaries --------------------------------------------------------------
+
+    def _cprofile_summary(self) -> Tuple[dict, List[dict]]:
+        stats = pstats.Stats(self._profile)
+        waits = {"network": 0.0, "idle": 0.0}
+        rows = []
+        for (filename, line, func), (cc, nc, tt, ct, _callers) in stats.stats.items():
+            label = func if filename == "~" else f"{Path(filename).name}:{line}:{func}"
+            if filename == "~" and NETWORK_BUILTINS.search(func):
+                waits["network"] += tt
+            elif filename == "~" and IDLE_BUILTINS.search(func):
+                waits["idle"] += tt
+            rows.append({"function": label, "calls": nc, "self_s": round(tt, 4), "cum_s": round(ct, 4)})
+        rows.sort(key=lambda r: r["self_s"], reverse=True)
+        breakdown = {
+            "network_wait_s": round(waits["network"], 3),
+            "idle_wait_s": round(waits["idle"], 3),
+            "scope": "main thread",
+        }
+        return breakdown, rows[: self.top]
+
+    def _sample_summary(self) -> Tuple[dict, List[dict]]:
+        s = self._sampler
+        by_func: Dict[str, Counter] = {}
+        for (func, state), n in s.leaf.items():
+            by_func.setdefault(func, Counter())[state] += n
+        rows = [
+            {
+                "function": func,
+                "samples": sum(c.values()),
+                "cpu_s": round(c["cpu"] * self.interval, 3),
+                "network_s": round(c["network"] * self.interval, 3),
+                "idle_s": round(c["idle"] * self.interval, 3),
+            }
+            for func, c in by_func.items()
+        ]
+        rows.sort(key=lambda r: (r["cpu_s"], r["samples"]), reverse=True)
+        breakdown = {
+            "samples": s.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "sampled_cpu_s": round(s.states["cpu"] * self.interval, 3),
+            "network_wait_s": round(s.states["network"] * self.interval, 3),
+            "idle_wait_s": round(s.states["idle"] * self.interval, 3),
+            "scope": "all threads (thread-seconds)",
+        }
+        return breakdown, rows[: self.top]
+
+    def summary(self) -> dict:
+        breakdown, top = self._cprofile_summary() if self._profile is not None else self._sample_summary()
+        return {
+            "mode": self.mode,
+            "wall_s": round(self.wall_s, 3),
+            "cpu_s": round(self.cpu_s, 3),
+            **breakdown,
+            "top": top,
+        }
+
+    def _format(self, name: str, summary: dict) -> str:
+        out = io.StringIO()
+        head = {k: v for k, v in summary.items() if k != "top"}
+        out.write(f"[profile] {name} " + " ".join(f"{k}={v}" for k, v in head.items()) + "\n")
+        if self.mode == "cprofile":
+            out.write(f"{'SELF_S':>9} {'CUM_S':>9} {'CALLS':>9}  FUNCTION\n")
+            for r in summary["top"]:
+                out.write(f"{r['self_s']:>9} {r['cum_s']:>9} {r['calls']:>9}  {r['function']}\n")
+        else:
+            out.write(f"{'CPU_S':>8} {'NET_S':>8} {'IDLE_S':>8} {'SAMPLES':>8}  FUNCTION\n")
+            for r in summary["top"]:
+                out.write(f"{r['cpu_s']:>8} {r['network_s']:>8} {r['idle_s']:>8} {r['samples']:>8}  {r['function']}\n")
+        return out.getvalue()
+
+    def report(self, out_dir: Path, name: str) -> Optional[Path]:
+        """Write the artifacts and print the top-N summary to stderr (stdout stays the script's output)."""
+        if not self.mode:
+            return None
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stem = out_dir / f"profile-{name}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}"
+        summary = self.summary()
+        text = self._format(name, summary)
+        if self._profile is not None:
+            self._profile.dump_stats(str(stem) + ".pstats")
+        else:
+            with open(str(stem) + ".folded", "w", encoding="utf-8") as f:
+                for stack, n in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+        Path(str(stem) + ".txt").write_text(text, encoding="utf-8")
+        Path(str(stem) + ".json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        sys.stderr.write(text + f"[profile] artefatos: {stem}.*\n")
+        return stem
+
+
+def profile_dir_for(base: Path, args: argparse.Namespace, *csv_paths: str) -> Path:
+    """--profile-dir, else the batch of the first CSV (inside data/batches/<id>/ or named <id>_*.csv), else data/profiles/."""
+    if args.profile_dir:
+        return Path(args.profile_dir)
+    for p in csv_paths:
+        if not p:
+            continue
+        path = Path(p).resolve()
+        if path.parent.parent.name == "batches":
+            return path.parent
+        m = re.match(r"(BATCH-.+?)_", path.name)
+        if m:
+            return base / "data/batches" / m.group(1)
+    return base / "data/profiles"
+
+
+def run_main(main: Callable[[], int], name: str) -> int:
+    """Post-processing scripts: run `main()` under --profile (parsed here too, so main's parser only lists it)."""
+    pre = argparse.ArgumentParser(add_help=False)
+    add_profile_args(pre)
+    pre.add_argument("--input-csv", default="")
+    args, _ = pre.parse_known_args()
+    if not args.profile:
+        return main()
+    profiler = RunProfiler.from_args(args)
+    with profiler:
+        rc = main()
+    profiler.report(profile_dir_for(Path(__file__).resolve().parents[1], args, args.input_csv), name)
+    return rc
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from log_store import SEGMENTS_DIR_NAME as LOG_SEGMENTS_DIR_NAME
+from log_store import append_log, get_store
+
+
+SEGMENTS_DIR_NAME = "prompt_segments"
+# Pieces shorter than this stay inline in the call record.
+INLINE_MAX_CHARS = 240
+# Content-defined cut: after a paragraph whose hash ends in CUT_MASK bits of zero (~1 in 8),
+# so a changed paragraph only changes its own segment and the next ones line up again.
+CUT_MASK = 0x7
+SEGMENT_MAX_CHARS = 16000
+REF_CHARS = 24
+# Hashes of pieces seen once (still inline); a piece gets its own file on its second sighting.
+SEEN_MAX = 50000
+# gc keeps unreferenced files touched this recently: their records may still be in a write buffer.
+GC_GRACE_SECONDS = 3600
+
+
+def prompt_dedup_enabled() -> bool:
+    return os.getenv("GEMINI_LOG_PROMPT_DEDUP", "true").strip().lower() in {"1", "true", "yes", "y"}
+
+
+def split_segments(text: str) -> List[str]:
+    paragraphs = re.split(r"(?<=\n\n)", text)
+    out: List[str] = []
+    cur = ""
+    for par in paragraphs:
+        cur += par
+        digest = hashlib.sha1(par.encode("utf-8")).digest()
+        if (digest[-1] & CUT_MASK) == 0 or len(cur) >= SEGMENT_MAX_CHARS:
+            out.append(cur)
+            cur = ""
+    if cur:
+        out.append(cur)
+    return out
+
+
+class PromptSegmentStore:
+    """Repeated prompt pieces stored once by hash under data/logs/prompt_segments/.
+
+    A call record keeps only `prompt_parts`: references to stored segments (system prompt,
+    constraint block, template...) and inline pieces. A long piece stays inline the first
+    time this process sees it and is only written out once it repeats, so one-off text
+    (theme, draft under rewrite) lives in the compressed log instead of a file of its own.
+    `expand` rebuilds the exact prompt text; `gc` drops files no log record points to.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._known: set = set()
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, ref: str) -> Path:
+        return self.root / ref[:2] / f"{ref}.txt"
+
+    def _write(self, path: Path, text: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+    def put(self, text: str) -> Optional[str]:
+        """Ref of the stored piece, or None when it should stay inline (first sighting)."""
+        ref = hashlib.sha256(text.encode("utf-8")).hexdigest()[:REF_CHARS]
+        path = self._path(ref)
+        with self._lock:
+            if ref in self._known:
+                # Refresh the mtime so a concurrent gc keeps it; rewrite if gc got there first.
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    self._write(path, text)
+                return ref
+            if not path.exists():
+                if ref not in self._seen:
+                    self._seen[ref] = None
+                    if len(self._seen) > SEEN_MAX:
+                        self._seen.popitem(last=False)
+                    return None
+                self._write(path, text)
+            self._seen.pop(ref, None)
+            self._known.add(ref)
+        return ref
+
+    def get(self, ref: str) -> str:
+        return self._path(ref).read_text(encoding="utf-8")
+
+    def encode(self, prompt: str) -> List[dict]:
+        parts: List[dict] = []
+        for seg in split_segments(prompt):
+            ref = self.put(seg) if len(seg) > INLINE_MAX_CHARS else None
+            if ref is not None:
+                parts.append({"ref": ref})
+            elif parts and "text" in parts[-1]:
+                parts[-1]["text"] += seg
+            else:
+                parts.append({"text": seg})
+        return parts
+
+    def compact_request(self, request: dict) -> dict:
+        """Request block with `prompt_text` swapped for `prompt_parts`; unchanged when dedup is off."""
+        if not prompt_dedup_enabled() or "prompt_text" not in request:
+            return request
+        out = {k: v for k, v in request.items() if k != "prompt_text"}
+        out["prompt_chars"] = len(request["prompt_text"])
+        out["prompt_parts"] = self.encode(request["prompt_text"])
+        return out
+
+    def expand(self, request: dict) -> str:
+        if "prompt_text" in request:
+            return str(request["prompt_text"])
+        return "".join(p["text"] if "text" in p else self.get(p["ref"]) for p in request.get("prompt_parts", []))
+
+    def gc(self, live: Set[str], grace_seconds: float = GC_GRACE_SECONDS) -> dict:
+        """Delete stored pieces outside `live` that were not written or reused in the last grace_seconds."""
+        cutoff = time.time() - grace_seconds
+        kept = removed = freed = 0
+        for path in sorted(self.root.glob("*/*.txt")) if self.root.exists() else []:
+            ref = path.stem
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if ref in live or st.st_mtime >= cutoff:
+                kept += 1
+                continue
+            with self._lock:
+                self._known.discard(ref)
+                path.unlink(missing_ok=True)
+            removed += 1
+            freed += st.st_size
+        return {"kept": kept, "removed": removed, "freed_bytes": freed}
+
+
+_STORES: Dict[Path, PromptSegmentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_segment_store(log_file: Path) -> PromptSegmentStore:
+    root = log_file.parent / SEGMENTS_DIR_NAME
+    with _STORES_LOCK:
+        if root not in _STORES:
+            _STORES[root] = PromptSegmentStore(root)
+        return _STORES[root]
+
+
+def live_refs(logs_dir: Path) -> Set[str]:
+    """Refs used by any record of any log in data/logs (active files and closed segments)."""
+    stems = {p.stem for p in logs_dir.glob("*.jsonl")}
+    seg_root = logs_dir / LOG_SEGMENTS_DIR_NAME
+    if seg_root.exists():
+        stems.update(p.name for p in seg_root.iterdir() if p.is_dir())
+    refs: Set[str] = set()
+    for stem in sorted(stems):
+        for row in get_store(logs_dir / f"{stem}.jsonl").iter_records():
+            request = row.get("request")
+            if isinstance(request, dict):
+                refs.update(p["ref"] for p in request.get("prompt_parts") or [] if isinstance(p, dict) and "ref" in p)
+    return refs
+
+
+def append_call_log(log_file: Path, record: dict) -> None:
+    """append_log for model-call records: the prompt body goes to the segment store."""
+    if isinstance(record.get("request"), dict):
+        record = {**record, "request": get_segment_store(log_file).compact_request(record["request"])}
+    append_log(log_file, record)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mostra chamadas Gemini com o prompt completo reconstruído")
+    parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]))
+    parser.add_argument("--batch-id", default="")
+    parser.add_argument("--id", default="", help="Filtra por id de item")
+    parser.add_argument("--phase", default="")
+    parser.add_argument("--gc", action="store_true", help="Apaga trechos que nenhum registro de data/logs referencia mais")
+    parser.add_argument("--gc-grace-hours", type=float, default=GC_GRACE_SECONDS / 3600, help="Não apaga trechos usados há menos que isso")
+    args = parser.parse_args()
+
+    log_file = Path(args.base).resolve() / "data/logs/gemini_calls.jsonl"
+    if args.gc:
+        result = get_segment_store(log_file).gc(live_refs(log_file.parent), grace_seconds=args.gc_grace_hours * 3600)
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    segments = get_segment_store(log_file)
+    for row in get_store(log_file).iter_records(batch_id=args.batch_id or None, phase=args.phase or None):
+        if args.id and row.get("id") != args.id:
+            continue
+        request = row.get("request")
+        if isinstance(request, dict) and "prompt_parts" in request:
+            request = {k: v for k, v in request.items() if k != "prompt_parts"}
+            request["prompt_text"] = segments.expand(row["request"])
+            row = {**row, "request": request}
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
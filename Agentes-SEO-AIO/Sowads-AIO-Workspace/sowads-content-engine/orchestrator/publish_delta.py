@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import csv
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+HASH_META_KEY = "sowads_content_hash"
+IMAGE_HASH_META_KEY = "sowads_image_sha256"
+# ensure_structured_data stamps "now" into the Article JSON-LD; it must not count as a change.
+_SCHEMA_DATES_RE = re.compile(r'"date(?:Published|Modified)":\s*"[^"]*"')
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compute_content_hash(item: dict, html: str, image_sha256: str) -> str:
+    payload = {
+        "html": _SCHEMA_DATES_RE.sub("", html),
+        "title": item.get("title", ""),
+        "slug": item.get("slug", ""),
+        "meta_title": item.get("meta_title", ""),
+        "meta_description": item.get("meta_description", ""),
+        "status": item.get("status", ""),
+        "version": item.get("version", 1),
+        "batch_id": item.get("batch_id", ""),
+        "image_sha256": image_sha256,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def apply_delta(job_dir: Path, items: List[dict], remote_hashes: Dict[str, str], force: bool = False) -> Tuple[List[dict], dict]:
+    """Drop items whose remote sowads_content_hash already matches; rewrite items.json and a diff report."""
+    rows = []
+    keep: List[dict] = []
+    for item in items:
+        local_hash = item.get("content_hash", "")
+        remote_hash = remote_hashes.get(item["id"])
+        if remote_hash is None:
+            reason = "new"
+        elif not remote_hash:
+            reason = "no_remote_hash"
+        elif remote_hash != local_hash:
+            reason = "changed"
+        else:
+            reason = "unchanged"
+        publish = force or reason != "unchanged"
+        rows.append(
+            {
+                "id": item["id"],
+                "slug": item["slug"],
+                "reason": reason,
+                "publish": publish,
+                "local_hash": local_hash,
+                "remote_hash": remote_hash or "",
+            }
+        )
+        if publish:
+            keep.append(item)
+        else:
+            # Unchanged items are not uploaded at all.
+            for rel in (item.get("content_rel"), item.get("image_rel")):
+                if rel:
+                    (job_dir / rel).unlink(missing_ok=True)
+
+    counts: Dict[str, int] = {}
+    for r in rows:
+        counts[r["reason"]] = counts.get(r["reason"], 0) + 1
+    report = {
+        "force": force,
+        "total": len(items),
+        "to_publish": len(keep),
+        "skipped_unchanged": len(items) - len(keep),
+        "by_reason": counts,
+        "items": rows,
+    }
+
+    items_file = job_dir / "items.json"
+    if items_file.exists():
+        data = json.loads(items_file.read_text(encoding="utf-8"))
+        data["items"] = keep
+        items_file.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    (job_dir / "publish_diff.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    with (job_dir / "publish_diff.csv").open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["id", "slug", "reason", "publish", "local_hash", "remote_hash"])
+        w.writeheader()
+        w.writerows(rows)
+    return keep, report
+
+
+def reuse_known_images(job_dir: Path, items: List[dict], attachment_by_sha256: Dict[str, int]) -> int:
+    """Point items at an existing attachment with the same image sha256 and drop the file from the upload."""
+    reused = 0
+    for item in items:
+        mid = attachment_by_sha256.get(item.get("image_sha256") or "")
+        if not mid or not item.get("image_rel"):
+            continue
+        (job_dir / item["image_rel"]).unlink(missing_ok=True)
+        item["image_rel"] = ""
+        item["media_id"] = mid
+        reused += 1
+    items_file = job_dir / "items.json"
+    if reused and items_file.exists():
+        data = json.loads(items_file.read_text(encoding="utf-8"))
+        data["items"] = items
+        items_file.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return reused
@@ -6,13 +6,32 @@ import os
 import re
 import shlex
 import shutil
-import subprocess
-import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from content_sanitizer import sanitize_article_html, split_content_package
+from image_manifest import ImageManifestIndex
+from log_store import append_log, exit_on_sigterm
+from metrics import PUBLISH, observe_publish, serve_from_env
+from publish_delta import (
+    HASH_META_KEY,
+    IMAGE_HASH_META_KEY,
+    apply_delta,
+    compute_content_hash,
+    file_sha256,
+    reuse_known_images,
+)
+from publish_wp_rest import run_rest_publish
+from remote_sync import sync_job_dir
+from ssh_session import SshSession
+
+
+BULK_WORKER_SCRIPT = Path(__file__).resolve().parent / "wp_bulk_publish.php"
 
 
 def now_iso() -> str:
@@ -37,12 +56,6 @@ def load_env_file(path: Path) -> None:
             os.environ[k] = v
 
 
-def append_jsonl(path: Path, obj: dict) -> None:
-    ensure_dir(path.parent)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-
 def extract_html_from_package(content_package: str) -> str:
     if not content_package:
         return ""
@@ -217,33 +230,6 @@ def parse_batch_id_from_articles_name(name: str) -> str:
     return name.split("_articles.csv", 1)[0]
 
 
-def shell_with_password(command: str, password: str, timeout: int = 1200) -> str:
-    script = f"""
-import pexpect
-import sys
-cmd = {command!r}
-pwd = {password!r}
-child = pexpect.spawn(cmd, encoding='utf-8', timeout={timeout})
-i = child.expect(['assword:', 'continue connecting (yes/no)?', pexpect.EOF])
-if i == 1:
-    child.sendline('yes')
-    child.expect('assword:')
-    child.sendline(pwd)
-elif i == 0:
-    child.sendline(pwd)
-child.expect(pexpect.EOF)
-print(child.before)
-child.close()
-code = child.exitstatus if child.exitstatus is not None else (child.status or 0)
-sys.exit(code)
-"""
-    proc = subprocess.run(["python3", "-c", script], capture_output=True, text=True)
-    if proc.returncode != 0:
-        msg = (proc.stderr or proc.stdout or "").strip()
-        raise RuntimeError(f"SSH/SCP failed: {msg}")
-    return proc.stdout
-
-
 def parse_batch_id_from_row_or_file(row: dict, file_name: str) -> str:
     batch_id = (row.get("batch_id") or "").strip()
     if batch_id:
@@ -324,7 +310,14 @@ def collect_posts(
     return rows
 
 
-def find_image_for_item(base: Path, batch_id: str, item_id: str) -> Optional[Path]:
+def find_image_for_item(
+    base: Path,
+    batch_id: str,
+    item_id: str,
+    image_index: Optional[ImageManifestIndex] = None,
+) -> Optional[Path]:
+    if image_index is not None:
+        return image_index.find_primary(batch_id, item_id)
     direct = sorted((base / "outputs/generated-images" / batch_id).glob(f"{item_id}_01.*"))
     if direct:
         return direct[0]
@@ -353,11 +346,18 @@ def build_publish_job(
     )
     job_id = "PUB-" + datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
     job_dir = base / "outputs/publish-jobs" / job_id
+    # Streamed pipelines can package several jobs within the same second.
+    suffix = 1
+    while job_dir.exists():
+        suffix += 1
+        job_dir = base / "outputs/publish-jobs" / f"{job_id}-{suffix}"
+    job_id = job_dir.name
     content_dir = job_dir / "content"
     image_dir = job_dir / "images"
     ensure_dir(content_dir)
     ensure_dir(image_dir)
 
+    image_index = ImageManifestIndex(base)
     items: List[dict] = []
     for r in selected_rows:
         item_id = (r.get("id") or "").strip()
@@ -381,27 +381,30 @@ def build_publish_job(
         content_file = content_dir / f"{item_id}.html"
         content_file.write_text(html, encoding="utf-8")
 
-        img_path = find_image_for_item(base, r["_batch_id"], item_id)
+        img_path = find_image_for_item(base, r["_batch_id"], item_id, image_index=image_index)
         copied_img = ""
+        image_sha256 = ""
         if img_path and img_path.exists():
             copied = image_dir / img_path.name
             shutil.copy2(img_path, copied)
             copied_img = f"images/{copied.name}"
-
-        items.append(
-            {
-                "id": item_id,
-                "batch_id": r["_batch_id"],
-                "version": int((r.get("version") or "1").strip() or 1),
-                "slug": slug,
-                "title": (r.get("tema_principal") or "").strip() or slug,
-                "meta_title": (r.get("meta_title") or "").strip(),
-                "meta_description": (r.get("meta_description") or "").strip(),
-                "content_rel": f"content/{content_file.name}",
-                "image_rel": copied_img,
-                "status": status,
-            }
-        )
+            image_sha256 = file_sha256(copied)
+
+        item = {
+            "id": item_id,
+            "batch_id": r["_batch_id"],
+            "version": int((r.get("version") or "1").strip() or 1),
+            "slug": slug,
+            "title": (r.get("tema_principal") or "").strip() or slug,
+            "meta_title": (r.get("meta_title") or "").strip(),
+            "meta_description": (r.get("meta_description") or "").strip(),
+            "content_rel": f"content/{content_file.name}",
+            "image_rel": copied_img,
+            "image_sha256": image_sha256,
+            "status": status,
+        }
+        item["content_hash"] = compute_content_hash(item, html, image_sha256)
+        items.append(item)
 
     write_json(job_dir / "items.json", {"job_id": job_id, "items": items, "generated_at": now_iso()})
     return {"job_id": job_id, "job_dir": job_dir, "items": items}
@@ -417,115 +420,121 @@ def run_remote_publish(
     user: str,
     password: str,
     wp_path: str,
+    bulk: bool = False,
+    force: bool = False,
+    workers: int = 1,
+    ssh: Optional[SshSession] = None,
 ) -> dict:
     remote_root = f"/home/{user}/tmp_sowads_publish"
     remote_job = f"{remote_root}/{job_id}"
-    local_parent = job_dir.parent
+    if bulk:
+        shutil.copy2(BULK_WORKER_SCRIPT, job_dir / BULK_WORKER_SCRIPT.name)
 
-    # 1) Ensure remote root exists
-    mkdir_cmd = f"ssh -o StrictHostKeyChecking=no -p {port} {user}@{host} \"mkdir -p {remote_root}\""
-    shell_with_password(mkdir_cmd, password, timeout=600)
+    if ssh is not None:
+        # Session owned by the caller (pipeline daemon pool): reused across jobs, not closed here.
+        result = _publish_over_session(ssh, job_id, job_dir, items, remote_root, remote_job, wp_path, bulk, force, workers)
+    else:
+        with SshSession(host, port, user, password) as ssh:
+            result = _publish_over_session(ssh, job_id, job_dir, items, remote_root, remote_job, wp_path, bulk, force, workers)
+    observe_publish("ssh", result["results"])
+    PUBLISH.inc(result.get("skipped_unchanged", 0), backend="ssh", outcome="skipped_unchanged")
+    return result
 
-    # 2) Upload whole job directory
-    scp_cmd = f"scp -o StrictHostKeyChecking=no -P {port} -r {str(job_dir)} {user}@{host}:{remote_root}/"
-    shell_with_password(scp_cmd, password, timeout=1800)
-    results = []
-    for item in items:
-        slug = item["slug"]
-        title = item["title"]
-        post_status = item.get("status", "publish")
-        content_remote = f"{remote_job}/{item['content_rel']}"
-        image_remote = f"{remote_job}/{item['image_rel']}" if item.get("image_rel") else ""
-
-        script_lines = [
-            "set -e",
-            f"cd {shlex.quote(wp_path)}",
-            "wp option update WPLANG pt_BR >/dev/null || true",
-            f"SLUG={shlex.quote(slug)}",
-            f"TITLE={shlex.quote(title)}",
-            f"META_DESC={shlex.quote(item.get('meta_description', ''))}",
-            f"META_TITLE={shlex.quote(item.get('meta_title', ''))}",
-            f"STATUS={shlex.quote(post_status)}",
-            f"CONTENT={shlex.quote(content_remote)}",
-            "EXISTING_BY_ID=$(wp post list --post_type=post --post_status=any --meta_key=sowads_content_id --meta_value="
-            + shlex.quote(item["id"])
-            + " --field=ID --format=ids | awk '{print $1}')",
-            "EXISTING_BY_SLUG=$(wp post list --name=\"$SLUG\" --post_type=post --post_status=any --field=ID --format=ids | awk '{print $1}')",
-            "if [ -n \"$EXISTING_BY_ID\" ]; then",
-            "  PID=\"$EXISTING_BY_ID\"",
-            "  ACTION=updated_by_id",
-            "  wp post update \"$PID\" \"$CONTENT\" --post_title=\"$TITLE\" --post_name=\"$SLUG\" --post_status=\"$STATUS\" --post_type=post >/dev/null",
-            "elif [ -n \"$EXISTING_BY_SLUG\" ]; then",
-            "  PID=\"$EXISTING_BY_SLUG\"",
-            "  ACTION=updated_by_slug",
-            "  wp post update \"$PID\" \"$CONTENT\" --post_title=\"$TITLE\" --post_name=\"$SLUG\" --post_status=\"$STATUS\" --post_type=post >/dev/null",
-            "else",
-            "  ACTION=created",
-            "  PID=$(wp post create \"$CONTENT\" --post_title=\"$TITLE\" --post_name=\"$SLUG\" --post_status=\"$STATUS\" --post_type=post --porcelain)",
-            "fi",
-            "wp post meta update \"$PID\" sowads_content_id " + shlex.quote(item["id"]) + " >/dev/null || true",
-            "wp post meta update \"$PID\" sowads_content_version " + shlex.quote(str(item.get("version", 1))) + " >/dev/null || true",
-            "wp post meta update \"$PID\" sowads_batch_id " + shlex.quote(item.get("batch_id", "")) + " >/dev/null || true",
-            "if [ -n \"$META_DESC\" ]; then wp post update \"$PID\" --post_excerpt=\"$META_DESC\" >/dev/null || true; fi",
-        ]
-        if item.get("meta_title"):
-            script_lines.append("wp post meta update \"$PID\" _yoast_wpseo_title " + shlex.quote(item["meta_title"]) + " >/dev/null || true")
-            script_lines.append("wp post meta update \"$PID\" rank_math_title " + shlex.quote(item["meta_title"]) + " >/dev/null || true")
-        if item.get("meta_description"):
-            script_lines.append("wp post meta update \"$PID\" _yoast_wpseo_metadesc " + shlex.quote(item["meta_description"]) + " >/dev/null || true")
-            script_lines.append("wp post meta update \"$PID\" rank_math_description " + shlex.quote(item["meta_description"]) + " >/dev/null || true")
 
-        script_lines += [
-            "MID=0",
-        ]
-        if image_remote:
-            script_lines += [
-                f"IMG={shlex.quote(image_remote)}",
-                "if [ -f \"$IMG\" ]; then",
-                "  MID=$(wp media import \"$IMG\" --post_id=\"$PID\" --featured_image --porcelain 2>/dev/null || echo 0)",
-                "  if [ \"$MID\" -gt 0 ]; then wp post meta update \"$MID\" _wp_attachment_image_alt \"$TITLE\" >/dev/null || true; fi",
-                "fi",
-            ]
-        script_lines.append('echo "RESULT|$PID|$MID|$ACTION"')
-
-        remote_cmd = (
-            f"ssh -o StrictHostKeyChecking=no -p {port} {user}@{host} "
-            + shlex.quote("\n".join(script_lines))
-        )
-        try:
-            # Per-item timeout must be bounded; a single stuck WP-CLI command
-            # cannot block an entire large publish job for hours.
-            output = shell_with_password(remote_cmd, password, timeout=180)
-            m = re.search(r"RESULT\|(\d+)\|(\d+)\|([a-zA-Z_]+)", output)
-            if not m:
-                raise RuntimeError("No RESULT marker returned by remote command")
-            results.append(
-                {
-                    "id": item["id"],
-                    "slug": slug,
-                    "wp_post_id": int(m.group(1)),
-                    "wp_media_id": int(m.group(2)),
-                    "status": post_status,
-                    "action": m.group(3),
-                    "error": "",
-                }
-            )
-        except Exception as e:
-            results.append(
-                {
-                    "id": item["id"],
-                    "slug": slug,
-                    "wp_post_id": 0,
-                    "wp_media_id": 0,
-                    "status": post_status,
-                    "action": "",
-                    "error": str(e),
-                }
-            )
+@dataclass
+class RemoteIdMap:
+    by_content_id: Dict[str, int] = field(default_factory=dict)
+    by_slug: Dict[str, int] = field(default_factory=dict)
+    content_hashes: Dict[str, str] = field(default_factory=dict)
+    attachment_by_sha256: Dict[str, int] = field(default_factory=dict)
+
+    def resolve(self, item_id: str, slug: str) -> Tuple[int, str]:
+        if item_id in self.by_content_id:
+            return self.by_content_id[item_id], "updated_by_id"
+        if slug in self.by_slug:
+            return self.by_slug[slug], "updated_by_slug"
+        return 0, "created"
+
+
+def fetch_remote_map(ssh: SshSession, wp_path: str) -> RemoteIdMap:
+    # One WordPress boot for the whole job: content id/slug -> post ID, content hashes
+    # and attachment image hashes. Replaces two `wp post list` calls per item.
+    php = (
+        "global $wpdb; "
+        "$posts = $wpdb->get_results(\"SELECT p.ID, p.post_name, c.meta_value AS cid, h.meta_value AS hash "
+        "FROM {$wpdb->posts} p "
+        "LEFT JOIN {$wpdb->postmeta} c ON c.post_id = p.ID AND c.meta_key = 'sowads_content_id' "
+        f"LEFT JOIN {{$wpdb->postmeta}} h ON h.post_id = p.ID AND h.meta_key = '{HASH_META_KEY}' "
+        "WHERE p.post_type = 'post' AND p.post_status NOT IN ('trash', 'auto-draft') "
+        "ORDER BY p.post_date DESC, p.ID DESC\"); "
+        "foreach ($posts as $r) { echo 'POST|' . $r->ID . '|' . $r->post_name . '|' . $r->cid . '|' . $r->hash . PHP_EOL; } "
+        "$atts = $wpdb->get_results(\"SELECT m.post_id, m.meta_value AS sha FROM {$wpdb->postmeta} m "
+        "JOIN {$wpdb->posts} a ON a.ID = m.post_id AND a.post_type = 'attachment' "
+        f"WHERE m.meta_key = '{IMAGE_HASH_META_KEY}' ORDER BY m.post_id DESC\"); "
+        "foreach ($atts as $r) { echo 'ATTACH|' . $r->post_id . '|' . $r->sha . PHP_EOL; }"
+    )
+    output = ssh.run(f"cd {shlex.quote(wp_path)}\nwp eval {shlex.quote(php)}", timeout=600)
+    remote = RemoteIdMap()
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("POST|"):
+            parts = line.split("|")
+            if len(parts) != 5 or not parts[1].isdigit():
+                continue
+            pid, slug, cid, content_hash = int(parts[1]), parts[2], parts[3], parts[4]
+            # Newest post wins, matching the previous `wp post list | awk '{print $1}'` lookup.
+            if slug:
+                remote.by_slug.setdefault(slug, pid)
+            if cid:
+                remote.by_content_id.setdefault(cid, pid)
+                remote.content_hashes.setdefault(cid, content_hash)
+        elif line.startswith("ATTACH|"):
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].isdigit() and parts[2]:
+                remote.attachment_by_sha256.setdefault(parts[2], int(parts[1]))
+    return remote
+
+
+def _publish_over_session(
+    ssh: SshSession,
+    job_id: str,
+    job_dir: Path,
+    items: List[dict],
+    remote_root: str,
+    remote_job: str,
+    wp_path: str,
+    bulk: bool = False,
+    force: bool = False,
+    workers: int = 1,
+) -> dict:
+    # 0) Remote ID map + delta: skip items whose remote content hash already matches
+    remote = fetch_remote_map(ssh, wp_path)
+    items, diff = apply_delta(job_dir, items, remote.content_hashes, force=force)
+    # Byte-identical featured images reuse their attachment instead of a new import.
+    images_reused = reuse_known_images(job_dir, items, remote.attachment_by_sha256)
+    if not items:
+        result = {"job_id": job_id, "total": 0, "ok": 0, "failed": 0, "skipped_unchanged": diff["skipped_unchanged"], "results": []}
+        write_json(job_dir / "publish_results_remote.json", result)
+        return result
+
+    # 1) Ship the job: one compressed tar with only the files missing from the remote cache
+    sync_stats: Dict[str, int] = {}
+    if os.getenv("WP_SYNC_CACHE", "true").strip().lower() in {"1", "true", "yes", "y"}:
+        sync_stats = sync_job_dir(ssh, job_dir, remote_root, remote_job)
+    else:
+        ssh.run(f"mkdir -p {remote_root}", timeout=600)
+        ssh.upload(job_dir, remote_root, timeout=1800)
+    if bulk:
+        results = _publish_items_bulk(ssh, items, remote_job, wp_path)
+    else:
+        results = _publish_items_per_item(ssh, items, remote_job, wp_path, remote, workers=max(1, workers))
 
     result = {
         "job_id": job_id,
         "total": len(items),
+        "skipped_unchanged": diff["skipped_unchanged"],
+        "images_reused": images_reused,
+        "sync": sync_stats,
         "ok": len([r for r in results if not r["error"]]),
         "failed": len([r for r in results if r["error"]]),
         "results": results,
@@ -534,12 +543,213 @@ def run_remote_publish(
     local_result = job_dir / "publish_results_remote.json"
     write_json(local_result, result)
 
-    # 3) Cleanup remote temp
-    cleanup_cmd = f"ssh -o StrictHostKeyChecking=no -p {port} {user}@{host} \"rm -rf {remote_job}\""
-    shell_with_password(cleanup_cmd, password, timeout=600)
+    # 2) Cleanup remote temp (the content cache next to it is kept)
+    ssh.run(f"rm -rf {remote_job}", timeout=600)
     return result
 
 
+def _publish_items_per_item(
+    ssh: SshSession,
+    items: List[dict],
+    remote_job: str,
+    wp_path: str,
+    remote: RemoteIdMap,
+    workers: int = 1,
+) -> List[dict]:
+    ssh.run(f"cd {shlex.quote(wp_path)}\nwp option update WPLANG pt_BR >/dev/null || true", timeout=180)
+    timeout = int(os.getenv("WP_ITEM_TIMEOUT", "180"))
+    attempts = max(1, int(os.getenv("WP_ITEM_ATTEMPTS", "2")))
+    lock = threading.Lock()
+
+    def publish(item: dict) -> dict:
+        return _publish_one_item(ssh, item, remote_job, wp_path, remote, lock, timeout, attempts)
+
+    if workers <= 1:
+        return [publish(item) for item in items]
+
+    # Items repeating an image already used earlier in the job wait for the first wave,
+    # so the attachment is imported once and reused instead of raced.
+    first_wave: List[int] = []
+    second_wave: List[int] = []
+    seen_images = set()
+    for idx, item in enumerate(items):
+        sha = item.get("image_sha256") or ""
+        if sha and item.get("image_rel") and sha in seen_images:
+            second_wave.append(idx)
+        else:
+            seen_images.add(sha)
+            first_wave.append(idx)
+
+    results: List[Optional[dict]] = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for wave in (first_wave, second_wave):
+            for idx, row in zip(wave, pool.map(publish, [items[i] for i in wave])):
+                results[idx] = row
+    return [r for r in results if r is not None]
+
+
+def _publish_one_item(
+    ssh: SshSession,
+    item: dict,
+    remote_job: str,
+    wp_path: str,
+    remote: RemoteIdMap,
+    lock: threading.Lock,
+    timeout: int,
+    attempts: int,
+) -> dict:
+    slug = item["slug"]
+    with lock:
+        existing_pid, action = remote.resolve(item["id"], slug)
+    title = item["title"]
+    post_status = item.get("status", "publish")
+    content_remote = f"{remote_job}/{item['content_rel']}"
+    image_remote = f"{remote_job}/{item['image_rel']}" if item.get("image_rel") else ""
+
+    script_lines = [
+        "set -e",
+        f"cd {shlex.quote(wp_path)}",
+        f"SLUG={shlex.quote(slug)}",
+        f"TITLE={shlex.quote(title)}",
+        f"META_DESC={shlex.quote(item.get('meta_description', ''))}",
+        f"META_TITLE={shlex.quote(item.get('meta_title', ''))}",
+        f"STATUS={shlex.quote(post_status)}",
+        f"CONTENT={shlex.quote(content_remote)}",
+        # Existing post resolved up-front from the job's remote ID map.
+        f"PID={existing_pid}",
+        f"ACTION={action}",
+        "if [ \"$PID\" -gt 0 ]; then",
+        "  wp post update \"$PID\" \"$CONTENT\" --post_title=\"$TITLE\" --post_name=\"$SLUG\" --post_status=\"$STATUS\" --post_type=post >/dev/null",
+        "else",
+        "  PID=$(wp post create \"$CONTENT\" --post_title=\"$TITLE\" --post_name=\"$SLUG\" --post_status=\"$STATUS\" --post_type=post --porcelain)",
+        "fi",
+        "wp post meta update \"$PID\" sowads_content_id " + shlex.quote(item["id"]) + " >/dev/null || true",
+        "wp post meta update \"$PID\" sowads_content_version " + shlex.quote(str(item.get("version", 1))) + " >/dev/null || true",
+        "wp post meta update \"$PID\" sowads_batch_id " + shlex.quote(item.get("batch_id", "")) + " >/dev/null || true",
+        "if [ -n \"$META_DESC\" ]; then wp post update \"$PID\" --post_excerpt=\"$META_DESC\" >/dev/null || true; fi",
+    ]
+    if item.get("meta_title"):
+        script_lines.append("wp post meta update \"$PID\" _yoast_wpseo_title " + shlex.quote(item["meta_title"]) + " >/dev/null || true")
+        script_lines.append("wp post meta update \"$PID\" rank_math_title " + shlex.quote(item["meta_title"]) + " >/dev/null || true")
+    if item.get("meta_description"):
+        script_lines.append("wp post meta update \"$PID\" _yoast_wpseo_metadesc " + shlex.quote(item["meta_description"]) + " >/dev/null || true")
+        script_lines.append("wp post meta update \"$PID\" rank_math_description " + shlex.quote(item["meta_description"]) + " >/dev/null || true")
+
+    script_lines += [
+        "MID=0",
+    ]
+    image_sha256 = item.get("image_sha256") or ""
+    # Same image already imported earlier in this job (or before): reuse that attachment.
+    with lock:
+        reuse_mid = int(item.get("media_id") or 0) or remote.attachment_by_sha256.get(image_sha256, 0)
+    if reuse_mid:
+        image_remote = ""
+        script_lines += [
+            f"MID={reuse_mid}",
+            "wp post meta update \"$PID\" _thumbnail_id \"$MID\" >/dev/null",
+        ]
+    elif image_remote:
+        script_lines += [
+            f"IMG={shlex.quote(image_remote)}",
+            "if [ -f \"$IMG\" ]; then",
+            "  MID=$(wp media import \"$IMG\" --post_id=\"$PID\" --featured_image --porcelain 2>/dev/null || echo 0)",
+            "  if [ \"$MID\" -gt 0 ]; then wp post meta update \"$MID\" _wp_attachment_image_alt \"$TITLE\" >/dev/null || true; fi",
+        ]
+        if image_sha256:
+            script_lines.append(
+                f"  if [ \"$MID\" -gt 0 ]; then wp post meta update \"$MID\" {IMAGE_HASH_META_KEY} "
+                + shlex.quote(image_sha256)
+                + " >/dev/null || true; fi"
+            )
+        script_lines.append("fi")
+    # Hash goes last and only when the image landed, so a failed import is retried on the next delta run.
+    if item.get("content_hash"):
+        hash_cond = "[ \"$MID\" -gt 0 ]" if image_remote else "true"
+        script_lines.append(
+            f"if {hash_cond}; then wp post meta update \"$PID\" {HASH_META_KEY} "
+            + shlex.quote(item["content_hash"])
+            + " >/dev/null || true; fi"
+        )
+    script_lines.append('echo "RESULT|$PID|$MID|$ACTION"')
+
+    last_error = ""
+    for attempt in range(1, attempts + 1):
+        lines = list(script_lines)
+        if attempt > 1 and not existing_pid:
+            # The failed attempt may have created the post already: look it up before creating again.
+            lookup = (
+                "PID=$(wp post list --post_type=post --post_status=any --meta_key=sowads_content_id "
+                f"--meta_value={shlex.quote(item['id'])} --field=ID --orderby=ID --order=DESC | head -n 1)"
+            )
+            at = lines.index("if [ \"$PID\" -gt 0 ]; then")
+            lines[at:at] = [lookup, "PID=${PID:-0}", "if [ \"$PID\" -gt 0 ]; then ACTION=updated_by_id; fi"]
+        try:
+            # Per-item timeout must be bounded; a single stuck WP-CLI command
+            # cannot block an entire large publish job for hours.
+            output = ssh.run("\n".join(lines), timeout=timeout)
+            m = re.search(r"RESULT\|(\d+)\|(\d+)\|([a-zA-Z_]+)", output)
+            if not m:
+                raise RuntimeError("No RESULT marker returned by remote command")
+            if image_sha256 and int(m.group(2)) > 0:
+                with lock:
+                    remote.attachment_by_sha256.setdefault(image_sha256, int(m.group(2)))
+            return _result_row(item, int(m.group(1)), int(m.group(2)), m.group(3))
+        except Exception as e:
+            last_error = str(e)
+            if attempt < attempts:
+                time.sleep(min(30, 2 ** attempt))
+    return _result_row(item, error=last_error)
+
+
+def _result_row(item: dict, post_id: int = 0, media_id: int = 0, action: str = "", error: str = "") -> dict:
+    return {
+        "id": item["id"],
+        "slug": item["slug"],
+        "wp_post_id": post_id,
+        "wp_media_id": media_id,
+        "status": item.get("status", "publish"),
+        "action": action,
+        "error": error,
+    }
+
+
+def _publish_items_bulk(ssh: SshSession, items: List[dict], remote_job: str, wp_path: str) -> List[dict]:
+    # One `wp eval-file` call: WordPress boots once and the PHP worker upserts every item.
+    timeout = int(os.getenv("WP_BULK_TIMEOUT", "0") or 0) or max(600, 20 * len(items))
+    script = "\n".join(
+        [
+            f"cd {shlex.quote(wp_path)}",
+            f"wp eval-file {shlex.quote(remote_job + '/' + BULK_WORKER_SCRIPT.name)} {shlex.quote(remote_job)}",
+        ]
+    )
+    try:
+        output = ssh.run(script, timeout=timeout)
+    except Exception as e:
+        # Partial output is lost with the failed call; every item is reported as failed.
+        return [_result_row(item, error=str(e)) for item in items]
+
+    by_id: Dict[str, dict] = {}
+    for line in output.splitlines():
+        m = re.match(r"\s*RESULT\|([^|]+)\|(\d+)\|(\d+)\|([a-zA-Z_]+)", line)
+        if m:
+            by_id[m.group(1)] = {"post_id": int(m.group(2)), "media_id": int(m.group(3)), "action": m.group(4)}
+            continue
+        m = re.match(r"\s*ERROR\|([^|]+)\|(.*)", line)
+        if m:
+            by_id[m.group(1)] = {"error": m.group(2).strip() or "remote error"}
+
+    results = []
+    for item in items:
+        res = by_id.get(item["id"])
+        if not res:
+            results.append(_result_row(item, error="No RESULT marker returned by remote command"))
+        elif res.get("error"):
+            results.append(_result_row(item, error=res["error"]))
+        else:
+            results.append(_result_row(item, res["post_id"], res["media_id"], res["action"]))
+    return results
+
+
 def write_csv(path: Path, rows: List[dict], columns: List[str]) -> None:
     ensure_dir(path.parent)
     with path.open("w", newline="", encoding="utf-8") as f:
@@ -550,7 +760,7 @@ def write_csv(path: Path, rows: List[dict], columns: List[str]) -> None:
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Publish selected articles to WordPress via WP-CLI over SSH")
+    parser = argparse.ArgumentParser(description="Publish selected articles to WordPress via WP-CLI over SSH or the REST API")
     parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]))
     parser.add_argument("--status", default="publish", choices=["draft", "publish", "private"])
     parser.add_argument("--batch-id", default="", help="Publicar somente itens deste batch_id")
@@ -562,16 +772,42 @@ def main():
     parser.add_argument("--audit-threshold", type=int, default=80, help="Score mínimo SEO/GEO para permitir publicação")
     parser.add_argument("--skip-audit-gate", action="store_true", help="Ignora gate de auditoria (não recomendado)")
     parser.add_argument("--articles-csv", default="", help="CSV específico de artigos para publicar")
+    parser.add_argument(
+        "--backend",
+        default=os.getenv("WP_PUBLISH_BACKEND", "ssh"),
+        choices=["ssh", "rest"],
+        help="ssh = WP-CLI via SSH; rest = WP REST API com application password (WP_BASE_URL/WP_USERNAME/WP_APP_PASSWORD)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Republica todos os itens, mesmo com sowads_content_hash remoto igual ao local",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WP_PUBLISH_WORKERS", "1")),
+        help="Itens publicados em paralelo no modo SSH por item (sessões remotas simultâneas)",
+    )
+    parser.add_argument("--rest-workers", type=int, default=int(os.getenv("WP_REST_WORKERS", "4")))
     parser.add_argument("--wp-path", default="")
     parser.add_argument("--ssh-host", default=os.getenv("WP_SSH_HOST", ""))
     parser.add_argument("--ssh-port", type=int, default=int(os.getenv("WP_SSH_PORT", "22")))
     parser.add_argument("--ssh-user", default=os.getenv("WP_SSH_USER", ""))
     parser.add_argument("--ssh-password", default=os.getenv("WP_SSH_PASSWORD", ""))
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        default=os.getenv("WP_PUBLISH_BULK", "").strip().lower() in {"1", "true", "yes", "y"},
+        help="Publica todos os itens em um único `wp eval-file` (WordPress inicializa uma vez)",
+    )
     args = parser.parse_args()
+    exit_on_sigterm()
 
     base = Path(args.base).resolve()
     load_env_file(base / ".env")
     load_env_file(base.parent / ".env")
+    serve_from_env()
 
     ssh_host = args.ssh_host or os.getenv("WP_SSH_HOST", "")
     ssh_user = args.ssh_user or os.getenv("WP_SSH_USER", "")
@@ -579,7 +815,14 @@ def main():
     ssh_port = int(args.ssh_port)
     wp_path = args.wp_path or os.getenv("WP_SSH_WP_PATH", "")
 
-    if not (ssh_host and ssh_user and ssh_password and wp_path):
+    wp_base_url = os.getenv("WP_BASE_URL", "").strip()
+    wp_username = os.getenv("WP_USERNAME", "").strip()
+    wp_app_password = os.getenv("WP_APP_PASSWORD", "").strip()
+
+    if args.backend == "rest":
+        if not (wp_base_url and wp_username and wp_app_password) or wp_app_password == "CHANGE_ME":
+            raise SystemExit("Missing REST params. Set WP_BASE_URL/WP_USERNAME/WP_APP_PASSWORD in env/.env")
+    elif not (ssh_host and ssh_user and ssh_password and wp_path):
         raise SystemExit("Missing SSH params. Use --ssh-* and --wp-path or envs: WP_SSH_HOST/PORT/USER/PASSWORD/WP_SSH_WP_PATH")
 
     include_statuses = [s.strip() for s in (args.include_statuses or "").split(",") if s.strip()]
@@ -598,17 +841,32 @@ def main():
     if not items:
         raise SystemExit("No posts found to publish with selected filters.")
 
-    remote_result = run_remote_publish(
-        base=base,
-        job_id=job_id,
-        job_dir=job_dir,
-        items=items,
-        host=ssh_host,
-        port=ssh_port,
-        user=ssh_user,
-        password=ssh_password,
-        wp_path=wp_path,
-    )
+    if args.backend == "rest":
+        remote_result = run_rest_publish(
+            job_id=job_id,
+            job_dir=job_dir,
+            items=items,
+            base_url=wp_base_url,
+            username=wp_username,
+            app_password=wp_app_password,
+            workers=int(args.rest_workers),
+            force=bool(args.force),
+        )
+    else:
+        remote_result = run_remote_publish(
+            base=base,
+            job_id=job_id,
+            job_dir=job_dir,
+            items=items,
+            host=ssh_host,
+            port=ssh_port,
+            user=ssh_user,
+            password=ssh_password,
+            wp_path=wp_path,
+            bulk=bool(args.bulk),
+            force=bool(args.force),
+            workers=int(args.workers),
+        )
 
     published_rows = remote_result.get("results", [])
     csv_path = job_dir / "published_posts.csv"
@@ -616,7 +874,7 @@ def main():
 
     publication_log = base / "data/logs/publication_log.jsonl"
     for row in published_rows:
-        append_jsonl(
+        append_log(
             publication_log,
             {
                 "timestamp": now_iso(),
@@ -636,6 +894,8 @@ def main():
         "generated_items": len(items),
         "ok": remote_result.get("ok", 0),
         "failed": remote_result.get("failed", 0),
+        "skipped_unchanged": remote_result.get("skipped_unchanged", 0),
+        "diff": str(job_dir / "publish_diff.json"),
         "job_dir": str(job_dir),
         "csv": str(csv_path),
         "json": str(job_dir / "publish_results_remote.json"),
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+import base64
+import http.client
+import json
+import mimetypes
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from conn_pool import ConnectionPool
+from metrics import PUBLISH, observe_publish
+from publish_delta import HASH_META_KEY, IMAGE_HASH_META_KEY, apply_delta, reuse_known_images
+
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+POST_STATUSES = "publish,future,draft,pending,private"
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def write_json(path: Path, obj: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+class WordPressRestError(RuntimeError):
+    def __init__(self, message: str, status: int = 0, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class WordPressRestClient:
+    """WP REST client over keep-alive connections, auth by application password.
+
+    Connections are one per worker thread, or checked out of `pool` per request when the
+    caller shares one across jobs (pipeline daemon).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        app_password: str,
+        timeout: int = 120,
+        attempts: int = 4,
+        backoff_seconds: float = 1.5,
+        pool: Optional[ConnectionPool] = None,
+    ):
+        parsed = urllib.parse.urlsplit(base_url.rstrip("/"))
+        self.scheme = parsed.scheme or "https"
+        self.netloc = parsed.netloc
+        self.prefix = parsed.path.rstrip("/") + os.getenv("WP_REST_PREFIX", "/wp-json").rstrip("/")
+        token = base64.b64encode(f"{username}:{app_password.replace(' ', '')}".encode("utf-8")).decode("ascii")
+        self.auth_header = f"Basic {token}"
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.backoff_seconds = backoff_seconds
+        self.pool = pool
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.netloc, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _drop_conn(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _send_once(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict],
+        body: Optional[bytes],
+        headers: Dict[str, str],
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        url = f"{self.prefix}{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        hdrs = {"Authorization": self.auth_header, "Accept": "application/json", **headers}
+        if self.pool is not None:
+            conn, _ = self.pool.acquire(self.scheme, self.netloc, self.timeout)
+        else:
+            conn = self._conn()
+        try:
+            conn.request(method, url, body=body, headers=hdrs)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            if self.pool is not None:
+                conn.close()
+            else:
+                self._drop_conn()
+            raise WordPressRestError(f"WP REST network error: {e}", retryable=True)
+        resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+        keep = resp_headers.get("connection", "").lower() != "close"
+        if self.pool is not None:
+            self.pool.release(self.scheme, self.netloc, conn, reuse=keep)
+        elif not keep:
+            self._drop_conn()
+        return resp.status, resp_headers, data
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json_body: Optional[dict] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        retry: bool = True,
+    ) -> Tuple[object, Dict[str, str]]:
+        headers = dict(headers or {})
+        body = data
+        if json_body is not None:
+            body = json.dumps(json_body, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        attempts = self.attempts if retry else 1
+        last_err: Optional[WordPressRestError] = None
+        for i in range(1, attempts + 1):
+            try:
+                status, resp_headers, raw = self._send_once(method, path, params, body, headers)
+                if status >= 400:
+                    msg = raw.decode("utf-8", errors="replace")[:500]
+                    raise WordPressRestError(f"WP REST HTTP {status}: {msg}", status=status, retryable=status in RETRYABLE_STATUS)
+                return (json.loads(raw.decode("utf-8")) if raw else None), resp_headers
+            except WordPressRestError as e:
+                last_err = e
+                if not e.retryable or i == attempts:
+                    raise
+                time.sleep(self.backoff_seconds * i)
+        raise WordPressRestError(f"WP REST retry exhausted: {last_err}")
+
+    def list_all(self, path: str, params: dict) -> List[dict]:
+        out: List[dict] = []
+        page = 1
+        while True:
+            data, headers = self.request("GET", path, params={**params, "per_page": 100, "page": page})
+            out.extend(data or [])
+            total_pages = int(headers.get("x-wp-totalpages", "1") or 1)
+            if page >= total_pages or not data:
+                return out
+            page += 1
+
+
+class RemotePostMap:
+    """sowads_content_id -> post id/content hash and slug -> post id, loaded in one paginated pass.
+
+    Image hashes are read only for the posts' current featured attachments, not the whole library.
+    """
+
+    def __init__(self, client: WordPressRestClient):
+        self.by_content_id: Dict[str, int] = {}
+        self.by_slug: Dict[str, int] = {}
+        self.content_hashes: Dict[str, str] = {}
+        self.attachment_by_sha256: Dict[str, int] = {}
+        self._uploading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        posts = client.list_all(
+            "/wp/v2/posts",
+            {"context": "edit", "status": POST_STATUSES, "_fields": "id,slug,meta,featured_media"},
+        )
+        featured = sorted({int(p.get("featured_media") or 0) for p in posts} - {0})
+        for i in range(0, len(featured), 100):
+            chunk = featured[i : i + 100]
+            media = client.list_all(
+                "/wp/v2/media",
+                {"context": "edit", "include": ",".join(str(m) for m in chunk), "_fields": "id,meta"},
+            )
+            for m in media:
+                meta = m.get("meta") if isinstance(m.get("meta"), dict) else {}
+                sha = str(meta.get(IMAGE_HASH_META_KEY) or "")
+                if sha:
+                    self.attachment_by_sha256.setdefault(sha, int(m["id"]))
+        for p in posts:
+            pid = int(p.get("id") or 0)
+            meta = p.get("meta") if isinstance(p.get("meta"), dict) else {}
+            cid = str(meta.get("sowads_content_id") or "").strip()
+            if cid:
+                self.by_content_id.setdefault(cid, pid)
+                self.content_hashes.setdefault(cid, str(meta.get(HASH_META_KEY) or ""))
+            if p.get("slug"):
+                self.by_slug.setdefault(str(p["slug"]), pid)
+
+    def resolve(self, item_id: str, slug: str) -> Tuple[int, str]:
+        with self._lock:
+            if item_id in self.by_content_id:
+                return self.by_content_id[item_id], "updated_by_id"
+            if slug in self.by_slug:
+                return self.by_slug[slug], "updated_by_slug"
+        return 0, "created"
+
+    def remember(self, item_id: str, slug: str, pid: int) -> None:
+        with self._lock:
+            self.by_content_id[item_id] = pid
+            self.by_slug[slug] = pid
+
+    def claim_media(self, sha256: str) -> int:
+        """Attachment id for this image, or 0 when the caller has to upload it and then call release_media.
+
+        Items sharing an image wait for the one uploading it instead of uploading a duplicate.
+        """
+        if not sha256:
+            return 0
+        while True:
+            with self._lock:
+                mid = self.attachment_by_sha256.get(sha256, 0)
+                if mid:
+                    return mid
+                pending = self._uploading.get(sha256)
+                if pending is None:
+                    self._uploading[sha256] = threading.Event()
+                    return 0
+            # If that upload fails, the next waiter to wake up claims it.
+            pending.wait()
+
+    def release_media(self, sha256: str, mid: int) -> None:
+        if not sha256:
+            return
+        with self._lock:
+            if mid:
+                self.attachment_by_sha256.setdefault(sha256, mid)
+            pending = self._uploading.pop(sha256, None)
+        if pending is not None:
+            pending.set()
+
+
+def _post_body(item: dict, content: str) -> dict:
+    meta = {
+        "sowads_content_id": item["id"],
+        "sowads_content_version": str(item.get("version", 1)),
+        "sowads_batch_id": item.get("batch_id", ""),
+    }
+    if item.get("meta_title"):
+        meta["_yoast_wpseo_title"] = item["meta_title"]
+        meta["rank_math_title"] = item["meta_title"]
+    if item.get("meta_description"):
+        meta["_yoast_wpseo_metadesc"] = item["meta_description"]
+        meta["rank_math_description"] = item["meta_description"]
+    body = {
+        "title": item["title"],
+        "slug": item["slug"],
+        "status": item.get("status", "publish"),
+        "content": content,
+        "meta": meta,
+    }
+    if item.get("meta_description"):
+        body["excerpt"] = item["meta_description"]
+    if item.get("media_id"):
+        # Known attachment with the same image bytes: set it directly, no upload.
+        body["featured_media"] = int(item["media_id"])
+    return body
+
+
+def _find_by_slug(client: WordPressRestClient, slug: str) -> int:
+    data, _ = client.request(
+        "GET",
+        "/wp/v2/posts",
+        params={"slug": slug, "context": "edit", "status": POST_STATUSES, "_fields": "id"},
+    )
+    return int(data[0]["id"]) if data else 0
+
+
+def _upsert_post(client: WordPressRestClient, remote_map: RemotePostMap, item: dict, content: str) -> Tuple[int, str]:
+    pid, action = remote_map.resolve(item["id"], item["slug"])
+    body = _post_body(item, content)
+    if pid:
+        client.request("POST", f"/wp/v2/posts/{pid}", json_body=body)
+        return pid, action
+
+    # Creates are not blindly retried: a timed-out POST may have landed, so look the slug
+    # up again before trying once more (keeps the upsert idempotent).
+    last_err: Optional[Exception] = None
+    for i in range(1, client.attempts + 1):
+        try:
+            data, _ = client.request("POST", "/wp/v2/posts", json_body=body, retry=False)
+            return int(data["id"]), "created"
+        except WordPressRestError as e:
+            last_err = e
+            if not e.retryable or i == client.attempts:
+                raise
+            time.sleep(client.backoff_seconds * i)
+            existing = _find_by_slug(client, item["slug"])
+            if existing:
+                client.request("POST", f"/wp/v2/posts/{existing}", json_body=body)
+                return existing, "updated_by_slug"
+    raise WordPressRestError(f"WP REST create failed: {last_err}")
+
+
+def _upload_image(client: WordPressRestClient, pid: int, image_path: Path, title: str, sha256: str) -> int:
+    mime = mimetypes.guess_type(image_path.name)[0] or "application/octet-stream"
+    params = {"post": pid, "alt_text": title}
+    if sha256:
+        params[f"meta[{IMAGE_HASH_META_KEY}]"] = sha256
+    data, _ = client.request(
+        "POST",
+        "/wp/v2/media",
+        params=params,
+        data=image_path.read_bytes(),
+        headers={
+            "Content-Type": mime,
+            "Content-Disposition": f'attachment; filename="{image_path.name}"',
+        },
+    )
+    return int(data["id"])
+
+
+def publish_item(client: WordPressRestClient, remote_map: RemotePostMap, job_dir: Path, item: dict) -> dict:
+    row = {
+        "id": item["id"],
+        "slug": item["slug"],
+        "wp_post_id": 0,
+        "wp_media_id": 0,
+        "status": item.get("status", "publish"),
+        "action": "",
+        "error": "",
+    }
+    try:
+        content = (job_dir / item["content_rel"]).read_text(encoding="utf-8")
+        pid, action = _upsert_post(client, remote_map, item, content)
+        remote_map.remember(item["id"], item["slug"], pid)
+        row["wp_post_id"] = pid
+        row["action"] = action
+        sha = item.get("image_sha256") or ""
+        if item.get("media_id"):
+            row["wp_media_id"] = int(item["media_id"])
+        elif item.get("image_rel"):
+            img = job_dir / item["image_rel"]
+            # Another item of this run may already have uploaded (or be uploading) the same image.
+            reused = remote_map.claim_media(sha)
+            uploaded = 0
+            try:
+                if not reused and img.exists():
+                    uploaded = _upload_image(client, pid, img, item["title"], sha)
+                if reused or uploaded:
+                    client.request("POST", f"/wp/v2/posts/{pid}", json_body={"featured_media": reused or uploaded})
+                    row["wp_media_id"] = reused or uploaded
+            except WordPressRestError:
+                # Same as the WP-CLI path: a failed image import does not fail the post,
+                # but the hash is cleared so the next delta run retries it.
+                row["wp_media_id"] = 0
+                client.request("POST", f"/wp/v2/posts/{pid}", json_body={"meta": {HASH_META_KEY: ""}})
+            finally:
+                if not reused:
+                    remote_map.release_media(sha, uploaded)
+        # Hash goes last and only once the image is in (like the SSH path): a run that dies
+        # before that, or an image that never landed, is picked up by the next delta run.
+        if item.get("content_hash") and (row["wp_media_id"] or not item.get("image_rel")):
+            client.request("POST", f"/wp/v2/posts/{pid}", json_body={"meta": {HASH_META_KEY: item["content_hash"]}})
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def run_rest_publish(
+    job_id: str,
+    job_dir: Path,
+    items: List[dict],
+    base_url: str,
+    username: str,
+    app_password: str,
+    workers: int = 0,
+    force: bool = False,
+    pool: Optional[ConnectionPool] = None,
+) -> dict:
+    workers = workers or int(os.getenv("WP_REST_WORKERS", "4"))
+    client = WordPressRestClient(
+        base_url,
+        username,
+        app_password,
+        timeout=int(os.getenv("WP_REST_TIMEOUT_SECONDS", "120")),
+        attempts=int(os.getenv("WP_REST_ATTEMPTS", "4")),
+        pool=pool,
+    )
+    remote_map = RemotePostMap(client)
+    items, diff = apply_delta(job_dir, items, remote_map.content_hashes, force=force)
+    images_reused = reuse_known_images(job_dir, items, remote_map.attachment_by_sha256)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # map() keeps results in job order regardless of completion order.
+        results = list(executor.map(lambda it: publish_item(client, remote_map, job_dir, it), items))
+
+    result = {
+        "job_id": job_id,
+        "backend": "rest",
+        "total": len(items),
+        "skipped_unchanged": diff["skipped_unchanged"],
+        "images_reused": images_reused,
+        "ok": len([r for r in results if not r["error"]]),
+        "failed": len([r for r in results if r["error"]]),
+        "results": results,
+        "finished_at": now_iso(),
+    }
+    write_json(job_dir / "publish_results_remote.json", result)
+    observe_publish("rest", results)
+    PUBLISH.inc(diff["skipped_unchanged"], backend="rest", outcome="skipped_unchanged")
+    return result
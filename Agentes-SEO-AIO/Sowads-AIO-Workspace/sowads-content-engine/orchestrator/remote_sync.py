@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import os
+import shlex
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Set
+
+from publish_delta import file_sha256
+from ssh_session import SshSession
+
+
+CACHE_DIR_NAME = ".cas"
+MANIFEST_NAME = ".sync_manifest.tsv"
+# Keeps each `test -f` probe command well below the remote ARG_MAX.
+PROBE_CHUNK = 400
+
+
+def build_manifest(job_dir: Path) -> Dict[str, str]:
+    manifest: Dict[str, str] = {}
+    for path in sorted(job_dir.rglob("*")):
+        if path.is_file():
+            rel = path.relative_to(job_dir).as_posix()
+            if rel == MANIFEST_NAME or any(c in rel for c in "\t\n\r"):
+                continue
+            manifest[rel] = file_sha256(path)
+    return manifest
+
+
+def missing_remote_objects(ssh: SshSession, cache_dir: str, hashes: List[str]) -> Set[str]:
+    missing: Set[str] = set()
+    for i in range(0, len(hashes), PROBE_CHUNK):
+        chunk = hashes[i : i + PROBE_CHUNK]
+        script = (
+            f"mkdir -p {shlex.quote(cache_dir)} && cd {shlex.quote(cache_dir)} && "
+            f"for h in {' '.join(chunk)}; do [ -f \"$h\" ] || echo \"MISSING|$h\"; done; echo PROBE_DONE"
+        )
+        output = ssh.run(script, timeout=600)
+        if "PROBE_DONE" not in output:
+            # Output got lost: resending is always safe, trusting an empty answer is not.
+            missing.update(chunk)
+            continue
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith("MISSING|"):
+                missing.add(line.split("|", 1)[1])
+    return missing
+
+
+def sync_job_dir(ssh: SshSession, job_dir: Path, remote_root: str, remote_job: str) -> dict:
+    """Materialize job_dir at remote_job, sending only files whose sha256 is not in the remote cache.
+
+    The remote side keeps `{remote_root}/.cas/<sha256>` across jobs; the job directory is
+    rebuilt from hard links into it, so cleaning up the job never empties the cache.
+    """
+    cache_dir = f"{remote_root}/{CACHE_DIR_NAME}"
+    manifest = build_manifest(job_dir)
+    unique = sorted(set(manifest.values()))
+    missing = missing_remote_objects(ssh, cache_dir, unique)
+
+    by_hash = {sha: rel for rel, sha in manifest.items()}
+    (job_dir / MANIFEST_NAME).write_text(
+        "".join(f"{sha} {rel}\n" for rel, sha in manifest.items()), encoding="utf-8"
+    )
+    sent_bytes = 0
+    fd, tar_name = tempfile.mkstemp(prefix="sowads-sync-", suffix=".tar.gz")
+    os.close(fd)
+    tar_path = Path(tar_name)
+    try:
+        with tarfile.open(tar_path, "w:gz", compresslevel=6) as tar:
+            tar.add(job_dir / MANIFEST_NAME, arcname=MANIFEST_NAME)
+            for sha in sorted(missing):
+                src = job_dir / by_hash[sha]
+                sent_bytes += src.stat().st_size
+                tar.add(src, arcname=f"objects/{sha}")
+
+        keep_days = int(os.getenv("WP_SYNC_CACHE_DAYS", "30") or 0)
+        job_q = shlex.quote(remote_job)
+        cache_q = shlex.quote(cache_dir)
+        script = "\n".join(
+            [
+                "set -e",
+                f"mkdir -p {cache_q} {job_q}",
+                f"cd {job_q}",
+                "tar -xzf -",
+                # Objects enter the cache only after the whole archive was extracted.
+                f"if [ -d objects ]; then mv -f objects/* {cache_q}/; rm -rf objects; fi",
+                "while read -r sha rel; do",
+                "  mkdir -p \"$(dirname \"$rel\")\"",
+                f"  ln -f {cache_q}/\"$sha\" \"$rel\" 2>/dev/null || cp -f {cache_q}/\"$sha\" \"$rel\"",
+                f"  touch {cache_q}/\"$sha\"",
+                f"done < {MANIFEST_NAME}",
+                f"rm -f {MANIFEST_NAME}",
+            ]
+            + ([f"find {cache_q} -type f -mtime +{keep_days} -delete 2>/dev/null || true"] if keep_days > 0 else [])
+        )
+        archive_bytes = tar_path.stat().st_size
+        # /tmp, not remote_root: on a fresh host the password fallback copies before the script's mkdir.
+        ssh.run_with_stdin(script, tar_path, f"/tmp/{tar_path.name}", timeout=1800)
+    finally:
+        tar_path.unlink(missing_ok=True)
+        (job_dir / MANIFEST_NAME).unlink(missing_ok=True)
+
+    return {
+        "files": len(manifest),
+        "unique_objects": len(unique),
+        "sent_objects": len(missing),
+        "cached_objects": len(unique) - len(missing),
+        "sent_bytes": sent_bytes,
+        "archive_bytes": archive_bytes,
+    }
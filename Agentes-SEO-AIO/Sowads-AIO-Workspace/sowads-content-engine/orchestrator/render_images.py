@@ -7,6 +7,7 @@ import json
 import os
 import posixpath
 import re
+import shutil
 import time
 from datetime import datetime, timezone
 from pathlib import Path
@@ -16,19 +17,25 @@ import urllib.error
 import urllib.parse
 import urllib.request
 
+from image_checks import ImagePrescreen, downscale_for_validation
+from image_hash_index import PerceptualHashIndex
+from image_manifest import ImageManifestIndex
+from log_store import append_log, exit_on_sigterm
+from metrics import IMAGE_REJECTS, IMAGES, MODEL_RETRIES, RATE_LIMIT_WAIT_SECONDS, observe_call, serve_from_env
+from prompt_segments import append_call_log
+
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
-def ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
+def log_model_call(log_file: Path, record: dict) -> None:
+    observe_call(record)
+    append_call_log(log_file, record)
 
 
-def append_jsonl(path: Path, obj: dict) -> None:
-    ensure_dir(path.parent)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+def ensure_dir(path: Path) -> None:
+    path.mkdir(parents=True, exist_ok=True)
 
 
 def write_csv(path: Path, rows: List[dict], columns: List[str]) -> None:
@@ -91,10 +98,92 @@ def ext_from_url(url: str, fallback: str = "png") -> str:
     return fallback
 
 
-def download_bytes(url: str, timeout: int = 240, headers: Optional[Dict[str, str]] = None) -> bytes:
-    req = urllib.request.Request(url, headers=headers or {})
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return resp.read()
+STREAM_CHUNK_BYTES = 64 * 1024
+_B64_WHITESPACE = str.maketrans("", "", " \t\r\n\v\f")
+
+
+def max_image_bytes() -> int:
+    return int(os.getenv("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+
+
+def _hash_existing(path: Path) -> "hashlib._Hash":
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h
+
+
+def download_to_file(
+    url: str,
+    dest: Path,
+    timeout: int = 240,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: int = 0,
+    attempts: int = 3,
+) -> Tuple[str, int]:
+    # Streams to `dest.part` while hashing; on a dropped connection the next attempt
+    # resumes with a Range request (or restarts if the server ignores it).
+    max_bytes = max_bytes or max_image_bytes()
+    tmp = dest.with_name(dest.name + ".part")
+    tmp.unlink(missing_ok=True)
+    last_err: Optional[Exception] = None
+    for attempt in range(1, max(1, attempts) + 1):
+        offset = tmp.stat().st_size if tmp.exists() else 0
+        req_headers = dict(headers or {})
+        if offset:
+            req_headers["Range"] = f"bytes={offset}-"
+        req = urllib.request.Request(url, headers=req_headers)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                resumed = offset > 0 and int(getattr(resp, "status", 200)) == 206
+                h = _hash_existing(tmp) if resumed else hashlib.sha256()
+                size = offset if resumed else 0
+                with tmp.open("ab" if resumed else "wb") as out:
+                    while True:
+                        chunk = resp.read(STREAM_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise ValueError(f"Imagem excede limite de {max_bytes} bytes: {url}")
+                        h.update(chunk)
+                        out.write(chunk)
+            tmp.replace(dest)
+            return h.hexdigest(), size
+        except ValueError:
+            tmp.unlink(missing_ok=True)
+            raise
+        except Exception as e:
+            last_err = e
+            if attempt < attempts:
+                time.sleep(1.0 * attempt)
+    tmp.unlink(missing_ok=True)
+    raise RuntimeError(f"Download de imagem falhou após {attempts} tentativas: {last_err}")
+
+
+def decode_b64_to_file(data_b64: str, dest: Path, max_bytes: int = 0) -> Tuple[str, int]:
+    # Decodes in 4-char aligned slices so the decoded image never sits fully in memory twice.
+    # Line breaks can show up anywhere (wrapped payloads), and a stray one would shift the slices.
+    max_bytes = max_bytes or max_image_bytes()
+    data_b64 = data_b64.translate(_B64_WHITESPACE)
+    if len(data_b64) * 3 // 4 > max_bytes + 2:
+        raise ValueError(f"Imagem excede limite de {max_bytes} bytes")
+    tmp = dest.with_name(dest.name + ".part")
+    h = hashlib.sha256()
+    size = 0
+    step = STREAM_CHUNK_BYTES * 4 // 3 // 4 * 4
+    try:
+        with tmp.open("wb") as out:
+            for i in range(0, len(data_b64), step):
+                chunk = base64.b64decode(data_b64[i : i + step])
+                size += len(chunk)
+                h.update(chunk)
+                out.write(chunk)
+        tmp.replace(dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return h.hexdigest(), size
 
 
 def extract_first_json_object(text: str) -> Optional[dict]:
@@ -130,6 +219,8 @@ class GeminiImageValidator:
         self.min_relevance_score = int(os.getenv("IMAGE_VALIDATION_MIN_RELEVANCE", "60"))
         self.min_business_score = int(os.getenv("IMAGE_VALIDATION_MIN_BUSINESS_SCENE", "40"))
         self.max_detected_text_chars = int(os.getenv("IMAGE_VALIDATION_MAX_DETECTED_TEXT_CHARS", "80"))
+        # Longest side sent to the vision model; the full-size file is what gets saved/published.
+        self.max_side = int(os.getenv("IMAGE_VALIDATION_MAX_SIDE", "768"))
 
         default_input = float(os.getenv("GEMINI_INPUT_COST_PER_1M_USD", "0.0"))
         default_output = float(os.getenv("GEMINI_OUTPUT_COST_PER_1M_USD", "0.0"))
@@ -210,12 +301,13 @@ class GeminiImageValidator:
 
         endpoint = f"{self.api_base}/models/{self.model}:generateContent?key={urllib.parse.quote(self.api_key)}"
         text_prompt = self._compose_validation_prompt(article_title, keyword, prompt_used)
+        sent_bytes, sent_mime = downscale_for_validation(image_bytes, mime_type, self.max_side)
         payload = {
             "contents": [
                 {
                     "parts": [
                         {"text": text_prompt},
-                        {"inlineData": {"mimeType": mime_type, "data": base64.b64encode(image_bytes).decode("ascii")}},
+                        {"inlineData": {"mimeType": sent_mime, "data": base64.b64encode(sent_bytes).decode("ascii")}},
                     ]
                 }
             ],
@@ -310,7 +402,7 @@ class GeminiImageValidator:
                 error_text = f"Validation parse error: {e}"
 
         latency_ms = int((time.time() - t0) * 1000)
-        append_jsonl(
+        log_model_call(
             self.gemini_log_file,
             {
                 "timestamp": started_at,
@@ -331,6 +423,8 @@ class GeminiImageValidator:
                     "prompt_text": text_prompt,
                     "image_sha256": hashlib.sha256(image_bytes).hexdigest(),
                     "mime_type": mime_type,
+                    "sent_bytes": len(sent_bytes),
+                    "sent_mime_type": sent_mime,
                 },
                 "response_raw": raw_body,
                 "response_text": response_text,
@@ -417,7 +511,7 @@ class GeminiImageRenderer:
             status_code = int(getattr(e, "code", 0) or 0)
             raw_body = e.read().decode("utf-8", errors="replace")
             latency_ms = int((time.time() - t0) * 1000)
-            append_jsonl(
+            log_model_call(
                 self.gemini_log_file,
                 {
                     "timestamp": started_at,
@@ -447,7 +541,7 @@ class GeminiImageRenderer:
             raise RuntimeError(f"Gemini HTTP {status_code}: {raw_body}") from e
         except urllib.error.URLError as e:
             latency_ms = int((time.time() - t0) * 1000)
-            append_jsonl(
+            log_model_call(
                 self.gemini_log_file,
                 {
                     "timestamp": started_at,
@@ -481,7 +575,7 @@ class GeminiImageRenderer:
         candidates = data.get("candidates", [])
         if not candidates:
             latency_ms = int((time.time() - t0) * 1000)
-            append_jsonl(
+            log_model_call(
                 self.gemini_log_file,
                 {
                     "timestamp": started_at,
@@ -522,7 +616,7 @@ class GeminiImageRenderer:
 
         response_text = "\n".join([t for t in text_parts if t]).strip()
         latency_ms = int((time.time() - t0) * 1000)
-        append_jsonl(
+        log_model_call(
             self.gemini_log_file,
             {
                 "timestamp": started_at,
@@ -628,6 +722,8 @@ class ReplicateImageRenderer:
                         retry_after = int(body_obj.get("retry_after", 5))
                     except Exception:
                         retry_after = 5
+                    MODEL_RETRIES.inc(provider="replicate", phase="image-generation", reason="http_429")
+                    RATE_LIMIT_WAIT_SECONDS.observe(max(1, retry_after), source="replicate_429")
                     time.sleep(max(1, retry_after))
                     continue
                 error_text = f"Replicate HTTP {create_http_status}"
@@ -703,45 +799,44 @@ class ReplicateImageRenderer:
                 error_text = "Replicate returned no output image URL"
 
         latency_ms = int((time.time() - t0) * 1000)
-        append_jsonl(
-            self.replicate_log_file,
-            {
-                "timestamp": started_at,
-                "completed_at": now_iso(),
-                "latency_ms": latency_ms,
-                "provider": "replicate",
-                "model": self.model,
-                "version_id": self.version,
-                "phase": "image-generation",
-                "agent": "agent_05_image_render",
-                "batch_id": batch_id,
-                "id": item_id,
-                "prediction_id": prediction_id,
-                "poll_count": poll_count,
-                "http_status_code": final_http_status or create_http_status,
-                "success": not bool(error_text),
-                "endpoint": create_endpoint,
-                "request": {
-                    "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
-                    "prompt_text": prompt,
-                    "payload": create_payload,
-                },
-                "response_raw": {
-                    "create": create_body,
-                    "final": final_body,
-                },
-                "response_text": status,
-                "usage_metadata": {},
-                "cost_estimate": {
-                    "estimated_cost_usd": round(self.cost_per_image * len(output_urls), 8),
-                    "cost_per_image_usd": self.cost_per_image,
-                    "images_count": len(output_urls),
-                    "estimated_by_heuristic": False,
-                    "pricing_configured": self.cost_per_image > 0.0,
-                },
-                "error": error_text,
+        record = {
+            "timestamp": started_at,
+            "completed_at": now_iso(),
+            "latency_ms": latency_ms,
+            "provider": "replicate",
+            "model": self.model,
+            "version_id": self.version,
+            "phase": "image-generation",
+            "agent": "agent_05_image_render",
+            "batch_id": batch_id,
+            "id": item_id,
+            "prediction_id": prediction_id,
+            "poll_count": poll_count,
+            "http_status_code": final_http_status or create_http_status,
+            "success": not bool(error_text),
+            "endpoint": create_endpoint,
+            "request": {
+                "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+                "prompt_text": prompt,
+                "payload": create_payload,
             },
-        )
+            "response_raw": {
+                "create": create_body,
+                "final": final_body,
+            },
+            "response_text": status,
+            "usage_metadata": {},
+            "cost_estimate": {
+                "estimated_cost_usd": round(self.cost_per_image * len(output_urls), 8),
+                "cost_per_image_usd": self.cost_per_image,
+                "images_count": len(output_urls),
+                "estimated_by_heuristic": False,
+                "pricing_configured": self.cost_per_image > 0.0,
+            },
+            "error": error_text,
+        }
+        observe_call(record)
+        append_log(self.replicate_log_file, record)
 
         if error_text:
             raise RuntimeError(error_text)
@@ -758,6 +853,7 @@ def render_from_csv(
     limit: int = 0,
     validate_images: bool = True,
     max_attempts: int = 3,
+    merge_manifest: bool = False,
 ) -> dict:
     if not csv_path.exists():
         raise SystemExit(f"CSV de prompts não encontrado: {csv_path}")
@@ -788,21 +884,28 @@ def render_from_csv(
     else:
         raise SystemExit(f"Provider não suportado: {provider}. Use gemini|replicate")
     validator = GeminiImageValidator(base)
+    prescreen = ImagePrescreen()
+    phash_index = PerceptualHashIndex(base)
+    image_index = ImageManifestIndex(base)
     if validate_images and validator.enabled and not validator.api_key:
         raise SystemExit("Validação de imagens ativa, mas GEMINI_API_KEY não está configurada.")
 
-    def image_part_to_bytes(part: dict) -> Tuple[bytes, str, str]:
+    def materialize_image_part(part: dict, dest_stem: Path) -> dict:
+        # Streams the part straight to disk (decode/download) so attempts are written once
+        # and later stages copy files instead of re-decoding or re-downloading.
         if part.get("data_b64"):
             mime_type = part.get("mime_type", "image/png")
             ext = ext_from_mime(mime_type)
-            img_bytes = base64.b64decode(part.get("data_b64", ""))
-            return img_bytes, ext, mime_type
-        if part.get("url"):
+            dest = dest_stem.with_name(f"{dest_stem.name}.{ext}")
+            sha, size = decode_b64_to_file(str(part.get("data_b64", "")), dest)
+        elif part.get("url"):
             ext = ext_from_url(str(part.get("url")), fallback=getattr(renderer, "output_format", "webp"))
-            img_bytes = download_bytes(str(part.get("url")))
-            mime = "image/webp" if ext == "webp" else ("image/jpeg" if ext == "jpg" else "image/png")
-            return img_bytes, ext, mime
-        raise RuntimeError("Formato de retorno de imagem não reconhecido")
+            mime_type = "image/webp" if ext == "webp" else ("image/jpeg" if ext == "jpg" else "image/png")
+            dest = dest_stem.with_name(f"{dest_stem.name}.{ext}")
+            sha, size = download_to_file(str(part.get("url")), dest)
+        else:
+            raise RuntimeError("Formato de retorno de imagem não reconhecido")
+        return {"path": dest, "ext": ext, "mime_type": mime_type, "sha256": sha, "size": size}
 
     manifest_rows: List[dict] = []
     ok = 0
@@ -820,7 +923,7 @@ def render_from_csv(
         if negative_prompt:
             full_prompt = f"{prompt}\n\nNegative prompt: {negative_prompt}"
 
-        existing = list(out_dir.glob(f"{item_id}_*.png")) + list(out_dir.glob(f"{item_id}_*.jpg")) + list(out_dir.glob(f"{item_id}_*.webp"))
+        existing = image_index.files_for(batch_id, item_id)
         if existing and not overwrite:
             manifest_rows.append(
                 {
@@ -829,11 +932,12 @@ def render_from_csv(
                     "slug": slug,
                     "status": "skipped_exists",
                     "images_saved": len(existing),
-                    "primary_image": existing[0].name,
+                    "primary_image": existing[0],
                     "output_dir": str(out_dir),
                     "error": "",
                 }
             )
+            IMAGES.inc(provider=provider, outcome="skipped_exists")
             continue
 
         try:
@@ -842,6 +946,8 @@ def render_from_csv(
             final_parts: List[dict] = []
             last_generated_parts: List[dict] = []
             used_soft_fallback = False
+            prescreen_rejects = 0
+            duplicate_rejects = 0
             active_prompt = full_prompt
 
             for attempt in range(1, max(1, max_attempts) + 1):
@@ -849,40 +955,70 @@ def render_from_csv(
                 image_parts, _meta = renderer.generate(active_prompt, batch_id=batch_id, item_id=item_id)
                 if not image_parts:
                     raise RuntimeError("Modelo não retornou imagem")
-                last_generated_parts = image_parts
 
                 # Keep every generated attempt (for later manual/automated curation).
+                attempt_files: List[dict] = []
                 for idx, part in enumerate(image_parts, start=1):
                     try:
-                        img_bytes_attempt, ext_attempt, _mime_attempt = image_part_to_bytes(part)
-                        attempt_name = f"{item_id}_a{attempt:02d}_{idx:02d}.{ext_attempt}"
-                        (all_attempts_dir / attempt_name).write_bytes(img_bytes_attempt)
-                        (batch_attempts_dir / attempt_name).write_bytes(img_bytes_attempt)
+                        f = materialize_image_part(part, all_attempts_dir / f"{item_id}_a{attempt:02d}_{idx:02d}")
+                        shutil.copyfile(f["path"], batch_attempts_dir / f["path"].name)
+                        attempt_files.append(f)
                     except Exception:
-                        pass
+                        if idx == 1:
+                            raise
+                        continue
+                image_parts = None  # drop the base64 payload before validation
+                last_generated_parts = attempt_files
 
                 if not validate_images:
-                    final_parts = image_parts
+                    final_parts = attempt_files
                     break
 
-                first_bytes, _first_ext, first_mime = image_part_to_bytes(image_parts[0])
-                keyword = (row.get("keyword_primaria") or "").strip()
-                verdict = validator.validate(
-                    image_bytes=first_bytes,
-                    mime_type=first_mime,
-                    batch_id=batch_id,
-                    item_id=item_id,
-                    article_title=article_title,
-                    keyword=keyword,
-                    prompt_used=active_prompt,
-                )
+                first_bytes = attempt_files[0]["path"].read_bytes()
+                first_mime = attempt_files[0]["mime_type"]
+                screen = prescreen.check(first_bytes)
+                dupes = phash_index.find_duplicates(first_bytes, exclude_item_id=item_id) if screen.get("pass") else []
+                if not screen.get("pass"):
+                    # Obvious reject: retry right away without spending a vision call.
+                    prescreen_rejects += 1
+                    IMAGE_REJECTS.inc(provider=provider, reason="prescreen")
+                    verdict = {
+                        "pass": False,
+                        "issues": screen.get("issues") or [],
+                        "correction_prompt": screen.get("correction_prompt", ""),
+                    }
+                elif dupes:
+                    duplicate_rejects += 1
+                    IMAGE_REJECTS.inc(provider=provider, reason="duplicate")
+                    verdict = {
+                        "pass": False,
+                        "issues": [f"near_duplicate_image:{d['item_id']}:{d['distance']}" for d in dupes[:3]],
+                        "correction_prompt": (
+                            "Use a clearly different setting, camera angle, subject arrangement and color balance "
+                            "from previously published featured images."
+                        ),
+                    }
+                else:
+                    keyword = (row.get("keyword_primaria") or "").strip()
+                    verdict = validator.validate(
+                        image_bytes=first_bytes,
+                        mime_type=first_mime,
+                        batch_id=batch_id,
+                        item_id=item_id,
+                        article_title=article_title,
+                        keyword=keyword,
+                        prompt_used=active_prompt,
+                    )
 
+                first_bytes = b""
                 if verdict.get("pass"):
-                    final_parts = image_parts
+                    final_parts = attempt_files
                     validation_issues = verdict.get("issues") or []
                     break
 
                 validation_issues = verdict.get("issues") or []
+                if screen.get("pass") and not dupes:
+                    IMAGE_REJECTS.inc(provider=provider, reason="validation")
                 correction = str(verdict.get("correction_prompt", "")).strip()
                 correction_chunks: List[str] = []
                 if correction:
@@ -914,14 +1050,26 @@ def render_from_csv(
                     )
 
             saved_files = []
-            for idx, part in enumerate(final_parts, start=1):
-                img_bytes, ext, _mime = image_part_to_bytes(part)
-                fname = f"{item_id}_{idx:02d}.{ext}"
+            primary_sha256 = ""
+            for idx, f in enumerate(final_parts, start=1):
+                fname = f"{item_id}_{idx:02d}.{f['ext']}"
                 p1 = out_dir / fname
                 p2 = batch_images_dir / fname
-                p1.write_bytes(img_bytes)
-                p2.write_bytes(img_bytes)
+                shutil.copyfile(f["path"], p1)
+                shutil.copyfile(f["path"], p2)
+                phash_index.add(p1)
+                if not primary_sha256:
+                    primary_sha256 = f["sha256"]
                 saved_files.append(fname)
+            phash_index.save()
+            image_index.record(
+                batch_id,
+                item_id,
+                saved_files,
+                sha256=primary_sha256,
+                status="success_soft" if used_soft_fallback else "success",
+            )
+            image_index.save()
 
             manifest_rows.append(
                 {
@@ -933,11 +1081,14 @@ def render_from_csv(
                     "primary_image": saved_files[0],
                     "output_dir": str(out_dir),
                     "attempts_used": attempts_used,
+                    "prescreen_rejects": prescreen_rejects,
+                    "duplicate_rejects": duplicate_rejects,
                     "validation_issues": " | ".join(validation_issues[:5]),
                     "error": "",
                 }
             )
             ok += 1
+            IMAGES.inc(provider=provider, outcome="success_soft" if used_soft_fallback else "success")
         except Exception as e:
             manifest_rows.append(
                 {
@@ -949,13 +1100,22 @@ def render_from_csv(
                     "primary_image": "",
                     "output_dir": str(out_dir),
                     "attempts_used": attempts_used if "attempts_used" in locals() else 0,
+                    "prescreen_rejects": prescreen_rejects if "prescreen_rejects" in locals() else 0,
+                    "duplicate_rejects": duplicate_rejects if "duplicate_rejects" in locals() else 0,
                     "validation_issues": " | ".join(validation_issues[:5]) if "validation_issues" in locals() else "",
                     "error": str(e),
                 }
             )
             fail += 1
+            IMAGES.inc(provider=provider, outcome="failed")
 
     manifest_csv = out_dir / f"{batch_id}_images_manifest.csv"
+    if merge_manifest and manifest_csv.exists():
+        # Per-article renders of the same batch (streamed pipeline) keep the other ids' rows.
+        rendered = {r["id"] for r in manifest_rows}
+        with manifest_csv.open("r", encoding="utf-8", newline="") as f:
+            kept = [r for r in csv.DictReader(f) if r.get("id") not in rendered]
+        manifest_rows = kept + manifest_rows
     write_csv(
         manifest_csv,
         manifest_rows,
@@ -968,6 +1128,8 @@ def render_from_csv(
             "primary_image",
             "output_dir",
             "attempts_used",
+            "prescreen_rejects",
+            "duplicate_rejects",
             "validation_issues",
             "error",
         ],
@@ -1006,10 +1168,12 @@ def main():
     parser.add_argument("--no-validate", action="store_true", help="Desligar validação automática de imagem")
     parser.add_argument("--max-attempts", type=int, default=int(os.getenv("IMAGE_VALIDATION_MAX_ATTEMPTS", "3")), help="Máximo de tentativas de geração por prompt")
     args = parser.parse_args()
+    exit_on_sigterm()
 
     base = Path(args.base).resolve()
     load_env_file(base / ".env")
     load_env_file(base.parent / ".env")
+    serve_from_env()
 
     csv_paths: List[Path] = []
     if args.all:
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from log_store import get_store
+from prompt_segments import get_segment_store
+
+
+ORCH_DIR = Path(__file__).resolve().parent
+# Prompts per phase used to learn the phase's template lines.
+TEMPLATE_SAMPLE = 20
+TEMPLATE_MIN_LINE_CHARS = 12
+# Replicate latency when the logs have no replicate_calls.jsonl to replay.
+DEFAULT_REPLICATE_LATENCY_MS = 8000
+# Generated artifacts and secrets are not copied into the scratch project.
+COPY_SKIP = {".git", ".env", "outputs", "data/logs", "data/batches", "data/benchmarks", "data/profiles"}
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _template_lines(text: str) -> Set[str]:
+    return {ln.strip() for ln in text.splitlines() if len(ln.strip()) >= TEMPLATE_MIN_LINE_CHARS}
+
+
+def _gemini_body(row: dict) -> str:
+    raw = row.get("response_raw")
+    if isinstance(raw, str) and raw.strip():
+        return raw
+    # Older/compacted records: rebuild a minimal generateContent body from the parsed text.
+    return json.dumps(
+        {
+            "candidates": [{"content": {"parts": [{"text": str(row.get("response_text", "") or "")}]}}],
+            "usageMetadata": row.get("usage_metadata") or {},
+        },
+        ensure_ascii=False,
+    )
+
+
+def synthetic_png(seed: int, width: int = 1024, height: int = 576) -> bytes:
+    """Smooth, seed-unique 16:9 frame: passes the local prescreen and never collides in the hash index."""
+    rnd = random.Random(seed)
+    cols = bytearray()
+    waves = [(rnd.uniform(0.002, 0.02), rnd.uniform(0, 6.3), rnd.uniform(60, 110)) for _ in range(3)]
+    for x in range(width):
+        for f, p, amp in waves:
+            cols.append(int(128 + amp * math.sin(x * f + p)) & 0xFF)
+    cols = bytes(cols)
+    fy, py = rnd.uniform(0.004, 0.02), rnd.uniform(0, 6.3)
+    rows = []
+    for y in range(height):
+        shift = int(50 * math.sin(y * fy + py))
+        table = bytes(min(255, max(0, i + shift)) for i in range(256))
+        rows.append(b"\x00" + cols.translate(table))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b"")
+
+
+class ReplayBook:
+    """Recorded Gemini/Replicate calls served back in recorded order, per phase.
+
+    A request is matched by prompt hash when the exact prompt was recorded; otherwise its
+    phase is inferred (image parts → image-validation, IMAGE modality → image-generation,
+    else the phase whose template lines it shares most) and the next recorded response of
+    that phase is returned, cycling when the recording runs out.
+    """
+
+    def __init__(self, latency_scale: float = 1.0):
+        self.latency_scale = max(0.0, float(latency_scale))
+        self.by_phase: Dict[str, List[dict]] = {}
+        self.exact: Dict[str, dict] = {}
+        self.model_phases: Dict[str, Set[str]] = {}
+        self.templates: Dict[str, Set[str]] = {}
+        self.replicate_latency_ms: List[int] = []
+        self.served: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._cursor: Counter = Counter()
+        self._predictions: Dict[str, Tuple[float, int]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls,
+        logs_dir: Path,
+        batch_id: str = "",
+        latency_scale: float = 1.0,
+        max_per_phase: int = 200,
+        replay_errors: bool = False,
+    ) -> "ReplayBook":
+        book = cls(latency_scale)
+        gemini_log = logs_dir / "gemini_calls.jsonl"
+        segments = get_segment_store(gemini_log)
+        samples: Dict[str, List[Set[str]]] = {}
+        for row in get_store(gemini_log).iter_records(batch_id=batch_id or None):
+            success = bool(row.get("success", False))
+            if not success and not replay_errors:
+                continue
+            phase = str(row.get("phase", "") or "")
+            entries = book.by_phase.setdefault(phase, [])
+            if len(entries) >= max_per_phase:
+                continue
+            entry = {
+                "status": int(row.get("http_status_code", 0) or 0) or (200 if success else 500),
+                "body": _gemini_body(row) if success else str(row.get("response_raw", "") or "{}"),
+                "latency_ms": int(row.get("latency_ms", 0) or 0),
+            }
+            entries.append(entry)
+            book.model_phases.setdefault(str(row.get("model", "") or ""), set()).add(phase)
+            request = row.get("request") or {}
+            if success and request.get("prompt_sha256"):
+                book.exact.setdefault(request["prompt_sha256"], entry)
+            if phase not in {"image-generation", "image-validation"} and len(samples.get(phase, [])) < TEMPLATE_SAMPLE:
+                try:
+                    samples.setdefault(phase, []).append(_template_lines(segments.expand(request)))
+                except OSError:
+                    pass
+        for phase, sets in samples.items():
+            counts = Counter(line for s in sets for line in s)
+            need = max(1, len(sets) // 2)
+            book.templates[phase] = {line for line, n in counts.items() if n >= need} or set().union(*sets)
+
+        for row in get_store(logs_dir / "replicate_calls.jsonl").iter_records(batch_id=batch_id or None):
+            if row.get("success") and len(book.replicate_latency_ms) < max_per_phase:
+                book.replicate_latency_ms.append(int(row.get("latency_ms", 0) or 0))
+        return book
+
+    def classify(self, model: str, payload: dict, prompt: str) -> str:
+        parts = [p for c in payload.get("contents", []) for p in c.get("parts", []) if isinstance(p, dict)]
+        if any("inlineData" in p for p in parts):
+            return "image-validation"
+        if "IMAGE" in ((payload.get("generationConfig") or {}).get("responseModalities") or []):
+            return "image-generation"
+        phases = [p for p in self.model_phases.get(model, ()) if p in self.templates] or list(self.templates)
+        if len(phases) <= 1:
+            return phases[0] if phases else ""
+        lines = _template_lines(prompt)
+        return max(phases, key=lambda ph: len(lines & self.templates[ph]) / float(len(self.templates[ph]) or 1))
+
+    def gemini(self, model: str, payload: dict) -> Tuple[str, Optional[dict]]:
+        prompt = "".join(
+            str(p.get("text", "")) for c in payload.get("contents", []) for p in c.get("parts", []) if isinstance(p, dict)
+        )
+        entry = self.exact.get(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        phase = self.classify(model, payload, prompt)
+        with self._lock:
+            if entry is None:
+                entries = self.by_phase.get(phase) or []
+                if entries:
+                    entry = entries[self._cursor[phase] % len(entries)]
+                    self._cursor[phase] += 1
+            if entry is None:
+                self.misses[phase or "unknown"] += 1
+            else:
+                self.served[phase] += 1
+        return phase, entry
+
+    def create_prediction(self) -> str:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            recorded = self.replicate_latency_ms
+            latency_ms = recorded[(seq - 1) % len(recorded)] if recorded else DEFAULT_REPLICATE_LATENCY_MS
+            pred_id = f"replay{seq:06d}"
+            self._predictions[pred_id] = (time.monotonic() + latency_ms * self.latency_scale / 1000.0, seq)
+            self.served["replicate-prediction"] += 1
+        return pred_id
+
+    def prediction(self, pred_id: str) -> Optional[Tuple[bool, int]]:
+        with self._lock:
+            item = self._predictions.get(pred_id)
+        if item is None:
+            return None
+        ready_at, seq = item
+        return time.monotonic() >= ready_at, seq
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "recorded": {phase: len(v) for phase, v in sorted(self.by_phase.items())},
+                "recorded_replicate": len(self.replicate_latency_ms),
+                "served": dict(sorted(self.served.items())),
+                "misses": dict(sorted(self.misses.items())),
+            }
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def book(self) -> ReplayBook:
+        return self.server.book  # type: ignore[attr-defined]
+
+    def _send(self, code: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, obj: dict) -> None:
+        self._send(code, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def do_POST(self):  # noqa: N802
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        except Exception:
+            payload = {}
+        if path.endswith(":generateContent"):
+            model = path.rsplit("/models/", 1)[-1].split(":", 1)[0]
+            phase, entry = self.book.gemini(model, payload)
+            if entry is None:
+                self._json(404, {"error": {"code": 404, "message": f"replay: no recorded response for phase '{phase}'"}})
+                return
+            time.sleep(entry["latency_ms"] * self.book.latency_scale / 1000.0)
+            self._send(entry["status"], entry["body"].encode("utf-8"))
+            return
+        if path.endswith("/predictions"):
+            pred_id = self.book.create_prediction()
+            self._json(201, {"id": pred_id, "status": "starting", "output": None, "error": None})
+            return
+        self._json(404, {"error": "not found"})
+
+    def do_GET(self):  # noqa: N802
+        path = self.path.split("?", 1)[0]
+        m = re.search(r"/predictions/([\w-]+)$", path)
+        if m:
+            state = self.book.prediction(m.group(1))
+            if state is None:
+                self._json(404, {"detail": "Not found."})
+                return
+            ready, _seq = state
+            if not ready:
+                self._json(200, {"id": m.group(1), "status": "processing", "output": None, "error": None})
+                return
+            host = self.headers.get("Host", f"127.0.0.1:{self.server.server_address[1]}")
+            self._json(200, {"id": m.group(1), "status": "succeeded", "output": [f"http://{host}/files/{m.group(1)}.png"], "error": None})
+            return
+        m = re.search(r"/files/([\w-]+)\.png$", path)
+        if m:
+            state = self.book.prediction(m.group(1))
+            if state is None:
+                self._json(404, {"detail": "Not found."})
+                return
+            self._send(200, synthetic_png(state[1]), "image/png")
+            return
+        self._json(404, {"error": "not found"})
+
+    def log_message(self, format, *args):  # noqa: A002
+        return
+
+
+def start_server(book: ReplayBook, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _ReplayHandler)
+    server.daemon_threads = True
+    server.book = book  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, name="replay-http", daemon=True).start()
+    return server
+
+
+def replay_env(url: str) -> Dict[str, str]:
+    """Env that points run_pipeline/render_images at the stand-in (and never at a real WordPress)."""
+    return {
+        "GEMINI_API_BASE": f"{url}/v1beta",
+        "GEMINI_API_KEY": "replay",
+        "REPLICATE_API_BASE": f"{url}/v1",
+        "REPLICATE_API_TOKEN": "replay",
+        "WP_PUBLISH_BACKEND": "",
+        "METRICS_PORT": "",
+    }
+
+
+def prepare_work_dir(base: Path, work_dir: str) -> Path:
+    work = Path(work_dir).resolve() if work_dir else Path(tempfile.mkdtemp(prefix="sowads-replay-"))
+
+    def ignore(src: str, names: List[str]) -> List[str]:
+        rel = Path(src).resolve().relative_to(base)
+        return [n for n in names if n == "__pycache__" or (rel / n).as_posix() in COPY_SKIP]
+
+    shutil.copytree(base, work, ignore=ignore, dirs_exist_ok=True)
+    return work
+
+
+def run_stage(cmd: List[str], env: Dict[str, str], out_path: Path) -> dict:
+    """Run one child process and return wall time plus its own CPU time and peak RSS."""
+    t0 = time.perf_counter()
+    with out_path.open("w", encoding="utf-8") as out, out_path.with_suffix(".err").open("w", encoding="utf-8") as err:
+        proc = subprocess.Popen(cmd, env=env, stdout=out, stderr=err)
+        _pid, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "rc": proc.returncode,
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "cpu_user_s": round(usage.ru_utime, 3),
+        "cpu_sys_s": round(usage.ru_stime, 3),
+        "max_rss_mb": round(usage.ru_maxrss / 1024.0, 1),
+    }
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        text = path.read_text(encoding="utf-8")
+        return json.loads(text[text.index("{") :]) if "{" in text else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def trace_phases(path: Path) -> Dict[str, float]:
+    """Seconds per phase span (plus `batch`) from a Chrome trace written by trace_spans.Tracer."""
+    try:
+        text = path.read_text(encoding="utf-8").rstrip().rstrip(",")
+    except OSError:
+        return {}
+    if not text.endswith("]"):
+        text += "\n]"
+    try:
+        events = json.loads(text)
+    except ValueError:
+        return {}
+    stacks: Dict[Tuple[int, int], List[dict]] = {}
+    out: Dict[str, float] = {}
+    for e in events:
+        key = (e.get("pid", 0), e.get("tid", 0))
+        if e.get("ph") == "B":
+            stacks.setdefault(key, []).append(e)
+        elif e.get("ph") == "E" and stacks.get(key):
+            b = stacks[key].pop()
+            if b.get("cat") in {"phase", "batch"}:
+                out[b["name"]] = out.get(b["name"], 0.0) + (e["ts"] - b["ts"]) / 1e6
+    return out
+
+
+def _stats(values: List[float]) -> dict:
+    if not values:
+        return {"n": 0, "total_s": 0.0, "mean_s": 0.0, "p50_s": 0.0, "max_s": 0.0}
+    ordered = sorted(values)
+    return {
+        "n": len(values),
+        "total_s": round(sum(values), 3),
+        "mean_s": round(sum(values) / len(values), 3),
+        "p50_s": round(ordered[len(ordered) // 2], 3),
+        "max_s": round(ordered[-1], 3),
+    }
+
+
+class ReplayBench:
+    def __init__(self, work: Path, cfg: dict, env: Dict[str, str], args: argparse.Namespace):
+        self.work = work
+        self.cfg = cfg
+        self.env = env
+        self.args = args
+        self.stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        (work / "bench").mkdir(parents=True, exist_ok=True)
+
+    def run_job(self, i: int) -> dict:
+        batch_id = f"BATCH-bench-{self.stamp}-{i:02d}"
+        cfg = {**self.cfg, "batch_id": batch_id}
+        cfg_path = self.work / "bench" / f"{batch_id}.json"
+        cfg_path.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+        job = {"batch_id": batch_id, "stages": {}}
+
+        cmd = [sys.executable, str(ORCH_DIR / "run_pipeline.py"), "--base", str(self.work), "--config", str(cfg_path), "--trace"]
+        if self.args.scheduler:
+            cmd += ["--scheduler", self.args.scheduler]
+        job["stages"]["pipeline"] = run_stage(cmd, self.env, self.work / "bench" / f"{batch_id}.pipeline.out")
+        summary = _read_json(self.work / "data/batches" / batch_id / "summary.json")
+        job["articles"] = int(summary.get("items_total", 0) or 0)
+        job["approved"] = int(summary.get("approved", 0) or 0)
+        traces = sorted((self.work / "data/batches" / batch_id).glob("trace-*.json"))
+        job["phases"] = trace_phases(traces[-1]) if traces else {}
+
+        prompts_csv = self.work / "outputs/image-prompts" / f"{batch_id}_image_prompts.csv"
+        job["images"] = 0
+        if not self.args.skip_images and prompts_csv.exists():
+            cmd = [
+                sys.executable,
+                str(ORCH_DIR / "render_images.py"),
+                "--base",
+                str(self.work),
+                "--csv",
+                str(prompts_csv),
+                "--provider",
+                self.args.image_provider,
+            ]
+            if self.args.no_validate:
+                cmd.append("--no-validate")
+            out_path = self.work / "bench" / f"{batch_id}.render.out"
+            job["stages"]["render"] = run_stage(cmd, self.env, out_path)
+            runs = _read_json(out_path).get("runs") or [{}]
+            job["images"] = int(runs[0].get("success", 0) or 0)
+            job["images_failed"] = int(runs[0].get("failed", 0) or 0)
+        return job
+
+    def run(self) -> dict:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, self.args.concurrency)) as pool:
+            jobs = list(pool.map(self.run_job, range(1, self.args.runs + 1)))
+        wall = time.perf_counter() - t0
+
+        stages: Dict[str, dict] = {}
+        for name in ("pipeline", "render"):
+            rows = [j["stages"][name] for j in jobs if name in j["stages"]]
+            if not rows:
+                continue
+            stages[name] = {
+                **_stats([r["wall_s"] for r in rows]),
+                "cpu_s": round(sum(r["cpu_user_s"] + r["cpu_sys_s"] for r in rows), 3),
+                "max_rss_mb": max(r["max_rss_mb"] for r in rows),
+                "failed_runs": sum(1 for r in rows if r["rc"] != 0),
+            }
+        phase_names = sorted({p for j in jobs for p in j["phases"]})
+        phases = {p: _stats([j["phases"][p] for j in jobs if p in j["phases"]]) for p in phase_names}
+        cpu = sum(s["cpu_s"] for s in stages.values())
+        articles = sum(j["articles"] for j in jobs)
+        images = sum(j["images"] for j in jobs)
+        per_min = 60.0 / wall if wall else 0.0
+        return {
+            "generated_at": now_iso(),
+            "settings": {
+                "runs": self.args.runs,
+                "concurrency": self.args.concurrency,
+                "quantity": self.cfg.get("quantidade_temas"),
+                "scheduler": self.args.scheduler or self.cfg.get("scheduler", "barrier"),
+                "latency_scale": self.args.latency_scale,
+                "image_provider": "" if self.args.skip_images else self.args.image_provider,
+                "recording_batch_id": self.args.batch_id,
+                "work_dir": str(self.work),
+            },
+            "wall_s": round(wall, 3),
+            "throughput": {
+                "articles": articles,
+                "approved": sum(j["approved"] for j in jobs),
+                "images": images,
+                "articles_per_min": round(articles * per_min, 3),
+                "images_per_min": round(images * per_min, 3),
+            },
+            "resources": {
+                "cpu_s": round(cpu, 3),
+                "cpu_per_article_s": round(cpu / articles, 3) if articles else None,
+                "cpu_utilization": round(cpu / wall, 3) if wall else 0.0,
+                "max_rss_mb": max((s["max_rss_mb"] for s in stages.values()), default=0.0),
+            },
+            "stages": stages,
+            "phases": phases,
+            "jobs": jobs,
+        }
+
+
+def _print_table(report: dict) -> None:
+    s = report["settings"]
+    t = report["throughput"]
+    r = report["resources"]
+    print(f"Generated at: {report['generated_at']}")
+    print(
+        f"Runs: {s['runs']} (concorrência {s['concurrency']}, {s['quantity']} temas, {s['scheduler']}, "
+        f"latência x{s['latency_scale']}, imagens: {s['image_provider'] or '-'})"
+    )
+    print(f"Wall: {report['wall_s']}s | artigos={t['articles']} ({t['articles_per_min']}/min) aprovados={t['approved']} imagens={t['images']} ({t['images_per_min']}/min)")
+    print(f"CPU: {r['cpu_s']}s ({r['cpu_per_article_s']}s/artigo, utilização {r['cpu_utilization']}) | pico RSS {r['max_rss_mb']} MB")
+    header = f"{'STAGE/PHASE':<36} {'N':>4} {'MEAN_S':>9} {'P50_S':>9} {'MAX_S':>9} {'TOTAL_S':>10}"
+    print("")
+    print(header)
+    print("-" * len(header))
+    for name, st in list(report["stages"].items()) + list(report["phases"].items()):
+        print(f"{name:<36} {st['n']:>4} {st['mean_s']:>9} {st['p50_s']:>9} {st['max_s']:>9} {st['total_s']:>10}")
+    rp = report.get("replay") or {}
+    print("")
+    print(f"Replay servido: {json.dumps(rp.get('served', {}), ensure_ascii=False)}")
+    if rp.get("misses"):
+        print(f"Sem gravação (404): {json.dumps(rp['misses'], ensure_ascii=False)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta (run_pipeline + render_images) contra chamadas Gemini/Replicate gravadas")
+    parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]), help="Projeto com data/logs gravados")
+    parser.add_argument("--config", default="orchestrator/config.example.json")
+    parser.add_argument("--batch-id", default="", help="Reproduzir só as chamadas deste lote")
+    parser.add_argument("--runs", type=int, default=1, help="Execuções do pipeline")
+    parser.add_argument("--concurrency", type=int, default=1, help="Execuções simultâneas")
+    parser.add_argument("--quantity", type=int, default=None, help="Temas por execução")
+    parser.add_argument("--scheduler", default="", choices=["", "barrier", "stream"])
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplica a latência gravada (0 = sem espera)")
+    parser.add_argument("--max-per-phase", type=int, default=200, help="Respostas gravadas mantidas por fase")
+    parser.add_argument("--replay-errors", action="store_true", help="Reproduzir também respostas com erro (429/5xx) na ordem gravada")
+    parser.add_argument("--image-provider", default="replicate", choices=["gemini", "replicate"])
+    parser.add_argument("--skip-images", action="store_true", help="Não rodar render_images")
+    parser.add_argument("--no-validate", action="store_true", help="render_images sem validação Gemini")
+    parser.add_argument("--work-dir", default="", help="Cópia de trabalho do projeto (default: diretório temporário)")
+    parser.add_argument("--keep", action="store_true", help="Manter a cópia de trabalho")
+    parser.add_argument("--serve", action="store_true", help="Só subir o servidor de replay (uso manual)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--report-json", default="", help="Default: data/benchmarks/replay-<data>.json")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    base = Path(args.base).resolve()
+    book = ReplayBook.load(
+        base / "data/logs",
+        batch_id=args.batch_id,
+        latency_scale=args.latency_scale,
+        max_per_phase=args.max_per_phase,
+        replay_errors=args.replay_errors,
+    )
+    if not book.by_phase:
+        raise SystemExit(f"Nenhuma chamada Gemini gravada em {base / 'data/logs/gemini_calls.jsonl'}")
+    server = start_server(book, port=args.port)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    if args.serve:
+        for k, v in replay_env(url).items():
+            print(f"export {k}={v}")
+        print(json.dumps(book.stats(), ensure_ascii=False), file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return 0
+
+    cfg_path = Path(args.config)
+    if not cfg_path.is_absolute():
+        cfg_path = base / cfg_path
+    cfg = json.loads(cfg_path.read_text(encoding="utf-8"))
+    cfg["test_mode"] = False
+    cfg["publish_backend"] = "placeholder"
+    if args.quantity is not None:
+        cfg["quantidade_temas"] = args.quantity
+
+    work = prepare_work_dir(base, args.work_dir)
+    env = {**os.environ, **replay_env(url), "IMAGE_PROVIDER": args.image_provider}
+    server_cpu0 = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        report = ReplayBench(work, cfg, env, args).run()
+    finally:
+        server.shutdown()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+    server_cpu1 = resource.getrusage(resource.RUSAGE_SELF)
+    report["replay"] = {
+        **book.stats(),
+        "server_cpu_s": round((server_cpu1.ru_utime + server_cpu1.ru_stime) - (server_cpu0.ru_utime + server_cpu0.ru_stime), 3),
+    }
+
+    out_path = Path(args.report_json) if args.report_json else base / "data/benchmarks" / f"replay-{report['generated_at'][:19].replace(':', '')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_table(report)
+        print(f"\nRelatório: {out_path}")
+    return 0 if not any(j["stages"]["pipeline"]["rc"] for j in report["jobs"]) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
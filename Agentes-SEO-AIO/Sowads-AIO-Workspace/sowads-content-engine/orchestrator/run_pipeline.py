@@ -8,8 +8,10 @@ import random
 import re
 import shutil
 import string
+import threading
 import time
 from collections import Counter
+from contextlib import nullcontext
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
@@ -19,7 +21,13 @@ import urllib.error
 import urllib.parse
 import urllib.request
 
+from conn_pool import ConnectionPool
 from content_sanitizer import build_content_package, split_content_package
+from log_store import append_log, exit_on_sigterm
+from metrics import ARTICLES, MODEL_RETRIES, PUBLISH, RATE_LIMIT_WAIT_SECONDS, observe_call, retry_reason, serve_from_env
+from profiling import RunProfiler, add_profile_args
+from prompt_segments import append_call_log
+from trace_spans import Tracer, current_span, trace_enabled, traced
 
 
 THEME_COLUMNS = [
@@ -198,22 +206,30 @@ def ensure_dir(path: Path) -> None:
 
 def write_csv(path: Path, rows: List[dict], columns: List[str]) -> None:
     ensure_dir(path.parent)
-    with path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=columns)
-        w.writeheader()
-        for r in rows:
-            w.writerow({c: r.get(c, "") for c in columns})
+    with current_span("write_csv", "io", file=path.name, rows=len(rows)):
+        with path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=columns)
+            w.writeheader()
+            for r in rows:
+                w.writerow({c: r.get(c, "") for c in columns})
 
 
 def write_json(path: Path, obj: dict) -> None:
     ensure_dir(path.parent)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    with current_span("write_json", "io", file=path.name):
+        path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+_APPEND_LOCK = threading.Lock()
 
 
 def append_jsonl(path: Path, obj: dict) -> None:
     ensure_dir(path.parent)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    line = json.dumps(obj, ensure_ascii=False) + "\n"
+    # Concurrent jobs (pipeline_daemon) share the log files; keep lines whole.
+    with _APPEND_LOCK:
+        with path.open("a", encoding="utf-8") as f:
+            f.write(line)
 
 
 def load_env_file(path: Path) -> None:
@@ -260,6 +276,31 @@ def read_json(path: Path) -> dict:
     return json.loads(path.read_text(encoding="utf-8"))
 
 
+class RateBudget:
+    """Gemini budget shared by concurrent jobs: at most `max_inflight` calls at once, starts spaced by `min_interval`."""
+
+    def __init__(self, min_interval: float, max_inflight: int = 1):
+        self.min_interval = max(0.0, float(min_interval))
+        self._slots = threading.BoundedSemaphore(max(1, int(max_inflight)))
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self) -> "RateBudget":
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.min_interval
+        if wait > 0:
+            RATE_LIMIT_WAIT_SECONDS.observe(wait, source="gemini_budget")
+            with current_span("rate_wait", "wait"):
+                time.sleep(wait)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._slots.release()
+
+
 @dataclass
 class GeminiClient:
     api_key: str
@@ -269,6 +310,9 @@ class GeminiClient:
     log_file: Optional[Path] = None
     input_cost_per_1m: float = 0.0
     output_cost_per_1m: float = 0.0
+    rate_limiter: Optional[RateBudget] = None
+    # Daemon jobs pass the shared pool: keep-alive connections instead of one TLS handshake per call.
+    http_pool: Optional[ConnectionPool] = None
 
     def _estimate_tokens_from_text(self, text: str) -> int:
         # Heuristic fallback (somente para estimativa de custo quando usage não vem da API).
@@ -304,11 +348,19 @@ class GeminiClient:
         }
 
     def _log_call(self, record: dict) -> None:
+        observe_call(record)
         if not self.log_file:
             return
-        append_jsonl(self.log_file, record)
+        append_call_log(self.log_file, record)
 
     def generate_text(self, prompt: str, temperature: float = 0.4, context: Optional[dict] = None) -> str:
+        with current_span("gemini_call", "step", phase=(context or {}).get("phase", ""), prompt_chars=len(prompt)):
+            if self.rate_limiter is None:
+                return self._generate_text(prompt, temperature, context)
+            with self.rate_limiter:
+                return self._generate_text(prompt, temperature, context)
+
+    def _generate_text(self, prompt: str, temperature: float, context: Optional[dict]) -> str:
         context = context or {}
         started_at = now_iso()
         t0 = time.time()
@@ -329,8 +381,9 @@ class GeminiClient:
         status_code = None
         error_message = ""
 
+        urlopen = self.http_pool.urlopen if self.http_pool is not None else urllib.request.urlopen
         try:
-            with urllib.request.urlopen(req, timeout=180) as resp:
+            with urlopen(req, timeout=180) as resp:
                 raw_body = resp.read().decode("utf-8")
                 status_code = int(getattr(resp, "status", 200))
         except urllib.error.HTTPError as e:
@@ -507,16 +560,25 @@ class GeminiClient:
                 "error": "",
             }
         )
-        time.sleep(self.delay_seconds)
+        if self.rate_limiter is None:
+            # Without a shared budget the per-call delay is the only rate limit.
+            time.sleep(self.delay_seconds)
         return response_text
 
 
 class Pipeline:
-    def __init__(self, base: Path, cfg: dict):
+    def __init__(self, base: Path, cfg: dict, warm=None):
         self.base = base
         self.cfg = cfg
-        self.system_md = (base / "system/system.md").read_text(encoding="utf-8")
-        self.user_md = (base / "system/user.md").read_text(encoding="utf-8")
+        # `warm` is pipeline_daemon.WarmState: prompts, history, similarity features and
+        # connections reused across jobs.
+        self.warm = warm
+        if warm is not None:
+            self.system_md, self.user_md = warm.prompts()
+        else:
+            self.system_md = (base / "system/system.md").read_text(encoding="utf-8")
+            self.user_md = (base / "system/user.md").read_text(encoding="utf-8")
+        self._features_cache: Dict[str, tuple] = warm.features_cache if warm is not None else {}
 
         batch_topic = str(cfg.get("batch_topic", "") or "").strip()
         self.batch_id = cfg.get("batch_id") or batch_id_now(batch_topic)
@@ -554,10 +616,17 @@ class Pipeline:
             log_file=self.gemini_logs_file,
             input_cost_per_1m=input_cost,
             output_cost_per_1m=output_cost,
+            rate_limiter=warm.rate_budget if warm is not None else None,
+            http_pool=warm.connections if warm is not None else None,
         )
 
+        trace_path = None
+        if trace_enabled(cfg):
+            trace_path = self.batch_dir / f"trace-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{os.getpid()}.json"
+        self.tracer = Tracer(trace_path, process_name=self.batch_id)
+
     def log(self, phase: str, status: str, reason: str = "", metrics: dict = None, item_id: str = "", version: int = 0):
-        append_jsonl(
+        append_log(
             self.logs_file,
             {
                 "timestamp": now_iso(),
@@ -705,6 +774,9 @@ class Pipeline:
                 if (not retryable) or i == attempts:
                     raise
                 wait = backoff_seconds * i
+                reason = retry_reason(msg)
+                MODEL_RETRIES.inc(provider="gemini", phase=context.get("phase", ""), reason=reason)
+                RATE_LIMIT_WAIT_SECONDS.observe(wait, source="retry_backoff")
                 self.log(
                     "gemini",
                     "retry",
@@ -712,9 +784,11 @@ class Pipeline:
                     item_id=context.get("id", ""),
                     version=int(context.get("version", 0) or 0),
                 )
-                time.sleep(wait)
+                with current_span("retry_wait", "wait", attempt=i):
+                    time.sleep(wait)
         raise RuntimeError(f"Gemini retry exhausted: {last_err}")
 
+    @traced()
     def agent01_generate_themes(self) -> List[dict]:
         n = int(self.cfg.get("quantidade_temas", 5))
         if self.test_mode:
@@ -838,6 +912,7 @@ Regras:
             text = text.replace(k, str(v))
         return text
 
+    @traced("step", "sanitize")
     def _extract_blocks(self, out: str) -> Tuple[str, str, str]:
         meta, html, _ = split_content_package(out or "")
         mt = ""
@@ -1032,6 +1107,7 @@ Meta Description: {meta_desc}
         )
         return VISUAL_MIXES[idx]
 
+    @traced("step", "critic_refine")
     def _refine_article_with_critic(
         self,
         draft_output: str,
@@ -1218,6 +1294,7 @@ Meta Description: {meta_desc}
             self.log("articles", "fail", reason=str(e), item_id=item_id, version=version)
             return self._article_fallback(theme, item_id, version, rewrite_guidance)
 
+    @traced()
     def agent02_generate_articles(self, themes: List[dict], current: Dict[str, dict] = None, rewrite_map: Dict[str, str] = None):
         current = current or {}
         rewrite_map = rewrite_map or {}
@@ -1228,18 +1305,22 @@ Meta Description: {meta_desc}
             if item_id in rewrite_map:
                 prev = out[item_id]
                 version = int(prev["version"]) + 1
-                rec = self._generate_article(
-                    t,
-                    item_id,
-                    version,
-                    rewrite_map[item_id],
-                    current_articles=out,
-                )
+                with self.tracer.span("article", "article", id=item_id, version=version):
+                    rec = self._generate_article(
+                        t,
+                        item_id,
+                        version,
+                        rewrite_map[item_id],
+                        current_articles=out,
+                    )
                 out[item_id] = rec
+                ARTICLES.inc(stage="generated", outcome="rewrite")
                 self.log("articles", "requeued", reason="rewrite_only", item_id=item_id, version=version)
             elif item_id not in out:
-                rec = self._generate_article(t, item_id, 1, current_articles=out)
+                with self.tracer.span("article", "article", id=item_id, version=1):
+                    rec = self._generate_article(t, item_id, 1, current_articles=out)
                 out[item_id] = rec
+                ARTICLES.inc(stage="generated", outcome="new")
                 self.log("articles", "success", item_id=item_id, version=1)
         return out
 
@@ -1326,13 +1407,20 @@ Meta Description: {meta_desc}
                     return True
         return False
 
-    def agent03_audit(self, articles: Dict[str, dict]) -> dict:
+    @traced()
+    def agent03_audit(
+        self,
+        articles: Dict[str, dict],
+        context_articles: Optional[Dict[str, dict]] = None,
+        persist: bool = True,
+    ) -> dict:
+        # context_articles: other articles of the batch that count for batch-level checks but are not audited here.
         items = []
         signature_by_item: Dict[str, str] = {}
         signature_counts: Counter = Counter()
 
         # Detect repeated structural fingerprints inside the same run.
-        for aid, article in articles.items():
+        for aid, article in {**(context_articles or {}), **articles}.items():
             _, html_tmp = self._parse_package(article.get("content_package", ""))
             h2_tmp = re.findall(r"<h2[^>]*>(.*?)</h2>", html_tmp, flags=re.I | re.S)
             h2_norm = [
@@ -1346,6 +1434,7 @@ Meta Description: {meta_desc}
                 signature_counts[signature] += 1
 
         for item_id, a in articles.items():
+            span = self.tracer.start("article", "article", id=item_id, version=int(a.get("version", 0) or 0))
             reason_codes = []
             issues = []
             score = 100
@@ -1794,10 +1883,13 @@ Meta Description: {meta_desc}
                 }
             )
             self.log("audit", "success", item_id=item_id, version=int(a["version"]), metrics={"score": score, "flag": flag})
+            ARTICLES.inc(stage="audit", outcome="flagged" if flag else "passed")
+            span.end(score=score)
 
         out = {"batch_id": self.batch_id, "threshold": self.threshold, "items": items}
-        write_json(self.base / "outputs/audits" / f"{self.batch_id}_seo_audit.json", out)
-        write_json(self.batch_dir / "seo_audit.json", out)
+        if persist:
+            write_json(self.base / "outputs/audits" / f"{self.batch_id}_seo_audit.json", out)
+            write_json(self.batch_dir / "seo_audit.json", out)
         return out
 
     def _tokenize(self, text: str) -> List[str]:
@@ -1806,29 +1898,43 @@ Meta Description: {meta_desc}
         text = re.sub(r"\s+", " ", text).strip()
         return [t for t in text.split() if len(t) > 2]
 
+    def _text_features(self, text: str) -> Tuple[set, Counter, float]:
+        # 3-gram set, bag of words and its norm; each text is tokenized once per job (or per daemon).
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        hit = self._features_cache.get(key)
+        if hit is None:
+            toks = self._tokenize(text)
+            bow = Counter(toks)
+            hit = (
+                set(tuple(toks[i:i+3]) for i in range(max(0, len(toks)-2))),
+                bow,
+                sum(v * v for v in bow.values()) ** 0.5,
+            )
+            if len(self._features_cache) >= 20000:
+                self._features_cache.clear()
+            self._features_cache[key] = hit
+        return hit
+
     def _jaccard_3gram(self, a: str, b: str) -> float:
-        def grams(s: str):
-            toks = self._tokenize(s)
-            return set(tuple(toks[i:i+3]) for i in range(max(0, len(toks)-2)))
-        ga, gb = grams(a), grams(b)
+        ga, gb = self._text_features(a)[0], self._text_features(b)[0]
         if not ga or not gb:
             return 0.0
         return len(ga & gb) / max(1, len(ga | gb))
 
     def _cosine_bow(self, a: str, b: str) -> float:
-        ca = Counter(self._tokenize(a))
-        cb = Counter(self._tokenize(b))
+        _, ca, na = self._text_features(a)
+        _, cb, nb = self._text_features(b)
         if not ca or not cb:
             return 0.0
         common = set(ca.keys()) & set(cb.keys())
         dot = sum(ca[t] * cb[t] for t in common)
-        na = sum(v * v for v in ca.values()) ** 0.5
-        nb = sum(v * v for v in cb.values()) ** 0.5
         if na == 0 or nb == 0:
             return 0.0
         return dot / (na * nb)
 
     def _load_history(self) -> List[dict]:
+        if self.warm is not None:
+            return self.warm.history()
         out = []
         if not self.history_file.exists():
             return out
@@ -1841,23 +1947,32 @@ Meta Description: {meta_desc}
                 continue
         return out
 
-    def agent04_similarity(self, articles: Dict[str, dict]) -> dict:
+    @traced()
+    def agent04_similarity(
+        self,
+        articles: Dict[str, dict],
+        context_articles: Optional[Dict[str, dict]] = None,
+        persist: bool = True,
+    ) -> dict:
         history = self._load_history()
         ids = list(articles.keys())
-        texts = {i: strip_html(self._parse_package(articles[i]["content_package"])[1]) for i in ids}
+        # In-batch comparisons also cover context_articles (rest of the batch when scoring one article at a time).
+        batch = {**(context_articles or {}), **articles}
+        texts = {i: strip_html(self._parse_package(batch[i]["content_package"])[1]) for i in batch}
 
         items = []
         for i in ids:
+            span = self.tracer.start("article", "article", id=i)
             best_score = 0.0
             conflicts = []
             ai = articles[i]
             ti = texts[i]
 
             # within batch
-            for j in ids:
+            for j in batch:
                 if i == j:
                     continue
-                aj = articles[j]
+                aj = batch[j]
                 tj = texts[j]
                 jac = self._jaccard_3gram(ti, tj)
                 cos = self._cosine_bow(ti, tj)
@@ -1904,17 +2019,21 @@ Meta Description: {meta_desc}
             }
             items.append(item)
             self.log("similarity", "success", item_id=i, version=int(ai["version"]), metrics={"score": best_score, "status": status})
+            ARTICLES.inc(stage="similarity", outcome=status)
+            span.end(score=best_score)
 
         out = {
             "batch_id": self.batch_id,
             "policy": {"risk_threshold": 40, "rewrite_threshold": 60},
             "items": items,
         }
-        write_json(self.base / "outputs/similarity" / f"{self.batch_id}_similarity.json", out)
-        write_json(self.batch_dir / "similarity_report.json", out)
+        if persist:
+            write_json(self.base / "outputs/similarity" / f"{self.batch_id}_similarity.json", out)
+            write_json(self.batch_dir / "similarity_report.json", out)
         return out
 
-    def agent05_image_prompts(self, approved_articles: Dict[str, dict]) -> List[dict]:
+    @traced()
+    def agent05_image_prompts(self, approved_articles: Dict[str, dict], persist: bool = True) -> List[dict]:
         rows = []
         for item_id, a in approved_articles.items():
             theme = a["tema_principal"]
@@ -1943,10 +2062,11 @@ Meta Description: {meta_desc}
             )
             self.log("image-prompts", "success", item_id=item_id, version=int(a["version"]))
 
-        path1 = self.base / "outputs/image-prompts" / f"{self.batch_id}_image_prompts.csv"
-        path2 = self.batch_dir / "image_prompts.csv"
-        write_csv(path1, rows, IMAGE_PROMPT_COLUMNS)
-        write_csv(path2, rows, IMAGE_PROMPT_COLUMNS)
+        if persist:
+            path1 = self.base / "outputs/image-prompts" / f"{self.batch_id}_image_prompts.csv"
+            path2 = self.batch_dir / "image_prompts.csv"
+            write_csv(path1, rows, IMAGE_PROMPT_COLUMNS)
+            write_csv(path2, rows, IMAGE_PROMPT_COLUMNS)
         return rows
 
     def _extract_article_context_for_image(self, content_package: str, max_chars: int = 2200) -> str:
@@ -2081,10 +2201,82 @@ No text, no watermark, no logo.
             prompt = (prompt + extension).strip()
         return prompt
 
-    def agent06_publish(self, approved_articles: Dict[str, dict], audit_map: Dict[str, dict], sim_map: Dict[str, dict]) -> dict:
+    def _publish_remote(self, backend: str, item_ids: List[str], publish_mode: str, articles_csv: Path) -> Tuple[List[dict], List[dict]]:
+        from publish_wp_cli import build_publish_job, run_remote_publish
+        from publish_wp_rest import run_rest_publish
+
+        # Policy gate already ran in agent06; the job only packages HTML/images for the selected ids.
+        job = build_publish_job(
+            self.base,
+            status=publish_mode,
+            include_statuses=["APPROVED", "PENDING_QA", "REJECTED"],
+            articles_csv=str(articles_csv),
+            enforce_audit_gate=False,
+        )
+        wanted = set(item_ids)
+        items = [it for it in job["items"] if it["id"] in wanted]
+        pool = self.warm.connections if self.warm is not None else None
+        if backend == "rest":
+            result = run_rest_publish(
+                job_id=str(job["job_id"]),
+                job_dir=Path(job["job_dir"]),
+                items=items,
+                base_url=os.getenv("WP_BASE_URL", "").strip(),
+                username=os.getenv("WP_USERNAME", "").strip(),
+                app_password=os.getenv("WP_APP_PASSWORD", "").strip(),
+                pool=pool,
+            )
+        else:
+            host = os.getenv("WP_SSH_HOST", "")
+            port = int(os.getenv("WP_SSH_PORT", "22"))
+            user = os.getenv("WP_SSH_USER", "")
+            password = os.getenv("WP_SSH_PASSWORD", "")
+            wp_path = os.getenv("WP_SSH_WP_PATH", "")
+            if not (host and user and password and wp_path):
+                raise RuntimeError("Missing SSH params: WP_SSH_HOST/PORT/USER/PASSWORD/WP_SSH_WP_PATH")
+            result = run_remote_publish(
+                base=self.base,
+                job_id=str(job["job_id"]),
+                job_dir=Path(job["job_dir"]),
+                items=items,
+                host=host,
+                port=port,
+                user=user,
+                password=password,
+                wp_path=wp_path,
+                bulk=os.getenv("WP_PUBLISH_BULK", "").strip().lower() in {"1", "true", "yes", "y"},
+                workers=int(os.getenv("WP_PUBLISH_WORKERS", "1")),
+                ssh=pool.ssh(host, port, user, password) if pool is not None else None,
+            )
+        versions = {it["id"]: int(it.get("version", 1)) for it in items}
+        published, failed = [], []
+        for r in result["results"]:
+            row = {"id": r["id"], "version": versions.get(r["id"], 1), "timestamp": now_iso()}
+            if r["error"]:
+                failed.append({**row, "error": r["error"]})
+            else:
+                published.append({**row, "wp_post_id": r["wp_post_id"], "status": publish_mode})
+        for item_id in sorted(wanted - set(versions)):
+            failed.append({"id": item_id, "version": 0, "error": "not_in_publish_job", "timestamp": now_iso()})
+        return published, failed
+
+    @traced()
+    def agent06_publish(
+        self,
+        approved_articles: Dict[str, dict],
+        audit_map: Dict[str, dict],
+        sim_map: Dict[str, dict],
+        articles_csv: Optional[Path] = None,
+        persist: bool = True,
+    ) -> dict:
         publish_mode = self.cfg.get("publish_mode", "draft")
+        # Config only: WP_PUBLISH_BACKEND in .env drives the standalone publishers and must
+        # not turn every pipeline run into a real publish.
+        publish_backend = str(self.cfg.get("publish_backend", "") or "").strip().lower()
+        remote_backend = publish_backend if publish_backend in {"rest", "ssh"} else ""
         published = []
         failed = []
+        to_publish: List[str] = []
 
         for item_id, a in approved_articles.items():
             audit = audit_map[item_id]
@@ -2099,7 +2291,7 @@ No text, no watermark, no logo.
                         "timestamp": now_iso(),
                     }
                 )
-                append_jsonl(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": "blocked"})
+                append_log(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": "blocked"})
                 continue
 
             if self.test_mode:
@@ -2112,7 +2304,9 @@ No text, no watermark, no logo.
                         "timestamp": now_iso(),
                     }
                 )
-                append_jsonl(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": "dry_run"})
+                append_log(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": "dry_run"})
+            elif remote_backend:
+                to_publish.append(item_id)
             else:
                 # Placeholder real publication path.
                 published.append(
@@ -2124,15 +2318,48 @@ No text, no watermark, no logo.
                         "timestamp": now_iso(),
                     }
                 )
-                append_jsonl(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": publish_mode})
+                append_log(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": item_id, "status": publish_mode})
+
+        if to_publish:
+            try:
+                remote_published, remote_failed = self._publish_remote(
+                    remote_backend,
+                    to_publish,
+                    publish_mode,
+                    articles_csv or (self.base / "outputs/articles" / f"{self.batch_id}_articles.csv"),
+                )
+            except Exception as e:
+                remote_published = []
+                remote_failed = [{"id": i, "version": 0, "error": f"{remote_backend}_publish_failed: {e}", "timestamp": now_iso()} for i in to_publish]
+            for r in remote_published:
+                append_log(
+                    self.publication_logs,
+                    {"timestamp": now_iso(), "batch_id": self.batch_id, "id": r["id"], "status": publish_mode, "wp_post_id": r["wp_post_id"]},
+                )
+            for r in remote_failed:
+                append_log(self.publication_logs, {"timestamp": now_iso(), "batch_id": self.batch_id, "id": r["id"], "status": "failed", "error": r["error"]})
+            published.extend(remote_published)
+            failed.extend(remote_failed)
+
+        backend = "test" if self.test_mode else (remote_backend or "placeholder")
+        for p in published:
+            PUBLISH.inc(backend=backend, outcome=p["status"])
+        for f in failed:
+            PUBLISH.inc(backend=backend, outcome="blocked" if f["error"] == "blocked_by_policy" else "failed")
 
         out = {"batch_id": self.batch_id, "published": published, "failed": failed}
-        write_json(self.base / "outputs/published" / f"{self.batch_id}_publish_results.json", out)
-        write_json(self.batch_dir / "publish_results.json", out)
+        if persist:
+            write_json(self.base / "outputs/published" / f"{self.batch_id}_publish_results.json", out)
+            write_json(self.batch_dir / "publish_results.json", out)
         self.log("publish", "success", metrics={"published": len(published), "failed": len(failed)})
         return out
 
+    @traced()
     def update_history(self, approved_articles: Dict[str, dict], audit_map: Dict[str, dict], sim_map: Dict[str, dict]):
+        with self.warm.history_lock if self.warm is not None else nullcontext():
+            self._append_history(approved_articles, audit_map, sim_map)
+
+    def _append_history(self, approved_articles: Dict[str, dict], audit_map: Dict[str, dict], sim_map: Dict[str, dict]):
         entries = []
         for item_id, a in approved_articles.items():
             html = self._parse_package(a["content_package"])[1]
@@ -2158,9 +2385,16 @@ No text, no watermark, no logo.
             append_jsonl(self.history_file, entry)
 
         idx = {"last_batch_id": self.batch_id, "updated_at": now_iso(), "added": len(entries)}
-        self.history_index.write_text(json.dumps(idx, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_json(self.history_index, idx)
 
-    def run_single_agent(
+    def run_single_agent(self, agent_name: str, **kwargs) -> dict:
+        try:
+            with self.tracer.span("batch", "batch", batch_id=self.batch_id, agent=agent_name):
+                return self._run_single_agent(agent_name, **kwargs)
+        finally:
+            self.tracer.close()
+
+    def _run_single_agent(
         self,
         agent_name: str,
         themes_file: str = "",
@@ -2256,7 +2490,7 @@ No text, no watermark, no logo.
             audit_map = {x["id"]: x for x in audit_obj.get("items", [])}
             sim_map = {x["id"]: x for x in sim_obj.get("items", [])}
             approved = {i: a for i, a in articles.items() if i in audit_map and i in sim_map}
-            pub = self.agent06_publish(approved, audit_map, sim_map)
+            pub = self.agent06_publish(approved, audit_map, sim_map, articles_csv=self._resolve_input_path(articles_file))
             files = [
                 self.base / "outputs/published" / f"{self.batch_id}_publish_results.json",
                 self.batch_dir / "publish_results.json",
@@ -2274,6 +2508,18 @@ No text, no watermark, no logo.
         return summary
 
     def run(self):
+        scheduler = str(self.cfg.get("scheduler", "barrier")).strip().lower()
+        try:
+            with self.tracer.span("batch", "batch", batch_id=self.batch_id, scheduler=scheduler):
+                if scheduler == "stream":
+                    from stream_scheduler import StreamingRun
+
+                    return StreamingRun(self).run()
+                return self._run_barrier()
+        finally:
+            self.tracer.close()
+
+    def _run_barrier(self):
         self.log("pipeline", "start", metrics={"test_mode": self.test_mode})
 
         themes = self.agent01_generate_themes()
@@ -2324,6 +2570,7 @@ No text, no watermark, no logo.
                 approved[item_id] = a
             else:
                 a["status"] = "REJECTED"
+            ARTICLES.inc(stage="gate", outcome=a["status"].lower())
 
         # persist final article table
         write_csv(self.base / "outputs/articles" / f"{self.batch_id}_articles.csv", list(article_state.values()), ARTICLE_COLUMNS)
@@ -2361,14 +2608,27 @@ def main():
         help="Rodar pipeline completo ou agente individual",
     )
     parser.add_argument("--test-mode", action="store_true", help="Force test mode")
+    parser.add_argument(
+        "--scheduler",
+        default="",
+        choices=["", "barrier", "stream"],
+        help="barrier = cada etapa espera o lote inteiro; stream = cada artigo segue sozinho até o publish (default: config ou barrier)",
+    )
     parser.add_argument("--quantity", type=int, default=None, help="Override quantidade_temas")
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Grava spans batch/fase/artigo/etapa em data/batches/{batch_id}/trace-*.json (formato Chrome trace)",
+    )
     parser.add_argument("--themes-file", default="", help="CSV de temas para agent02")
     parser.add_argument("--articles-file", default="", help="CSV de artigos para agent03/04/05/06")
     parser.add_argument("--audit-file", default="", help="JSON de auditoria para agent06")
     parser.add_argument("--similarity-file", default="", help="JSON de similaridade para agent06")
     parser.add_argument("--job-id", default="", help="ID opcional para saída assíncrona")
     parser.add_argument("--async-output", action="store_true", help="Copiar artefatos para outputs/assincronos/{agent}/{job_id}")
+    add_profile_args(parser)
     args = parser.parse_args()
+    exit_on_sigterm()
 
     base = Path(args.base).resolve()
 
@@ -2385,24 +2645,32 @@ def main():
         cfg["test_mode"] = True
     if args.quantity is not None:
         cfg["quantidade_temas"] = args.quantity
+    if args.scheduler:
+        cfg["scheduler"] = args.scheduler
+    if args.trace:
+        cfg["trace"] = True
 
     needs_gemini = args.agent in {"all", "agent01", "agent02"}
     if needs_gemini and not cfg.get("test_mode", False) and not os.getenv("GEMINI_API_KEY", ""):
         raise SystemExit("GEMINI_API_KEY not configured in environment/.env")
 
+    serve_from_env()
     p = Pipeline(base, cfg)
-    if args.agent == "all":
-        result = p.run()
-    else:
-        result = p.run_single_agent(
-            agent_name=args.agent,
-            themes_file=args.themes_file,
-            articles_file=args.articles_file,
-            audit_file=args.audit_file,
-            similarity_file=args.similarity_file,
-            async_output=args.async_output,
-            job_id=args.job_id,
-        )
+    profiler = RunProfiler.from_args(args)
+    with profiler:
+        if args.agent == "all":
+            result = p.run()
+        else:
+            result = p.run_single_agent(
+                agent_name=args.agent,
+                themes_file=args.themes_file,
+                articles_file=args.articles_file,
+                audit_file=args.audit_file,
+                similarity_file=args.similarity_file,
+                async_output=args.async_output,
+                job_id=args.job_id,
+            )
+    profiler.report(Path(args.profile_dir) if args.profile_dir else p.batch_dir, f"run_pipeline-{args.agent}")
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
 
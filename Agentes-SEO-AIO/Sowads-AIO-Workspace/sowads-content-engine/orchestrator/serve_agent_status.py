@@ -1,30 +1,161 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
 import json
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from typing import List, Optional
 from urllib.parse import parse_qs, urlparse
 
-from agent_status import build_status
+from agent_status import build_status, get_aggregator, running_pipeline_processes
 
 
-def make_handler(base: Path):
+class StatusHub:
+    """One watcher thread for all clients: tails the log and wakes streams when something changed.
+
+    `ps` runs on its own slower clock and its result is shared, so the number of
+    dashboards open does not change the cost of a refresh.
+    """
+
+    def __init__(self, base: Path, poll_interval: float = 0.5, ps_interval: float = 5.0):
+        self.base = base
+        self.poll_interval = poll_interval
+        self.ps_interval = ps_interval
+        self.aggregator = get_aggregator(base)
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.running_processes: List[dict] = []
+
+    def start(self) -> "StatusHub":
+        self.running_processes = running_pipeline_processes()
+        threading.Thread(target=self._watch, daemon=True).start()
+        return self
+
+    def _watch(self) -> None:
+        agg = self.aggregator
+        last_key = None
+        next_ps = time.monotonic() + self.ps_interval
+        while True:
+            changed = False
+            try:
+                agg.refresh()
+                key = (agg.inode, agg.offset, agg.latest_batch_id)
+                changed = key != last_key
+                last_key = key
+                if time.monotonic() >= next_ps:
+                    next_ps = time.monotonic() + self.ps_interval
+                    procs = running_pipeline_processes()
+                    if procs != self.running_processes:
+                        self.running_processes = procs
+                        changed = True
+            except Exception:
+                pass
+            if changed:
+                with self.cond:
+                    self.seq += 1
+                    self.cond.notify_all()
+            time.sleep(self.poll_interval)
+
+    def wait(self, seq: int, timeout: float) -> int:
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != seq, timeout=timeout)
+            return self.seq
+
+    def status(self, batch_id: str = "") -> dict:
+        return build_status(base=self.base, batch_id=batch_id, running_processes=self.running_processes)
+
+
+def status_etag(payload: dict) -> str:
+    # generated_at changes on every call; the ETag only follows the content.
+    content = {k: v for k, v in payload.items() if k != "generated_at"}
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def status_delta(prev: dict, cur: dict) -> Optional[dict]:
+    """Changed phases/agents between two views of the same batch; None means send a full snapshot."""
+    if prev.get("batch_id") != cur.get("batch_id"):
+        return None
+    delta: dict = {"batch_id": cur["batch_id"], "generated_at": cur["generated_at"]}
+    prev_phases = prev.get("phase_counts", {})
+    phases = {k: v for k, v in cur.get("phase_counts", {}).items() if prev_phases.get(k) != v}
+    if phases:
+        delta["phase_counts"] = phases
+    if cur.get("total_events") != prev.get("total_events"):
+        delta["total_events"] = cur.get("total_events")
+    prev_agents = {a["agent"]: a for a in prev.get("agents", [])}
+    agents = [a for a in cur.get("agents", []) if prev_agents.get(a["agent"]) != a]
+    if agents:
+        delta["agents"] = agents
+    if cur.get("running_processes") != prev.get("running_processes"):
+        delta["running_processes"] = cur.get("running_processes", [])
+    return delta
+
+
+def make_handler(base: Path, hub: StatusHub, keepalive: float = 15.0):
     class Handler(BaseHTTPRequestHandler):
-        def _send(self, code: int, body: bytes, content_type: str) -> None:
+        def _send(self, code: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
             self.send_response(code)
             self.send_header("Content-Type", content_type)
             self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
             self.end_headers()
             self.wfile.write(body)
 
+        def _event(self, name: str, payload: dict) -> None:
+            data = json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"event: {name}\ndata: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _stream(self, batch_id: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("X-Accel-Buffering", "no")
+            self.end_headers()
+            try:
+                seq = hub.seq
+                last = hub.status(batch_id)
+                self._event("snapshot", last)
+                while True:
+                    new_seq = hub.wait(seq, timeout=keepalive)
+                    if new_seq == seq:
+                        # Comment line: keeps proxies from closing an idle stream.
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+                        continue
+                    seq = new_seq
+                    cur = hub.status(batch_id)
+                    delta = status_delta(last, cur)
+                    if delta is None:
+                        self._event("snapshot", cur)
+                    elif len(delta) > 2:
+                        self._event("delta", delta)
+                    last = cur
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
         def do_GET(self):  # noqa: N802
             parsed = urlparse(self.path)
+            qs = parse_qs(parsed.query)
+            batch_id = (qs.get("batch", [""])[0] or "").strip()
             if parsed.path == "/api/status":
-                qs = parse_qs(parsed.query)
-                batch_id = (qs.get("batch", [""])[0] or "").strip()
-                payload = build_status(base=base, batch_id=batch_id)
+                payload = hub.status(batch_id)
+                etag = status_etag(payload)
+                if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
                 raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-                self._send(200, raw, "application/json; charset=utf-8")
+                self._send(200, raw, "application/json; charset=utf-8", {"ETag": etag, "Cache-Control": "no-cache"})
+                return
+
+            if parsed.path == "/api/stream":
+                self._stream(batch_id)
                 return
 
             if parsed.path in ("/", "/index.html"):
@@ -43,15 +174,17 @@ def main() -> None:
     parser.add_argument("--base", default=str(Path(__file__).resolve().parents[1]))
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Segundos entre checagens do log")
     args = parser.parse_args()
 
     base = Path(args.base).resolve()
-    handler = make_handler(base)
-    server = HTTPServer((args.host, int(args.port)), handler)
+    hub = StatusHub(base, poll_interval=max(0.05, float(args.poll_interval))).start()
+    handler = make_handler(base, hub)
+    server = ThreadingHTTPServer((args.host, int(args.port)), handler)
+    server.daemon_threads = True
     print(f"Serving status dashboard on http://{args.host}:{args.port}")
     server.serve_forever()
 
 
 if __name__ == "__main__":
     main()
-
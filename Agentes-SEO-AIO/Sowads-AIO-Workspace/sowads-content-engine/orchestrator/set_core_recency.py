@@ -2,18 +2,98 @@
 import argparse
 import csv
 import json
+import os
 import shlex
+import tempfile
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
-from publish_wp_cli import shell_with_password, write_json
+from publish_wp_cli import fetch_remote_map, write_json
+from ssh_session import SshSession
 
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+# Runs inside `wp eval`: one WordPress boot, ids resolved with one query, all dates
+# applied inside a single DB transaction (rolled back if any update fails).
+BULK_RECENCY_PHP = r"""
+global $wpdb;
+$items = json_decode(stream_get_contents(STDIN), true);
+if (!is_array($items)) { echo "FATAL|invalid payload\n"; exit(1); }
+$by_cid = array();
+$cids = array_map(function ($it) { return (string) $it['id']; }, $items);
+foreach (array_chunk($cids, 500) as $chunk) {
+    $in = implode(',', array_fill(0, count($chunk), '%s'));
+    $rows = $wpdb->get_results($wpdb->prepare(
+        "SELECT p.ID, m.meta_value AS cid FROM {$wpdb->posts} p JOIN {$wpdb->postmeta} m ON m.post_id = p.ID "
+        . "WHERE m.meta_key = 'sowads_content_id' AND m.meta_value IN ($in) AND p.post_type = 'post' "
+        . "AND p.post_status NOT IN ('trash', 'auto-draft') ORDER BY p.post_date DESC, p.ID DESC",
+        $chunk
+    ));
+    foreach ($rows as $r) { if (!isset($by_cid[$r->cid])) { $by_cid[$r->cid] = (int) $r->ID; } }
+}
+$lines = array();
+$failed = false;
+$wpdb->query('START TRANSACTION');
+foreach ($items as $it) {
+    $cid = str_replace(array("\n", '|'), ' ', (string) $it['id']);
+    if (empty($by_cid[$it['id']])) { $lines[] = "MISSING|$cid"; continue; }
+    $pid = $by_cid[$it['id']];
+    $res = wp_update_post(array('ID' => $pid, 'post_date' => $it['post_date'], 'post_date_gmt' => $it['post_date_gmt'], 'edit_date' => true), true);
+    if (is_wp_error($res)) {
+        $failed = true;
+        $lines[] = "ERROR|$cid|$pid|" . str_replace(array("\n", '|'), ' ', $res->get_error_message());
+    } else {
+        $lines[] = "OK|$cid|$pid";
+    }
+}
+$wpdb->query($failed ? 'ROLLBACK' : 'COMMIT');
+echo implode("\n", $lines) . "\n" . ($failed ? "ROLLBACK" : "COMMIT") . "\n";
+"""
+
+
+def run_bulk_recency(ssh: SshSession, wp_path: str, planned: List[dict]) -> List[dict]:
+    payload = [{"id": p["id"], "post_date": p["post_date"], "post_date_gmt": p["post_date_gmt"]} for p in planned]
+    fd, tmp_name = tempfile.mkstemp(prefix="sowads-recency-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    try:
+        out = ssh.run_with_stdin(
+            f"cd {shlex.quote(wp_path)} && wp eval {shlex.quote(BULK_RECENCY_PHP)}",
+            Path(tmp_name),
+            f"/tmp/{Path(tmp_name).name}",
+            timeout=1200,
+        )
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+
+    by_id: Dict[str, dict] = {}
+    for line in out.splitlines():
+        parts = line.strip().split("|")
+        if parts[0] == "OK" and len(parts) == 3 and parts[2].isdigit():
+            by_id[parts[1]] = {"status": "updated", "wp_post_id": int(parts[2])}
+        elif parts[0] == "MISSING" and len(parts) == 2:
+            by_id[parts[1]] = {"status": "missing", "wp_post_id": 0}
+        elif parts[0] == "ERROR" and len(parts) >= 4 and parts[2].isdigit():
+            by_id[parts[1]] = {"status": "error", "wp_post_id": int(parts[2]), "error": "|".join(parts[3:])}
+    committed = "COMMIT" in out.splitlines()
+
+    results = []
+    for p in planned:
+        res = dict(by_id.get(p["id"], {"status": "error", "wp_post_id": 0, "error": "No result returned by remote command"}))
+        if res["status"] == "updated" and not committed:
+            # Another update failed and the whole pass was rolled back.
+            res["status"] = "rolled_back"
+        row = {"id": p["id"], "status": res["status"], "wp_post_id": res["wp_post_id"], "post_date": p["post_date"]}
+        if res.get("error"):
+            row["error"] = res["error"]
+        results.append(row)
+    return results
+
+
 def load_ids_from_themes(csv_path: Path) -> List[str]:
     ids: List[str] = []
     with csv_path.open("r", encoding="utf-8", newline="") as f:
@@ -25,11 +105,6 @@ def load_ids_from_themes(csv_path: Path) -> List[str]:
     return ids
 
 
-def run_remote(host: str, port: int, user: str, password: str, command: str, timeout: int = 600) -> str:
-    cmd = f"ssh -o StrictHostKeyChecking=no -p {port} {user}@{host} " + shlex.quote(command)
-    return shell_with_password(cmd, password, timeout=timeout)
-
-
 def main() -> int:
     parser = argparse.ArgumentParser(description="Set post_date recency for a list of content ids in WP.")
     parser.add_argument("--themes-csv", required=True)
@@ -40,6 +115,12 @@ def main() -> int:
     parser.add_argument("--wp-path", required=True)
     parser.add_argument("--step-minutes", type=int, default=3)
     parser.add_argument("--report-json", required=True)
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        default=os.getenv("WP_RECENCY_BULK", "").strip().lower() in {"1", "true", "yes", "y"},
+        help="Envia toda a lista id→data em um único `wp eval` (WordPress inicializa uma vez, uma transação)",
+    )
     args = parser.parse_args()
 
     ids = load_ids_from_themes(Path(args.themes_csv))
@@ -48,64 +129,76 @@ def main() -> int:
 
     # Most recent first.
     start_dt = datetime.now(timezone.utc)
-    results = []
+    planned = []
     for idx, item_id in enumerate(ids):
         dt = start_dt - timedelta(minutes=(idx * max(1, args.step_minutes)))
-        dt_local = dt.strftime("%Y-%m-%d %H:%M:%S")
-        dt_gmt = dt.strftime("%Y-%m-%d %H:%M:%S")
-        script = "\n".join(
-            [
-                "set -e",
-                f"cd {shlex.quote(args.wp_path)}",
-                "PID=$(wp post list --post_type=post --post_status=any --meta_key=sowads_content_id --meta_value="
-                + shlex.quote(item_id)
-                + " --field=ID --format=ids | awk '{print $1}')",
-                "if [ -z \"$PID\" ]; then echo \"MISS|0\"; exit 0; fi",
-                "wp post update \"$PID\" --post_date="
-                + shlex.quote(dt_local)
-                + " --post_date_gmt="
-                + shlex.quote(dt_gmt)
-                + " --edit_date=1 >/dev/null",
-                "echo \"OK|$PID\"",
-            ]
-        )
-        out = run_remote(
-            host=args.ssh_host,
-            port=args.ssh_port,
-            user=args.ssh_user,
-            password=args.ssh_password,
-            command=script,
-            timeout=1200,
-        )
-        status = "missing"
-        wp_post_id = 0
-        if "OK|" in out:
-            status = "updated"
-            try:
-                wp_post_id = int(out.split("OK|", 1)[1].strip().splitlines()[0])
-            except Exception:
-                wp_post_id = 0
-        results.append(
+        planned.append(
             {
                 "id": item_id,
-                "status": status,
-                "wp_post_id": wp_post_id,
-                "post_date": dt_local,
+                "post_date": dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "post_date_gmt": dt.strftime("%Y-%m-%d %H:%M:%S"),
             }
         )
 
+    results = []
+    with SshSession(args.ssh_host, args.ssh_port, args.ssh_user, args.ssh_password) as ssh:
+        if args.bulk:
+            results = run_bulk_recency(ssh, args.wp_path, planned)
+        else:
+            # content id -> post ID resolved once; missing ids no longer cost a remote call.
+            remote = fetch_remote_map(ssh, args.wp_path)
+            for p in planned:
+                item_id = p["id"]
+                dt_local = p["post_date"]
+                dt_gmt = p["post_date_gmt"]
+                pid = remote.by_content_id.get(item_id, 0)
+                if not pid:
+                    results.append({"id": item_id, "status": "missing", "wp_post_id": 0, "post_date": dt_local})
+                    continue
+                script = "\n".join(
+                    [
+                        "set -e",
+                        f"cd {shlex.quote(args.wp_path)}",
+                        f"PID={pid}",
+                        "wp post update \"$PID\" --post_date="
+                        + shlex.quote(dt_local)
+                        + " --post_date_gmt="
+                        + shlex.quote(dt_gmt)
+                        + " --edit_date=1 >/dev/null",
+                        "echo \"OK|$PID\"",
+                    ]
+                )
+                out = ssh.run(script, timeout=1200)
+                status = "missing"
+                wp_post_id = 0
+                if "OK|" in out:
+                    status = "updated"
+                    try:
+                        wp_post_id = int(out.split("OK|", 1)[1].strip().splitlines()[0])
+                    except Exception:
+                        wp_post_id = 0
+                results.append(
+                    {
+                        "id": item_id,
+                        "status": status,
+                        "wp_post_id": wp_post_id,
+                        "post_date": dt_local,
+                    }
+                )
+
     report = {
         "timestamp": now_iso(),
         "themes_csv": args.themes_csv,
         "ids_total": len(ids),
         "updated": sum(1 for r in results if r["status"] == "updated"),
         "missing": sum(1 for r in results if r["status"] == "missing"),
+        "failed": sum(1 for r in results if r["status"] in {"error", "rolled_back"}),
         "results": results,
     }
     report_path = Path(args.report_json)
     report_path.parent.mkdir(parents=True, exist_ok=True)
     write_json(report_path, report)
-    print(json.dumps({"updated": report["updated"], "missing": report["missing"]}, ensure_ascii=False))
+    print(json.dumps({"updated": report["updated"], "missing": report["missing"], "failed": report["failed"]}, ensure_ascii=False))
     return 0
 
 
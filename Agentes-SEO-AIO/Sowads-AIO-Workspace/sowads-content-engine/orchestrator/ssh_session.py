@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+
+def shell_with_password(command: str, password: str, timeout: int = 1200) -> str:
+    script = f"""
+import pexpect
+import sys
+cmd = {command!r}
+pwd = {password!r}
+child = pexpect.spawn(cmd, encoding='utf-8', timeout={timeout})
+i = child.expect(['assword:', 'continue connecting (yes/no)?', pexpect.EOF])
+if i == 1:
+    child.sendline('yes')
+    child.expect('assword:')
+    child.sendline(pwd)
+elif i == 0:
+    child.sendline(pwd)
+child.expect(pexpect.EOF)
+print(child.before)
+child.close()
+code = child.exitstatus if child.exitstatus is not None else (child.status or 0)
+sys.exit(code)
+"""
+    proc = subprocess.run(["python3", "-c", script], capture_output=True, text=True)
+    if proc.returncode != 0:
+        msg = (proc.stderr or proc.stdout or "").strip()
+        raise RuntimeError(f"SSH/SCP failed: {msg}")
+    return proc.stdout
+
+
+class SshSession:
+    """Password auth happens once; every later ssh/scp rides the same OpenSSH ControlMaster socket.
+
+    If the master cannot be started (multiplexing disabled, old client, server refusing
+    sessions) each call falls back to a per-command `shell_with_password`.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.enabled = os.getenv("WP_SSH_MULTIPLEX", "true").strip().lower() in {"1", "true", "yes", "y"}
+        self.persist_seconds = int(os.getenv("WP_SSH_CONTROL_PERSIST", "600"))
+        self.control_dir: Optional[str] = None
+        self.control_path = ""
+        self.multiplexed = False
+        # Worker threads share the session; the first one to see the master die degrades it.
+        self._lock = threading.Lock()
+
+    @property
+    def target(self) -> str:
+        return f"{self.user}@{self.host}"
+
+    def _mux_opts(self) -> List[str]:
+        return [
+            "-o", "StrictHostKeyChecking=no",
+            "-o", f"ControlPath={self.control_path}",
+            "-o", "ControlMaster=no",
+            # Never prompt: if the master is gone the call fails fast instead of hanging.
+            "-o", "BatchMode=yes",
+        ]
+
+    def open(self) -> "SshSession":
+        if not self.enabled or self.multiplexed:
+            return self
+        # Unix socket paths are limited to ~104 chars, so keep the directory short.
+        self.control_dir = tempfile.mkdtemp(prefix="sowads-ssh-")
+        self.control_path = os.path.join(self.control_dir, "cm.sock")
+        # With ControlPersist the master detaches (stdio -> /dev/null) once `true` returns.
+        master_cmd = (
+            f"ssh -o StrictHostKeyChecking=no -o ServerAliveInterval=30 "
+            f"-o ControlMaster=yes -o ControlPath={shlex.quote(self.control_path)} "
+            f"-o ControlPersist={self.persist_seconds} -p {self.port} {self.target} true"
+        )
+        try:
+            shell_with_password(master_cmd, self.password, timeout=120)
+            self.multiplexed = self._check()
+        except RuntimeError:
+            self.multiplexed = False
+        if not self.multiplexed:
+            self._cleanup_dir()
+        return self
+
+    def _check(self) -> bool:
+        proc = subprocess.run(
+            ["ssh", "-o", f"ControlPath={self.control_path}", "-O", "check", "-p", str(self.port), self.target],
+            capture_output=True,
+            text=True,
+        )
+        return proc.returncode == 0
+
+    def alive(self) -> bool:
+        """Master still up (a session kept across jobs may outlive ControlPersist)."""
+        return self.multiplexed and self._check()
+
+    def _run_mux(self, argv: List[str], timeout: int) -> str:
+        try:
+            proc = subprocess.run(argv, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"SSH/SCP failed: timeout after {timeout}s")
+        if proc.returncode != 0:
+            msg = (proc.stderr or proc.stdout or "").strip()
+            raise RuntimeError(f"SSH/SCP failed: {msg}")
+        return proc.stdout
+
+    def _try_mux(self, argv: List[str], timeout: int) -> Optional[str]:
+        try:
+            return self._run_mux(argv, timeout)
+        except RuntimeError:
+            if self._check():
+                raise
+            self._degrade()
+            return None
+
+    def _degrade(self) -> None:
+        # Master died mid-job: one password handshake per call from now on.
+        with self._lock:
+            self.multiplexed = False
+            self._cleanup_dir()
+
+    def run(self, command: str, timeout: int = 600) -> str:
+        if self.multiplexed:
+            out = self._try_mux(["ssh"] + self._mux_opts() + ["-p", str(self.port), self.target, command], timeout)
+            if out is not None:
+                return out
+        cmd = f"ssh -o StrictHostKeyChecking=no -p {self.port} {self.target} " + shlex.quote(command)
+        return shell_with_password(cmd, self.password, timeout=timeout)
+
+    def upload(self, local_path: Path, remote_dir: str, timeout: int = 1800) -> str:
+        if self.multiplexed:
+            argv = ["scp"] + self._mux_opts() + ["-P", str(self.port), "-r", str(local_path), f"{self.target}:{remote_dir}/"]
+            out = self._try_mux(argv, timeout)
+            if out is not None:
+                return out
+        cmd = f"scp -o StrictHostKeyChecking=no -P {self.port} -r {str(local_path)} {self.target}:{remote_dir}/"
+        return shell_with_password(cmd, self.password, timeout=timeout)
+
+    def run_with_stdin(self, command: str, local_file: Path, remote_tmp: str, timeout: int = 1800) -> str:
+        """Run `command` remotely with `local_file` as its stdin.
+
+        Multiplexed sessions stream the file through the existing connection. The password
+        fallback owns the tty, so there the file is copied to `remote_tmp` first and redirected.
+        """
+        if self.multiplexed:
+            argv = ["ssh"] + self._mux_opts() + ["-p", str(self.port), self.target, command]
+            try:
+                with local_file.open("rb") as f:
+                    proc = subprocess.run(argv, stdin=f, capture_output=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f"SSH/SCP failed: timeout after {timeout}s")
+            if proc.returncode == 0:
+                return proc.stdout.decode("utf-8", errors="replace")
+            if self._check():
+                msg = (proc.stderr or proc.stdout or b"").decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"SSH/SCP failed: {msg}")
+            self._degrade()
+        cmd = f"scp -o StrictHostKeyChecking=no -P {self.port} {shlex.quote(str(local_file))} {self.target}:{shlex.quote(remote_tmp)}"
+        shell_with_password(cmd, self.password, timeout=timeout)
+        tmp = shlex.quote(remote_tmp)
+        return self.run(f"( {command} ) < {tmp}; rc=$?; rm -f {tmp}; exit $rc", timeout=timeout)
+
+    def close(self) -> None:
+        if self.multiplexed:
+            subprocess.run(
+                ["ssh", "-o", f"ControlPath={self.control_path}", "-O", "exit", "-p", str(self.port), self.target],
+                capture_output=True,
+                text=True,
+            )
+            self.multiplexed = False
+        self._cleanup_dir()
+
+    def _cleanup_dir(self) -> None:
+        control_dir, self.control_dir = self.control_dir, None
+        if control_dir:
+            shutil.rmtree(control_dir, ignore_errors=True)
+
+    def __enter__(self) -> "SshSession":
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
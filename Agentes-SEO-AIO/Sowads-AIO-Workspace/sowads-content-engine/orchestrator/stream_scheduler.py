@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import ARTICLES
+from run_pipeline import ARTICLE_COLUMNS, IMAGE_PROMPT_COLUMNS, Pipeline, RateBudget, ensure_dir, write_csv, write_json
+
+
+_DONE = object()
+
+
+class StreamingRun:
+    """Per-article scheduler: generate -> audit -> similarity -> image prompt -> render -> publish.
+
+    Each article moves on as soon as it is ready instead of waiting for the whole batch at
+    every stage. Bounded queues between stages give backpressure: a slow publish stage
+    stalls the gate, which in turn stalls generation.
+
+    Batch-level checks (repeated H2 signatures in agent03, in-batch overlap in agent04)
+    run at the gate, one article at a time, against every article of the batch that
+    passed the gate before it. Every pair is still compared once; the later article of a
+    conflicting pair takes the penalty (or is sent back for a rewrite) because the earlier
+    one may already be published.
+    """
+
+    def __init__(self, pipe: Pipeline):
+        self.pipe = pipe
+        cfg = pipe.cfg
+        self.generate_workers = max(1, int(cfg.get("stream_generate_workers", os.getenv("STREAM_GENERATE_WORKERS", "3"))))
+        self.queue_size = max(1, int(cfg.get("stream_queue_size", os.getenv("STREAM_QUEUE_SIZE", "4"))))
+        self.publish_batch = max(1, int(cfg.get("stream_publish_batch", os.getenv("STREAM_PUBLISH_BATCH", "5"))))
+        self.render_images = bool(cfg.get("stream_render_images", False))
+        if pipe.gemini.rate_limiter is None:
+            # Outside the daemon nobody shares a budget, and the post-call delay alone does
+            # not stop the generate workers from hitting Gemini at the same time.
+            pipe.gemini.rate_limiter = RateBudget(
+                min_interval=float(os.getenv("REQUEST_DELAY_SECONDS", "0.5")),
+                max_inflight=int(cfg.get("stream_gemini_concurrency", os.getenv("STREAM_GEMINI_CONCURRENCY", "1"))),
+            )
+
+        self.gen_q: "queue.Queue" = queue.Queue()
+        self.gate_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self.release_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+
+        self.themes: List[dict] = []
+        self.gated: Dict[str, dict] = {}
+        self.audit_map: Dict[str, dict] = {}
+        self.sim_map: Dict[str, dict] = {}
+        self.rewrites: Dict[str, int] = {}
+        self.approved: Dict[str, dict] = {}
+        self.image_rows: List[dict] = []
+        self.published: List[dict] = []
+        self.failed: List[dict] = []
+        self.errors: List[str] = []
+        self._gen_threads: List[threading.Thread] = []
+        self.started = 0.0
+        self.first_release_s: Optional[float] = None
+
+    # -- stages -----------------------------------------------------------------
+
+    def _generate_worker(self) -> None:
+        while True:
+            task = self.gen_q.get()
+            if task is _DONE:
+                return
+            theme, version, guidance = task
+            try:
+                rec = self._generate(theme, version, guidance)
+            except Exception as e:
+                # Even the fallback failed: the gate still has to count this item as done.
+                self.gate_q.put((theme, None, f"stream_generate_failed: {e}"))
+                continue
+            self.gate_q.put((theme, rec, ""))
+
+    def _generate(self, theme: dict, version: int, guidance: str) -> dict:
+        pipe = self.pipe
+        item_id = theme["id"]
+        with self._lock:
+            current = dict(self.gated)
+        try:
+            with pipe.tracer.span("article", "article", id=item_id, version=version):
+                rec = pipe._generate_article(theme, item_id, version, guidance, current_articles=current)
+        except Exception as e:
+            pipe.log("articles", "fail", reason=str(e), item_id=item_id, version=version)
+            rec = pipe._article_fallback(theme, item_id, version, guidance)
+        ARTICLES.inc(stage="generated", outcome="new" if version == 1 else "rewrite")
+        if version == 1:
+            pipe.log("articles", "success", item_id=item_id, version=1)
+        else:
+            pipe.log("articles", "requeued", reason="rewrite_only", item_id=item_id, version=version)
+        return rec
+
+    def _gate(self) -> None:
+        pipe = self.pipe
+        pending = len(self.themes)
+        try:
+            while pending:
+                theme, rec, error = self.gate_q.get()
+                if rec is None:
+                    pending -= 1
+                    ARTICLES.inc(stage="generated", outcome="failed")
+                    with self._lock:
+                        self.failed.append({"id": theme["id"], "version": 0, "error": error})
+                    continue
+                item_id = rec["id"]
+                with self._lock:
+                    context = {k: v for k, v in self.gated.items() if k != item_id}
+                with pipe.tracer.span("gate", "article", id=item_id, version=int(rec["version"])):
+                    audit = pipe.agent03_audit({item_id: rec}, context_articles=context, persist=False)["items"][0]
+                    sim = pipe.agent04_similarity({item_id: rec}, context_articles=context, persist=False)["items"][0]
+
+                guidance = ""
+                if audit["flags"]["flag_rewrite"]:
+                    guidance = audit["rewrite_guidance"]
+                elif sim["flag_similarity"]:
+                    guidance = sim["rewrite_guidance"]
+                if guidance and self.rewrites.get(item_id, 0) < pipe.max_rewrites:
+                    self.rewrites[item_id] = self.rewrites.get(item_id, 0) + 1
+                    self.gen_q.put((theme, int(rec["version"]) + 1, guidance))
+                    continue
+
+                pending -= 1
+                approved = (
+                    audit["seo_geo_score"] >= pipe.threshold
+                    and not audit["flags"]["flag_rewrite"]
+                    and sim["similarity_score"] <= 60
+                )
+                rec["status"] = "APPROVED" if approved else "REJECTED"
+                ARTICLES.inc(stage="gate", outcome=rec["status"].lower())
+                with self._lock:
+                    self.gated[item_id] = rec
+                    self.audit_map[item_id] = audit
+                    self.sim_map[item_id] = sim
+                if approved:
+                    self.approved[item_id] = rec
+                    self.image_rows.extend(pipe.agent05_image_prompts({item_id: rec}, persist=False))
+                    self.release_q.put(item_id)
+        except Exception as e:
+            self.errors.append(f"gate: {e}")
+        finally:
+            for _ in range(self.generate_workers):
+                self.gen_q.put(_DONE)
+            # After an error, generators may still be blocked on a full gate queue.
+            while any(t.is_alive() for t in self._gen_threads):
+                try:
+                    self.gate_q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.release_q.put(_DONE)
+
+    def _release_worker(self) -> None:
+        stream_dir = self.pipe.batch_dir / "stream"
+        seq = 0
+        done = False
+        while not done:
+            first = self.release_q.get()
+            if first is _DONE:
+                return
+            ids = [first]
+            # Micro-batch whatever is already waiting, without holding back the first one.
+            while len(ids) < self.publish_batch:
+                try:
+                    nxt = self.release_q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _DONE:
+                    done = True
+                    break
+                ids.append(nxt)
+            seq += 1
+            try:
+                with self.pipe.tracer.span("release", "article", ids=ids):
+                    self._release(ids, stream_dir / f"release-{seq:03d}")
+            except Exception as e:
+                self.errors.append(f"release: {e}")
+                with self._lock:
+                    self.failed.extend({"id": i, "version": 0, "error": f"stream_release_failed: {e}"} for i in ids)
+
+    def _release(self, ids: List[str], release_dir: Path) -> None:
+        pipe = self.pipe
+        ensure_dir(release_dir)
+        with self._lock:
+            subset = {i: self.gated[i] for i in ids}
+            audit_map = dict(self.audit_map)
+            sim_map = dict(self.sim_map)
+        articles_csv = release_dir / f"{pipe.batch_id}_articles.csv"
+        write_csv(articles_csv, list(subset.values()), ARTICLE_COLUMNS)
+
+        if self.render_images and not pipe.test_mode:
+            from render_images import render_from_csv
+
+            prompts_csv = release_dir / f"{pipe.batch_id}_image_prompts.csv"
+            write_csv(prompts_csv, [r for r in self.image_rows if r["id"] in subset], IMAGE_PROMPT_COLUMNS)
+            try:
+                summary = render_from_csv(
+                    pipe.base,
+                    prompts_csv,
+                    provider=os.getenv("IMAGE_PROVIDER", "gemini"),
+                    merge_manifest=True,
+                )
+                pipe.log("images", "success", metrics={"ids": ids, "success": summary["success"], "failed": summary["failed"]})
+            except (Exception, SystemExit) as e:
+                # Publishing goes on without the image; the render can be redone with render_images.py.
+                pipe.log("images", "fail", reason=str(e), metrics={"ids": ids})
+
+        out = pipe.agent06_publish(subset, audit_map, sim_map, articles_csv=articles_csv, persist=False)
+        with self._lock:
+            self.published.extend(out["published"])
+            self.failed.extend(out["failed"])
+            if self.first_release_s is None and out["published"]:
+                self.first_release_s = round(time.time() - self.started, 2)
+                pipe.log("pipeline", "first_release", item_id=out["published"][0]["id"], metrics={"seconds_from_start": self.first_release_s})
+
+    # -- driver -----------------------------------------------------------------
+
+    def run(self) -> dict:
+        pipe = self.pipe
+        self.started = time.time()
+        pipe.log("pipeline", "start", metrics={"test_mode": pipe.test_mode, "scheduler": "stream"})
+
+        self.themes = pipe.agent01_generate_themes()
+        for t in self.themes:
+            self.gen_q.put((t, 1, ""))
+
+        self._gen_threads = [threading.Thread(target=self._generate_worker, daemon=True) for _ in range(self.generate_workers)]
+        threads = list(self._gen_threads)
+        threads.append(threading.Thread(target=self._gate, daemon=True))
+        threads.append(threading.Thread(target=self._release_worker, daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self.errors:
+            pipe.log("pipeline", "fail", reason="; ".join(self.errors))
+            raise RuntimeError("; ".join(self.errors))
+
+        # Batch artifacts, same files as the barrier run, in theme order.
+        order = [t["id"] for t in self.themes if t["id"] in self.gated]
+        articles = [self.gated[i] for i in order]
+        write_csv(pipe.base / "outputs/articles" / f"{pipe.batch_id}_articles.csv", articles, ARTICLE_COLUMNS)
+        write_csv(pipe.batch_dir / "articles_final.csv", articles, ARTICLE_COLUMNS)
+        audit = {"batch_id": pipe.batch_id, "threshold": pipe.threshold, "items": [self.audit_map[i] for i in order]}
+        write_json(pipe.base / "outputs/audits" / f"{pipe.batch_id}_seo_audit.json", audit)
+        write_json(pipe.batch_dir / "seo_audit.json", audit)
+        similarity = {
+            "batch_id": pipe.batch_id,
+            "policy": {"risk_threshold": 40, "rewrite_threshold": 60},
+            "items": [self.sim_map[i] for i in order],
+        }
+        write_json(pipe.base / "outputs/similarity" / f"{pipe.batch_id}_similarity.json", similarity)
+        write_json(pipe.batch_dir / "similarity_report.json", similarity)
+        rank = {i: n for n, i in enumerate(order)}
+        image_rows = sorted(self.image_rows, key=lambda r: rank.get(r["id"], 0))
+        write_csv(pipe.base / "outputs/image-prompts" / f"{pipe.batch_id}_image_prompts.csv", image_rows, IMAGE_PROMPT_COLUMNS)
+        write_csv(pipe.batch_dir / "image_prompts.csv", image_rows, IMAGE_PROMPT_COLUMNS)
+        publish_results = {"batch_id": pipe.batch_id, "published": self.published, "failed": self.failed}
+        write_json(pipe.base / "outputs/published" / f"{pipe.batch_id}_publish_results.json", publish_results)
+        write_json(pipe.batch_dir / "publish_results.json", publish_results)
+
+        approved = {i: self.approved[i] for i in order if i in self.approved}
+        pipe.update_history(approved, self.audit_map, self.sim_map)
+
+        summary = {
+            "batch_id": pipe.batch_id,
+            "items_total": len(order),
+            "approved": len(approved),
+            "rejected": len(order) - len(approved),
+            "rewrites": sum(self.rewrites.values()),
+            "test_mode": pipe.test_mode,
+            "scheduler": "stream",
+            "first_release_seconds": self.first_release_s,
+            "elapsed_seconds": round(time.time() - self.started, 2),
+            "publish_results": publish_results,
+        }
+        write_json(pipe.batch_dir / "summary.json", summary)
+        pipe.log("pipeline", "success", metrics=summary)
+        return summary
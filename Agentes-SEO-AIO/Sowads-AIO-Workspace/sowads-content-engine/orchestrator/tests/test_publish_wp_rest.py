@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from publish_delta import HASH_META_KEY, IMAGE_HASH_META_KEY  # noqa: E402
+from publish_wp_rest import RemotePostMap, WordPressRestClient, WordPressRestError, publish_item  # noqa: E402
+
+
+class FakeWordPress:
+    """In-memory stand-in for the /wp-json/wp/v2 endpoints the REST publisher uses."""
+
+    def __init__(self):
+        self.posts = {}
+        self.media = {}
+        self.next_id = 1
+        self.hits = []
+        # (method, path regex, status, land): `land` applies the write before answering with `status`.
+        self.faults = []
+        self.media_delay = 0.0
+        self.lock = threading.Lock()
+
+    def add_post(self, slug, content_id="", content_hash="", featured_media=0):
+        with self.lock:
+            pid = self.next_id
+            self.next_id += 1
+            meta = {"sowads_content_id": content_id, HASH_META_KEY: content_hash}
+            self.posts[pid] = {"id": pid, "slug": slug, "meta": meta, "featured_media": featured_media}
+            return pid
+
+    def add_media(self, sha):
+        with self.lock:
+            mid = self.next_id
+            self.next_id += 1
+            self.media[mid] = {"id": mid, "meta": {IMAGE_HASH_META_KEY: sha}}
+            return mid
+
+    def _fault(self, method, path):
+        with self.lock:
+            for i, (m, pattern, status, land) in enumerate(self.faults):
+                if m == method and re.fullmatch(pattern, path):
+                    del self.faults[i]
+                    return status, land
+        return None, False
+
+    def handle(self, method, path, query, body):
+        self.hits.append((method, path))
+        status, land = self._fault(method, path)
+        if status and not land:
+            return status, {"code": "fault"}, {}
+        result = self._apply(method, path, query, body)
+        if status:
+            return status, {"code": "fault"}, {}
+        return result
+
+    def _apply(self, method, path, query, body):
+        q = {k: v[0] for k, v in query.items()}
+        if method == "GET" and path == "/wp/v2/posts":
+            rows = sorted(self.posts.values(), key=lambda p: p["id"])
+            if "slug" in q:
+                rows = [p for p in rows if p["slug"] == q["slug"]]
+            return self._page(rows, q)
+        if method == "GET" and path == "/wp/v2/media":
+            wanted = {int(x) for x in q.get("include", "").split(",") if x}
+            return self._page([m for mid, m in sorted(self.media.items()) if mid in wanted], q)
+        if method == "POST" and path == "/wp/v2/media":
+            if self.media_delay:
+                time.sleep(self.media_delay)
+            return 201, {"id": self.add_media(q.get(f"meta[{IMAGE_HASH_META_KEY}]", ""))}, {}
+        if method == "POST" and path == "/wp/v2/posts":
+            data = json.loads(body)
+            pid = self.add_post(data["slug"])
+            self._update(pid, data)
+            return 201, {"id": pid}, {}
+        m = re.fullmatch(r"/wp/v2/posts/(\d+)", path)
+        if method == "POST" and m and int(m.group(1)) in self.posts:
+            self._update(int(m.group(1)), json.loads(body))
+            return 200, {"id": int(m.group(1))}, {}
+        return 404, {"code": "rest_no_route"}, {}
+
+    def _update(self, pid, data):
+        with self.lock:
+            post = self.posts[pid]
+            post["meta"].update(data.get("meta") or {})
+            if "featured_media" in data:
+                post["featured_media"] = int(data["featured_media"])
+
+    @staticmethod
+    def _page(rows, q):
+        per_page = int(q.get("per_page", 10))
+        page = int(q.get("page", 1))
+        pages = max(1, -(-len(rows) // per_page))
+        chunk = rows[(page - 1) * per_page : page * per_page]
+        return 200, chunk, {"X-WP-TotalPages": str(pages), "X-WP-Total": str(len(rows))}
+
+
+def serve(wp):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _do(self):
+            parts = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0") or 0))
+            path = parts.path[len("/wp-json") :]
+            status, payload, headers = wp.handle(self.command, path, parse_qs(parts.query), body)
+            raw = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        do_GET = _do
+        do_POST = _do
+
+        def log_message(self, format, *args):  # noqa: A002
+            return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class WordPressRestTest(unittest.TestCase):
+    def setUp(self):
+        # Worker threads keep their keep-alive connection until they are collected.
+        warnings.simplefilter("ignore", ResourceWarning)
+        self.wp = FakeWordPress()
+        self.server = serve(self.wp)
+        self.client = WordPressRestClient(f"http://127.0.0.1:{self.server.server_port}", "u", "p", timeout=10, backoff_seconds=0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.job_dir = Path(self.tmp.name)
+        (self.job_dir / "content").mkdir()
+        (self.job_dir / "images").mkdir()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def item(self, n, image=b"", sha="", with_image=True):
+        (self.job_dir / f"content/{n}.html").write_text(f"<p>{n}</p>", encoding="utf-8")
+        item = {
+            "id": f"SOWADS-{n}",
+            "slug": f"post-{n}",
+            "title": f"Post {n}",
+            "content_rel": f"content/{n}.html",
+            "image_rel": f"images/{n}.png" if with_image else "",
+            "image_sha256": sha,
+            "content_hash": f"hash-{n}",
+            "status": "draft",
+        }
+        if image:
+            (self.job_dir / item["image_rel"]).write_bytes(image)
+        return item
+
+    def test_retries_retryable_statuses(self):
+        client = WordPressRestClient(f"http://127.0.0.1:{self.server.server_port}", "u", "p", attempts=5, backoff_seconds=0)
+        for status in (503, 429, 408, 425):
+            self.wp.faults.append(("GET", "/wp/v2/posts", status, False))
+        data, _ = client.request("GET", "/wp/v2/posts")
+        self.assertEqual(data, [])
+        self.assertEqual(len(self.wp.hits), 5)
+
+    def test_does_not_retry_client_errors(self):
+        self.wp.faults.append(("GET", "/wp/v2/posts", 400, False))
+        with self.assertRaises(WordPressRestError):
+            self.client.request("GET", "/wp/v2/posts")
+        self.assertEqual(len(self.wp.hits), 1)
+
+    def test_create_that_landed_is_not_duplicated(self):
+        # The create is applied but answered with a 502: the retry must find it by slug.
+        self.wp.faults.append(("POST", "/wp/v2/posts", 502, True))
+        remote_map = RemotePostMap(self.client)
+        row = publish_item(self.client, remote_map, self.job_dir, self.item(1, with_image=False))
+        self.assertEqual(row["error"], "")
+        self.assertEqual(row["action"], "updated_by_slug")
+        self.assertEqual(len(self.wp.posts), 1)
+        self.assertEqual(self.wp.posts[row["wp_post_id"]]["meta"][HASH_META_KEY], "hash-1")
+
+    def test_remote_map_reads_every_page(self):
+        mids = [self.wp.add_media(f"sha-{i}") for i in range(150)]
+        for i in range(250):
+            self.wp.add_post(f"post-{i}", content_id=f"SOWADS-{i}", content_hash=f"h{i}", featured_media=mids[i % 150])
+        remote_map = RemotePostMap(self.client)
+        self.assertEqual(len(remote_map.by_content_id), 250)
+        self.assertEqual(remote_map.content_hashes["SOWADS-249"], "h249")
+        self.assertEqual(len(remote_map.attachment_by_sha256), 150)
+
+    def test_shared_image_is_uploaded_once(self):
+        self.wp.media_delay = 0.2
+        remote_map = RemotePostMap(self.client)
+        items = [self.item(n, image=b"same", sha="sha-same") for n in range(6)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            rows = list(executor.map(lambda it: publish_item(self.client, remote_map, self.job_dir, it), items))
+        uploads = [h for h in self.wp.hits if h == ("POST", "/wp/v2/media")]
+        self.assertEqual(len(uploads), 1)
+        self.assertEqual({r["wp_media_id"] for r in rows}, set(self.wp.media))
+        self.assertTrue(all(p["featured_media"] == rows[0]["wp_media_id"] for p in self.wp.posts.values()))
+
+    def test_failed_upload_hands_the_image_to_a_waiter(self):
+        self.wp.media_delay = 0.2
+        self.wp.faults.append(("POST", "/wp/v2/media", 400, False))
+        remote_map = RemotePostMap(self.client)
+        items = [self.item(n, image=b"same", sha="sha-same") for n in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            rows = list(executor.map(lambda it: publish_item(self.client, remote_map, self.job_dir, it), items))
+        self.assertEqual(len(self.wp.media), 1)
+        self.assertEqual(sorted(bool(r["wp_media_id"]) for r in rows), [False, True, True, True])
+        failed = [r for r in rows if not r["wp_media_id"]][0]
+        self.assertEqual(self.wp.posts[failed["wp_post_id"]]["meta"][HASH_META_KEY], "")
+
+    def test_hash_is_written_only_after_the_image(self):
+        remote_map = RemotePostMap(self.client)
+        ok = publish_item(self.client, remote_map, self.job_dir, self.item(1, image=b"a", sha="sha-a"))
+        missing = publish_item(self.client, remote_map, self.job_dir, self.item(2, sha="sha-b"))
+        self.assertEqual(self.wp.posts[ok["wp_post_id"]]["meta"][HASH_META_KEY], "hash-1")
+        self.assertEqual(self.wp.posts[ok["wp_post_id"]]["featured_media"], ok["wp_media_id"])
+        self.assertEqual(missing["wp_media_id"], 0)
+        self.assertEqual(self.wp.posts[missing["wp_post_id"]]["meta"].get(HASH_META_KEY, ""), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ssh_session import SshSession  # noqa: E402
+
+
+# Stand-in for OpenSSH, installed as both `ssh` and `scp`. The "remote" host is this
+# machine; the ControlMaster socket is a plain file at ControlPath. Every call appends
+# "<prog> <mode>" to $FAKE_SSH_LOG so tests can see which path was taken.
+FAKE = r'''#!PYTHON
+import getpass
+import os
+import shutil
+import subprocess
+import sys
+
+prog = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+opts, op, rest = {}, "", []
+i = 0
+while i < len(args):
+    a = args[i]
+    if a == "-o":
+        k, _, v = args[i + 1].partition("=")
+        opts[k] = v
+        i += 2
+    elif a in ("-p", "-P"):
+        i += 2
+    elif a == "-O":
+        op = args[i + 1]
+        i += 2
+    elif a == "-r":
+        i += 1
+    else:
+        rest = args[i:]
+        break
+socket = opts.get("ControlPath", "")
+
+
+def log(mode):
+    with open(os.environ["FAKE_SSH_LOG"], "a") as f:
+        f.write(f"{prog} {mode}\n")
+
+
+def password():
+    if getpass.getpass("password: ") != os.environ["FAKE_SSH_PASSWORD"]:
+        sys.stderr.write("Permission denied\n")
+        sys.exit(255)
+
+
+if op == "check":
+    sys.exit(0 if os.path.exists(socket) else 255)
+if op == "exit":
+    if os.path.exists(socket):
+        os.unlink(socket)
+    sys.exit(0)
+if opts.get("ControlMaster") == "yes":
+    password()
+    log("master")
+    if os.environ.get("FAKE_SSH_NO_MASTER"):
+        sys.exit(255)
+    open(socket, "w").close()
+    sys.exit(0)
+if opts.get("ControlMaster") == "no":
+    if not os.path.exists(socket):
+        sys.stderr.write("Control socket connect: No such file or directory\n")
+        sys.exit(255)
+    log("mux")
+else:
+    password()
+    log("password")
+if prog == "scp":
+    src, dest = rest[0], rest[1].split(":", 1)[1]
+    if os.path.isdir(src):
+        shutil.copytree(src, os.path.join(dest, os.path.basename(src)), dirs_exist_ok=True)
+    else:
+        shutil.copy(src, dest)
+    sys.exit(0)
+sys.exit(subprocess.run(["sh", "-c", rest[1]]).returncode)
+'''
+
+
+@unittest.skipUnless(importlib.util.find_spec("pexpect"), "pexpect not installed")
+class SshSessionFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        bin_dir = root / "bin"
+        bin_dir.mkdir()
+        for prog in ("ssh", "scp"):
+            path = bin_dir / prog
+            path.write_text(FAKE.replace("PYTHON", sys.executable), encoding="utf-8")
+            path.chmod(0o755)
+        self.log = root / "calls.log"
+        self.remote = root / "remote"
+        self.remote.mkdir()
+        env = {
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "FAKE_SSH_LOG": str(self.log),
+            "FAKE_SSH_PASSWORD": "s3cret",
+            "WP_SSH_MULTIPLEX": "true",
+        }
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def calls(self):
+        return self.log.read_text().splitlines() if self.log.exists() else []
+
+    def session(self):
+        return SshSession("wp.example", 22, "deploy", "s3cret")
+
+    def kill_master(self, ssh):
+        os.unlink(ssh.control_path)
+
+    def test_multiplexed_calls_reuse_the_master(self):
+        with self.session() as ssh:
+            self.assertTrue(ssh.multiplexed)
+            self.assertEqual(ssh.run("echo hi").strip(), "hi")
+            ssh.run("true")
+        self.assertEqual(self.calls(), ["ssh master", "ssh mux", "ssh mux"])
+
+    def test_open_falls_back_when_master_fails(self):
+        with mock.patch.dict(os.environ, {"FAKE_SSH_NO_MASTER": "1"}):
+            ssh = self.session().open()
+        self.assertFalse(ssh.multiplexed)
+        self.assertIsNone(ssh.control_dir)
+        self.assertIn("hi", ssh.run("echo hi"))
+        self.assertEqual(self.calls(), ["ssh master", "ssh password"])
+
+    def test_master_dying_mid_job_drops_to_password(self):
+        with self.session() as ssh:
+            ssh.run("true")
+            control_dir = ssh.control_dir
+            self.kill_master(ssh)
+            self.assertIn("after", ssh.run("echo after"))
+            self.assertFalse(ssh.multiplexed)
+            self.assertFalse(os.path.exists(control_dir))
+            ssh.upload(Path(self.tmp.name) / "calls.log", str(self.remote))
+        self.assertEqual(self.calls()[-2:], ["ssh password", "scp password"])
+        self.assertTrue((self.remote / "calls.log").exists())
+
+    def test_run_with_stdin_switches_to_copy_and_redirect(self):
+        payload = Path(self.tmp.name) / "payload.txt"
+        payload.write_text("line 1\nline 2\n", encoding="utf-8")
+        out = self.remote / "out.txt"
+        remote_tmp = self.remote / "payload.tmp"
+        with self.session() as ssh:
+            ssh.run_with_stdin(f"cat > {out}", payload, str(remote_tmp))
+            self.assertEqual(out.read_text(), "line 1\nline 2\n")
+            self.assertEqual(self.calls()[-1], "ssh mux")
+            out.unlink()
+            self.kill_master(ssh)
+            ssh.run_with_stdin(f"cat > {out}", payload, str(remote_tmp))
+        self.assertEqual(out.read_text(), "line 1\nline 2\n")
+        self.assertFalse(remote_tmp.exists())
+        self.assertEqual(self.calls()[-2:], ["scp password", "ssh password"])
+
+    def test_workers_share_one_degrade(self):
+        with self.session() as ssh:
+            self.kill_master(ssh)
+            errors = []
+
+            def work(n):
+                try:
+                    if f"w{n}" not in ssh.run(f"echo w{n}"):
+                        errors.append(f"w{n}: wrong output")
+                except Exception as e:
+                    errors.append(f"w{n}: {e}")
+
+            threads = [threading.Thread(target=work, args=(n,)) for n in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=60)
+            self.assertEqual(errors, [])
+            self.assertFalse(ssh.multiplexed)
+            self.assertIsNone(ssh.control_dir)
+        self.assertEqual(self.calls().count("ssh password"), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
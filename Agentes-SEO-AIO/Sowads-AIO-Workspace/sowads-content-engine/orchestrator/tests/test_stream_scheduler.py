@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from run_pipeline import Pipeline, RateBudget  # noqa: E402
+from stream_scheduler import StreamingRun  # noqa: E402
+
+
+class StreamingRunGenerationFailureTest(unittest.TestCase):
+    def test_run_ends_when_article_fallback_raises(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            (base / "system").mkdir()
+            (base / "system/system.md").write_text("", encoding="utf-8")
+            (base / "system/user.md").write_text("", encoding="utf-8")
+            pipe = Pipeline(base, {"test_mode": True, "quantidade_temas": 3, "batch_topic": "stream-test"})
+
+            def boom(*args, **kwargs):
+                raise RuntimeError("forced failure")
+
+            pipe._generate_article = boom
+            pipe._article_fallback = boom
+            run = StreamingRun(pipe)
+            result = {}
+            t = threading.Thread(target=lambda: result.update(run.run()), daemon=True)
+            t.start()
+            t.join(timeout=60)
+
+            self.assertFalse(t.is_alive(), "StreamingRun hung after a generation failure")
+            self.assertEqual(result["items_total"], 0)
+            self.assertEqual(len(run.failed), 3)
+            self.assertTrue(all(f["error"].startswith("stream_generate_failed") for f in run.failed))
+
+
+class StreamingRunRateBudgetTest(unittest.TestCase):
+    def pipeline(self, tmp, **cfg):
+        base = Path(tmp)
+        (base / "system").mkdir()
+        (base / "system/system.md").write_text("", encoding="utf-8")
+        (base / "system/user.md").write_text("", encoding="utf-8")
+        return Pipeline(base, {"test_mode": True, "batch_topic": "stream-test", **cfg})
+
+    def test_workers_share_a_budget_outside_the_daemon(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pipe = self.pipeline(tmp, stream_gemini_concurrency=2)
+            self.assertIsNone(pipe.gemini.rate_limiter)
+            StreamingRun(pipe)
+            budget = pipe.gemini.rate_limiter
+            self.assertIsInstance(budget, RateBudget)
+            self.assertTrue(budget._slots.acquire(blocking=False))
+            self.assertTrue(budget._slots.acquire(blocking=False))
+            self.assertFalse(budget._slots.acquire(blocking=False))
+
+    def test_keeps_the_daemon_budget(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pipe = self.pipeline(tmp)
+            shared = RateBudget(min_interval=0.0, max_inflight=4)
+            pipe.gemini.rate_limiter = shared
+            StreamingRun(pipe)
+            self.assertIs(pipe.gemini.rate_limiter, shared)
+
+
+if __name__ == "__main__":
+    unittest.main()
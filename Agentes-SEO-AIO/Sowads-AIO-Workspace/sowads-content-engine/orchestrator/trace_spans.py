@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Events kept in memory before being appended to the trace file.
+FLUSH_EVENTS = 256
+
+# Tracer of the innermost open span on each thread; lets helpers without a Pipeline
+# (write_csv, GeminiClient, RateBudget) attach step spans to the current article/phase.
+_ACTIVE = threading.local()
+
+
+def trace_enabled(cfg: dict) -> bool:
+    if "trace" in cfg:
+        return str(cfg.get("trace")).strip().lower() in {"1", "true", "yes", "y"}
+    return os.getenv("PIPELINE_TRACE", "false").strip().lower() in {"1", "true", "yes", "y"}
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def end(self, **args) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "prev")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.prev = None
+
+    def __enter__(self) -> "Span":
+        self.tracer._begin(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end(**({"error": f"{exc_type.__name__}: {exc}"} if exc_type else {}))
+
+    def end(self, **args) -> None:
+        self.tracer._end(self, args)
+
+
+class Tracer:
+    """Batch → phase → article → step spans written as Chrome trace events.
+
+    The file is a JSON array of `B`/`E` events (one tid per thread), so it opens as a flame
+    chart in chrome://tracing, Perfetto or speedscope. A run that dies leaves the array
+    unclosed, which those viewers accept. Disabled tracers hand out a shared no-op span.
+    """
+
+    def __init__(self, path: Optional[Path] = None, process_name: str = ""):
+        self.path = path
+        self.enabled = path is not None
+        self.process_name = process_name
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._events: List[dict] = []
+        self._threads: Dict[int, str] = {}
+        self._opened = False
+        self._closed = False
+        self._pid = os.getpid()
+        # Wall-clock origin plus a monotonic offset: precise and comparable across processes.
+        self._t0_us = time.time() * 1e6
+        self._pc0 = time.perf_counter()
+
+    def span(self, name: str, cat: str = "step", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def start(self, name: str, cat: str = "step", **args):
+        """Open a span without a `with` block; close it with `.end()` (or by ending its parent)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        span = Span(self, name, cat, args)
+        self._begin(span)
+        return span
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _begin(self, span: Span) -> None:
+        self._stack().append(span)
+        span.prev = getattr(_ACTIVE, "tracer", None)
+        _ACTIVE.tracer = self
+        event = {"name": span.name, "cat": span.cat, "ph": "B"}
+        if span.args:
+            event["args"] = span.args
+        self._emit(event)
+
+    def _end(self, span: Span, args: dict) -> None:
+        stack = self._stack()
+        if span not in stack:
+            return
+        # Children still open (no `.end()` on an early exit) are closed with their parent.
+        while stack:
+            top = stack.pop()
+            event = {"name": top.name, "cat": top.cat, "ph": "E"}
+            if top is span and args:
+                event["args"] = args
+            self._emit(event)
+            _ACTIVE.tracer = top.prev
+            if top is span:
+                return
+
+    def _emit(self, event: dict) -> None:
+        event["ts"] = round(self._t0_us + (time.perf_counter() - self._pc0) * 1e6, 1)
+        event["pid"] = self._pid
+        tid = threading.get_ident()
+        event["tid"] = tid
+        with self._lock:
+            if self._closed:
+                return
+            if tid not in self._threads:
+                name = threading.current_thread().name
+                self._threads[tid] = name
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+            self._events.append(event)
+            if len(self._events) >= FLUSH_EVENTS:
+                self._flush_locked()
+
+    def _flush_locked(self, final: bool = False) -> None:
+        if not self._events and not final:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines: List[str] = []
+        if not self._opened:
+            self._opened = True
+            meta = {"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": self.process_name}}
+            lines.append("[\n" + json.dumps(meta, ensure_ascii=False))
+        lines.extend(json.dumps(e, ensure_ascii=False) for e in self._events)
+        self._events = []
+        with self.path.open("a", encoding="utf-8") as f:
+            if lines:
+                f.write((",\n" if not lines[0].startswith("[") else "") + ",\n".join(lines))
+            if final:
+                f.write("\n]\n")
+
+    def flush(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._closed:
+                self._flush_locked()
+
+    def close(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked(final=True)
+            self._closed = True
+
+
+def current_span(name: str, cat: str = "step", **args):
+    """Step span under whatever span is open on this thread; no-op when nothing is being traced."""
+    tracer = getattr(_ACTIVE, "tracer", None)
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, cat, args)
+
+
+def traced(cat: str = "phase", name: str = ""):
+    """Method decorator: wraps the call in a span on `self.tracer`."""
+
+    def deco(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(self, *a, **kw):
+            tracer = self.tracer
+            if not tracer.enabled:
+                return fn(self, *a, **kw)
+            with Span(tracer, span_name, cat, {}):
+                return fn(self, *a, **kw)
+
+        return wrapper
+
+    return deco
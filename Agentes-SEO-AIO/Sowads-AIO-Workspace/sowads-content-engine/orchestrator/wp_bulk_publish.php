@@ -0,0 +1,172 @@
+<?php
+/**
+ * Bulk publisher for publish_wp_cli.py --bulk.
+ *
+ * Usage (remote): wp eval-file wp_bulk_publish.php <job_dir>
+ *
+ * WordPress boots once; every item in <job_dir>/items.json is upserted with the
+ * same rules as the per-item shell script (match by sowads_content_id, then slug)
+ * and one line is printed per item:
+ *   RESULT|<id>|<post_id>|<media_id>|<action>
+ *   ERROR|<id>|<message>
+ */
+
+if ( ! defined( 'ABSPATH' ) ) {
+	exit( 1 );
+}
+
+$job_dir = isset( $args[0] ) ? rtrim( $args[0], '/' ) : '';
+$payload = json_decode( (string) @file_get_contents( $job_dir . '/items.json' ), true );
+if ( ! $job_dir || ! is_array( $payload ) || ! isset( $payload['items'] ) ) {
+	echo "FATAL|items.json not found or invalid\n";
+	exit( 1 );
+}
+
+require_once ABSPATH . 'wp-admin/includes/file.php';
+require_once ABSPATH . 'wp-admin/includes/media.php';
+require_once ABSPATH . 'wp-admin/includes/image.php';
+
+update_option( 'WPLANG', 'pt_BR' );
+wp_defer_term_counting( true );
+$seen_images = array();
+
+function sowads_find_post_id( $args ) {
+	$ids = get_posts(
+		array_merge(
+			array(
+				'post_type'        => 'post',
+				'post_status'      => 'any',
+				'fields'           => 'ids',
+				'numberposts'      => 1,
+				'suppress_filters' => true,
+			),
+			$args
+		)
+	);
+	return $ids ? (int) $ids[0] : 0;
+}
+
+function sowads_clean_line( $text ) {
+	return str_replace( array( "\r", "\n", '|' ), ' ', (string) $text );
+}
+
+foreach ( $payload['items'] as $item ) {
+	$item_id = (string) $item['id'];
+	try {
+		$content_file = $job_dir . '/' . $item['content_rel'];
+		$content      = @file_get_contents( $content_file );
+		if ( false === $content ) {
+			throw new Exception( 'content file missing: ' . $item['content_rel'] );
+		}
+
+		$meta_title = isset( $item['meta_title'] ) ? (string) $item['meta_title'] : '';
+		$meta_desc  = isset( $item['meta_description'] ) ? (string) $item['meta_description'] : '';
+		$postarr    = array(
+			'post_content' => $content,
+			'post_title'   => $item['title'],
+			'post_name'    => $item['slug'],
+			'post_status'  => isset( $item['status'] ) ? $item['status'] : 'publish',
+			'post_type'    => 'post',
+		);
+		if ( '' !== $meta_desc ) {
+			$postarr['post_excerpt'] = $meta_desc;
+		}
+
+		$by_id   = sowads_find_post_id(
+			array(
+				'meta_key'   => 'sowads_content_id',
+				'meta_value' => $item_id,
+			)
+		);
+		$by_slug = $by_id ? 0 : sowads_find_post_id( array( 'name' => $item['slug'] ) );
+		if ( $by_id ) {
+			$pid    = $by_id;
+			$action = 'updated_by_id';
+		} elseif ( $by_slug ) {
+			$pid    = $by_slug;
+			$action = 'updated_by_slug';
+		} else {
+			$pid    = 0;
+			$action = 'created';
+		}
+
+		if ( $pid ) {
+			$postarr['ID'] = $pid;
+			$res           = wp_update_post( wp_slash( $postarr ), true );
+		} else {
+			$res = wp_insert_post( wp_slash( $postarr ), true );
+		}
+		if ( is_wp_error( $res ) ) {
+			throw new Exception( $res->get_error_message() );
+		}
+		$pid = (int) $res;
+
+		$meta = array(
+			'sowads_content_id'      => $item_id,
+			'sowads_content_version' => (string) ( isset( $item['version'] ) ? $item['version'] : 1 ),
+			'sowads_batch_id'        => isset( $item['batch_id'] ) ? (string) $item['batch_id'] : '',
+		);
+		if ( '' !== $meta_title ) {
+			$meta['_yoast_wpseo_title'] = $meta_title;
+			$meta['rank_math_title']    = $meta_title;
+		}
+		if ( '' !== $meta_desc ) {
+			$meta['_yoast_wpseo_metadesc']  = $meta_desc;
+			$meta['rank_math_description'] = $meta_desc;
+		}
+		foreach ( $meta as $key => $value ) {
+			update_post_meta( $pid, $key, wp_slash( $value ) );
+		}
+
+		$mid        = 0;
+		$img        = ! empty( $item['image_rel'] ) ? $job_dir . '/' . $item['image_rel'] : '';
+		$image_hash = isset( $item['image_sha256'] ) ? (string) $item['image_sha256'] : '';
+		$reuse_mid  = ! empty( $item['media_id'] ) ? (int) $item['media_id'] : 0;
+		if ( ! $reuse_mid && '' !== $image_hash && isset( $seen_images[ $image_hash ] ) ) {
+			$reuse_mid = $seen_images[ $image_hash ];
+		}
+		if ( $reuse_mid ) {
+			// Byte-identical image already in the library: no new attachment, no thumbnail regeneration.
+			$img = '';
+			$mid = $reuse_mid;
+			set_post_thumbnail( $pid, $mid );
+		} elseif ( $img && is_file( $img ) ) {
+			// media_handle_sideload moves the temp file, so import from a copy (same as `wp media import`).
+			$tmp = wp_tempnam( $img );
+			if ( $tmp && copy( $img, $tmp ) ) {
+				$file_array = array(
+					'name'     => basename( $img ),
+					'tmp_name' => $tmp,
+				);
+				$media      = media_handle_sideload( $file_array, $pid );
+				if ( is_wp_error( $media ) ) {
+					@unlink( $tmp );
+				} else {
+					$mid = (int) $media;
+					set_post_thumbnail( $pid, $mid );
+					update_post_meta( $mid, '_wp_attachment_image_alt', wp_slash( $item['title'] ) );
+					if ( '' !== $image_hash ) {
+						update_post_meta( $mid, 'sowads_image_sha256', $image_hash );
+						$seen_images[ $image_hash ] = $mid;
+					}
+				}
+			}
+		}
+
+		// Hash last and only when the image landed, so a failed import is retried on the next delta run.
+		if ( ! empty( $item['content_hash'] ) && ( ! $img || $mid > 0 ) ) {
+			update_post_meta( $pid, 'sowads_content_hash', wp_slash( (string) $item['content_hash'] ) );
+		}
+
+		echo 'RESULT|' . sowads_clean_line( $item_id ) . '|' . $pid . '|' . $mid . '|' . $action . "\n";
+	} catch ( Exception $e ) {
+		echo 'ERROR|' . sowads_clean_line( $item_id ) . '|' . sowads_clean_line( $e->getMessage() ) . "\n";
+	}
+	// Keep memory flat across hundreds of posts (in-process cache only, never the shared object cache).
+	if ( function_exists( 'WP_CLI\Utils\wp_clear_object_cache' ) ) {
+		WP_CLI\Utils\wp_clear_object_cache();
+	}
+	flush();
+}
+
+wp_defer_term_counting( false );
@@ -0,0 +1,49 @@
+<?php
+/**
+ * Plugin Name: Sowads REST meta
+ * Description: Exposes the meta keys written by publish_wp_rest.py to the WP REST API.
+ *
+ * Install as wp-content/mu-plugins/wp_sowads_rest_meta.php on the target site.
+ */
+
+add_action(
+	'init',
+	function () {
+		$keys = array(
+			'sowads_content_id',
+			'sowads_content_version',
+			'sowads_batch_id',
+			'sowads_content_hash',
+			'_yoast_wpseo_title',
+			'_yoast_wpseo_metadesc',
+			'rank_math_title',
+			'rank_math_description',
+		);
+		foreach ( $keys as $key ) {
+			register_post_meta(
+				'post',
+				$key,
+				array(
+					'type'          => 'string',
+					'single'        => true,
+					'show_in_rest'  => true,
+					'auth_callback' => function () {
+						return current_user_can( 'edit_posts' );
+					},
+				)
+			);
+		}
+		register_post_meta(
+			'attachment',
+			'sowads_image_sha256',
+			array(
+				'type'          => 'string',
+				'single'        => true,
+				'show_in_rest'  => true,
+				'auth_callback' => function () {
+					return current_user_can( 'upload_files' );
+				},
+			)
+		);
+	}
+);